@@ -1,7 +1,12 @@
+from datetime import date, timedelta
 from rest_framework import serializers
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from .models import User
 from devotee.models import DailyActivity, MonthlyActivity
+from devotee.pagination import InvalidCursor, after_cursor, cursor_for, decode_cursor, encode_cursor
 from devotee.serializers import DailyActivitySerializer, MonthlyActivitySerializer
+from devotee.streaks import streak_summary
 
 class AdminDailyActivitySerializer(serializers.ModelSerializer):
     """Admin serializer for daily activities - shows all fields"""
@@ -18,6 +23,18 @@ class AdminDailyActivitySerializer(serializers.ModelSerializer):
         """Get the day name from the date"""
         return obj.date.strftime("%A")
 
+def _count_for_user(model):
+    counts = model.objects.filter(user=OuterRef('pk')).order_by().values('user').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def with_activity_counts(queryset):
+    """Annotate users with their daily/monthly activity counts in the same query"""
+    return queryset.annotate(
+        daily_activities_count=_count_for_user(DailyActivity),
+        monthly_activities_count=_count_for_user(MonthlyActivity),
+    )
+
 class DevoteeListSerializer(serializers.ModelSerializer):
     """Serializer for listing devotees with basic info"""
     full_name = serializers.SerializerMethodField()
@@ -37,46 +54,124 @@ class DevoteeListSerializer(serializers.ModelSerializer):
         return f"{obj.first_name} {obj.last_name}"
     
     def get_total_daily_activities(self, obj):
+        if hasattr(obj, 'daily_activities_count'):
+            return obj.daily_activities_count
         return DailyActivity.objects.filter(user=obj).count()
     
     def get_total_monthly_activities(self, obj):
+        if hasattr(obj, 'monthly_activities_count'):
+            return obj.monthly_activities_count
         return MonthlyActivity.objects.filter(user=obj).count()
 
+# Devotee detail: days of daily activities and number of monthly activities shown per load
+DETAIL_DAYS = 60
+MAX_DETAIL_DAYS = 366
+DETAIL_MONTHS = 12
+MAX_DETAIL_MONTHS = 120
+
+# Same orderings as the admin filter-activities view, so its cursors work in both
+DAILY_DETAIL_ORDERING = ('-date', '-id')
+MONTHLY_DETAIL_ORDERING = ('-year', '-month', '-id')
+
+
+class DetailWindow:
+    """
+    The activities a devotee detail response shows: daily activities of the
+    `days` days before `cursor` (up to today without one) and `months`
+    monthly activities after `monthly_cursor`. Raises InvalidCursor.
+    """
+
+    def __init__(self, days=DETAIL_DAYS, months=DETAIL_MONTHS, cursor=None, monthly_cursor=None, today=None):
+        if cursor:
+            try:
+                until = date.fromisoformat(decode_cursor(cursor, len(DAILY_DETAIL_ORDERING))[0])
+            except (TypeError, ValueError):
+                raise InvalidCursor("Invalid cursor.")
+        else:
+            until = (today or date.today()) + timedelta(days=1)
+        self.start = until - timedelta(days=days)
+        self.months = months
+
+        # One row past each window tells whether there is more. A devotee has
+        # at most one daily activity per date, so days + 1 rows always reach
+        # past the start of the window when anything older exists.
+        self.daily_queryset = DailyActivity.objects.filter(date__lt=until).select_related('week').order_by(*DAILY_DETAIL_ORDERING)[:days + 1]
+        monthly = MonthlyActivity.objects.order_by(*MONTHLY_DETAIL_ORDERING).prefetch_related('weeks')
+        if monthly_cursor:
+            monthly = after_cursor(monthly, MONTHLY_DETAIL_ORDERING, monthly_cursor)
+        self.monthly_queryset = monthly[:months + 1]
+
+    def prefetches(self):
+        """Prefetches loading the window for every devotee of a queryset in three queries"""
+        return [
+            Prefetch('dailyactivity_set', queryset=self.daily_queryset, to_attr='detail_daily_activities'),
+            Prefetch('monthlyactivity_set', queryset=self.monthly_queryset, to_attr='detail_monthly_activities'),
+        ]
+
+    def load(self, devotee):
+        if not hasattr(devotee, 'detail_daily_activities'):
+            prefetch_related_objects([devotee], *self.prefetches())
+
+    def daily(self, devotee):
+        return [activity for activity in devotee.detail_daily_activities if activity.date >= self.start]
+
+    def daily_next_cursor(self, devotee):
+        if any(activity.date < self.start for activity in devotee.detail_daily_activities):
+            # Everything before the start of this window
+            return encode_cursor([self.start, 0])
+        return None
+
+    def monthly(self, devotee):
+        return devotee.detail_monthly_activities[:self.months]
+
+    def monthly_next_cursor(self, devotee):
+        if len(devotee.detail_monthly_activities) > self.months:
+            return cursor_for(devotee.detail_monthly_activities[self.months - 1], MONTHLY_DETAIL_ORDERING)
+        return None
+
+
 class DevoteeDetailSerializer(serializers.ModelSerializer):
-    """Serializer for detailed devotee information"""
+    """
+    Serializer for detailed devotee information. Shows the activities of
+    context['window'] (a DetailWindow, the default one when absent);
+    prefetch window.prefetches() and 'streaks' on the devotee to avoid
+    extra queries.
+    """
     full_name = serializers.SerializerMethodField()
     daily_activities = serializers.SerializerMethodField()
     monthly_activities = serializers.SerializerMethodField()
+    daily_next_cursor = serializers.SerializerMethodField()
+    monthly_next_cursor = serializers.SerializerMethodField()
+    streaks = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = [
             'id', 'username', 'first_name', 'last_name', 'full_name',
             'email', 'is_active', 'is_user_verified', 'created_at', 'updated_at',
-            'daily_activities', 'monthly_activities'
+            'daily_activities', 'monthly_activities', 'daily_next_cursor', 'monthly_next_cursor', 'streaks'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
     
+    def _window(self, obj):
+        window = self.context.setdefault('window', DetailWindow())
+        window.load(obj)
+        return window
+    
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
     
     def get_daily_activities(self, obj):
-        try:
-            activities = DailyActivity.objects.filter(user=obj).order_by('-date')[:50]
-            if activities.exists():
-                return AdminDailyActivitySerializer(activities, many=True).data
-            return []
-        except Exception as e:
-            # Return empty list if there's any error
-            return []
+        return AdminDailyActivitySerializer(self._window(obj).daily(obj), many=True).data
     
     def get_monthly_activities(self, obj):
-        try:
-            activities = MonthlyActivity.objects.filter(user=obj).order_by('-year', '-month')
-            if activities.exists():
-                return MonthlyActivitySerializer(activities, many=True).data
-            return []
-        except Exception as e:
-            # Return empty list if there's any error
-            return []
-
+        return MonthlyActivitySerializer(self._window(obj).monthly(obj), many=True).data
+    
+    def get_daily_next_cursor(self, obj):
+        return self._window(obj).daily_next_cursor(obj)
+    
+    def get_monthly_next_cursor(self, obj):
+        return self._window(obj).monthly_next_cursor(obj)
+    
+    def get_streaks(self, obj):
+        return streak_summary(obj.pk, obj.streaks.all())
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from authentication.revocation import revocations
+
+
+class Command(BaseCommand):
+    help = "Delete revoked refresh tokens that have expired since. Run it periodically, e.g. hourly from cron."
+
+    def handle(self, *args, **options):
+        deleted = revocations.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired token(s)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from authentication.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the devotee search tokens from the users table."
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} devotee(s)."))
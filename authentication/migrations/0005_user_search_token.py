@@ -0,0 +1,86 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:29
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# A frozen copy of the tokenizer in authentication/search.py as of this
+# migration, so later changes there do not change what it writes. Later
+# tokenizer changes reindex with the rebuild_search_index command.
+SEARCH_FIELDS = {'first_name': 3, 'last_name': 3, 'username': 3, 'email': 1}
+WORD = 'w'
+TRIGRAM = 't'
+TOKEN_MAX_LENGTH = 64
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def build_tokens(user):
+    tokens = {}
+
+    def add(kind, token, weight):
+        token = token[:TOKEN_MAX_LENGTH]
+        tokens[(kind, token)] = max(weight, tokens.get((kind, token), 0))
+
+    for field, weight in SEARCH_FIELDS.items():
+        value = getattr(user, field) or ''
+        words = normalize(value).split()
+        for word in words:
+            add(WORD, word, weight)
+        if len(words) > 1:
+            add(WORD, ''.join(words), weight)
+        domain = normalize(value.partition('@')[2]).replace(' ', '') if field == 'email' else ''
+        if domain:
+            add(WORD, domain, weight)
+        for word in words:
+            for gram in {word[i:i + 3] for i in range(len(word) - 2)}:
+                add(TRIGRAM, gram, 1)
+    return tokens
+
+
+def index_existing_users(apps, schema_editor):
+    User = apps.get_model('authentication', 'User')
+    UserSearchToken = apps.get_model('authentication', 'UserSearchToken')
+    batch = []
+    for user in User.objects.filter(is_staff=False, is_superuser=False).iterator(chunk_size=1000):
+        batch.extend(
+            UserSearchToken(user_id=user.pk, kind=kind, token=token, weight=weight)
+            for (kind, token), weight in build_tokens(user).items()
+        )
+        if len(batch) >= 1000:
+            UserSearchToken.objects.bulk_create(batch)
+            batch = []
+    UserSearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_user_created_at_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('w', 'Word'), ('t', 'Trigram')], max_length=1)),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token'], name='search_token_kind_token_idx')],
+                'unique_together': {('user', 'kind', 'token')},
+            },
+        ),
+        migrations.RunPython(index_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    User = apps.get_model('authentication', 'User')
+    for user in User.objects.exclude(qr_token__isnull=True).exclude(qr_token='').only('pk', 'qr_token'):
+        user.qr_token_hash = hashlib.sha256(user.qr_token.encode()).hexdigest()
+        user.save(update_fields=['qr_token_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_user_search_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='qr_token_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='qr_token',
+        ),
+    ]
@@ -29,8 +29,8 @@ class User(AbstractUser,PermissionsMixin):
     date_of_birth = models.DateField(blank=True, null=True)
     initiation_date = models.DateField(blank=True, null=True)
     
-    # QR Code fields
-    qr_token = models.CharField(max_length=64, unique=True, blank=True, null=True)
+    # QR Code fields (only the SHA-256 of the token is stored)
+    qr_token_hash = models.CharField(max_length=64, unique=True, blank=True, null=True)
     qr_token_created_at = models.DateTimeField(blank=True, null=True)
 
     is_active = models.BooleanField(default=False)
@@ -44,14 +44,85 @@ class User(AbstractUser,PermissionsMixin):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination of the admin devotee list
+            models.Index(fields=['created_at', 'id'], name='user_created_at_id_idx'),
+        ]
+
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} {self.username} "
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # A user built from token claims or the user cache (see token_auth.py)
+        # loads every cached field on the first deferred read, not one per query
+        cached = getattr(self, '_cached_values', None)
+        if fields is not None and from_queryset is None and cached is not None:
+            from .token_auth import load_cached_fields
+            loaded = load_cached_fields(self, fields)
+            # Not cached and not all cacheable: one query loads every deferred field
+            fields = self.get_deferred_fields() if loaded is None else set(fields) - loaded
+            if not fields:
+                return
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None:
+            # Every loaded field now comes from the row
+            self.__dict__.pop('_cached_values', None)
+        elif cached is not None:
+            cached.update({name: getattr(self, name) for name in fields})
+
+    def save(self, *args, **kwargs):
+        # Values from token claims or the user cache may be older than the row,
+        # so only the fields set since are written
+        cached = getattr(self, '_cached_values', None)
+        if cached is not None and not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            changed = [
+                field.attname for field in self._meta.concrete_fields
+                if field.attname not in deferred
+                and (field.attname not in cached or getattr(self, field.attname) != cached[field.attname])
+            ]
+            kwargs['update_fields'] = [*changed, 'updated_at'] if changed else []
+            for name in changed:
+                cached[name] = getattr(self, name)
+        super().save(*args, **kwargs)
+
+
+class UserSearchToken(models.Model):
+    """
+    Normalized search tokens of a devotee. Word tokens serve ranked prefix
+    matches, trigram tokens serve matches in the middle of a name or number.
+    """
+    WORD = 'w'
+    TRIGRAM = 't'
+    KIND_CHOICES = [
+        (WORD, 'Word'),
+        (TRIGRAM, 'Trigram'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('user', 'kind', 'token')
+        indexes = [
+            models.Index(fields=['kind', 'token'], name='search_token_kind_token_idx'),
+        ]
 
+    def __str__(self):
+        return f"{self.user_id} {self.kind}:{self.token}"
 
 
+class RevokedToken(models.Model):
+    """
+    A refresh token revoked by logout or rotation, kept until it would have
+    expired anyway (see revocation.py). The id orders rows for syncing.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
 
-
-
-
+    def __str__(self):
+        return f"{self.jti} until {self.expires_at}"
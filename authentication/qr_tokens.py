@@ -0,0 +1,130 @@
+"""
+QR token resolution for the public quick-entry endpoints.
+
+Only the SHA-256 of a token is stored. Resolved tokens are kept in a bounded
+in-process LRU cache with a TTL, so repeated scans of the same QR code do not
+query the users table. Saving a user drops its entry immediately; other
+worker processes see the change once their entry expires.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import User
+
+
+QR_TOKEN_MAX_AGE = timedelta(days=365)
+
+# User fields kept per cached token, enough for the quick-entry views
+CACHED_USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'is_active', 'qr_token_created_at')
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def is_expired(created_at):
+    return created_at is not None and timezone.now() - created_at > QR_TOKEN_MAX_AGE
+
+
+class TokenCache:
+    """Thread-safe LRU mapping of token hash -> user values, with a TTL per entry"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._hash_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token_hash):
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                self._drop(token_hash)
+                return None
+            self._entries.move_to_end(token_hash)
+            return values
+
+    def set(self, token_hash, values):
+        with self._lock:
+            self._drop_user(values['id'])
+            self._entries[token_hash] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(token_hash)
+            self._hash_by_user[values['id']] = token_hash
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._drop_user(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hash_by_user.clear()
+
+    def _drop(self, token_hash):
+        entry = self._entries.pop(token_hash, None)
+        if entry is not None:
+            self._hash_by_user.pop(entry[1]['id'], None)
+
+    def _drop_user(self, user_id):
+        token_hash = self._hash_by_user.pop(user_id, None)
+        if token_hash is not None:
+            self._entries.pop(token_hash, None)
+
+
+_cache_settings = getattr(settings, 'QR_TOKEN_CACHE', {})
+token_cache = TokenCache(
+    max_entries=_cache_settings.get('MAX_ENTRIES', 10000),
+    ttl=_cache_settings.get('TTL_SECONDS', 60),
+)
+
+
+def _user_from_values(values):
+    # Only the cached fields are loaded, anything else is fetched lazily on access.
+    # from_db expects the values in model field order.
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(User.objects.db, field_names, [values[name] for name in field_names])
+
+
+def _active_user(values):
+    if not values['is_active']:
+        return None
+    return _user_from_values(values)
+
+
+def resolve_token(token):
+    """
+    The active user owning a QR token, or None. The returned instance only
+    has CACHED_USER_FIELDS loaded.
+    """
+    token_hash = hash_token(token)
+    values = token_cache.get(token_hash)
+    if values is None:
+        values = User.objects.filter(qr_token_hash=token_hash).values(*CACHED_USER_FIELDS).first()
+        if values is None:
+            return None
+        token_cache.set(token_hash, values)
+    return _active_user(values)
+
+
+async def aresolve_token(token):
+    """resolve_token() for async views, a cache hit does not leave the event loop"""
+    token_hash = hash_token(token)
+    values = token_cache.get(token_hash)
+    if values is None:
+        values = await User.objects.filter(qr_token_hash=token_hash).values(*CACHED_USER_FIELDS).afirst()
+        if values is None:
+            return None
+        token_cache.set(token_hash, values)
+    return _active_user(values)
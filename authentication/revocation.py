@@ -0,0 +1,215 @@
+"""
+Revocation of refresh tokens, keyed by their jti.
+
+Logging out revokes the refresh token, and refreshing rotates it: the old
+token is revoked as the new pair is issued, so each refresh token can be
+used once. A RevokedToken row is kept until the token would have expired
+anyway; the purge_revoked_tokens command, run periodically (e.g. hourly
+from cron), deletes the older rows, so the table only holds tokens still
+worth refusing. Access tokens are not revoked and stay valid for their
+short lifetime.
+
+Every worker process keeps a Bloom filter of the revoked jtis in front of
+the table, so checking a token that was never revoked, the common case,
+needs no query. The filter catches up with the rows added by other
+processes at most every SYNC_SECONDS, off the lock that checks take. A jti
+found in the filter is confirmed against the table, as Bloom filters have
+false positives. Rotation does not rely on the filter being in sync:
+revoking the old jti inserts into a unique column, so of two refreshes
+with the same token only one succeeds.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from devotee.sqlite import retry_on_locked
+
+from .models import RevokedToken
+from .token_auth import ClaimsRefreshToken, user_from_values, user_values
+
+
+class BloomFilter:
+    """Bloom filter of strings, sized for `capacity` items at `error_rate` false positives"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: the k positions come from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationStore:
+    """
+    Revoked jtis in the RevokedToken table, behind a per-process Bloom
+    filter. Without `use_filter` every check queries the table, as the
+    simplejwt blacklist app does.
+    """
+
+    def __init__(self, capacity, error_rate, sync_seconds, use_filter=True):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds
+        self.use_filter = use_filter
+        self._counters = Counter()
+        self._filter = None
+        self._last_id = 0
+        self._next_sync = 0
+        self._syncing = False
+        # jtis revoked here while a rebuild reads the table, added to the new filter
+        self._revoked_meanwhile = []
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """
+        Build the filter, or add the rows revoked since the last sync, at most
+        every sync_seconds. One thread at a time does it, and the queries and
+        hashing run outside the lock: meanwhile other threads check against
+        the current filter, or the table while there is none yet.
+        """
+        with self._lock:
+            bloom = self._filter
+            rebuild = bloom is None or bloom.count > bloom.capacity
+            if self._syncing or (not rebuild and time.monotonic() < self._next_sync):
+                return
+            self._syncing = True
+            last_id = self._last_id
+            self._revoked_meanwhile = []
+        try:
+            if rebuild:
+                rows = list(RevokedToken.objects.values_list('pk', 'jti'))
+                # Room for twice the current rows, so the filter is not rebuilt at once
+                bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+            else:
+                rows = list(RevokedToken.objects.filter(pk__gt=last_id).values_list('pk', 'jti'))
+            for _, jti in rows:
+                bloom.add(jti)
+            with self._lock:
+                if rebuild:
+                    for jti in self._revoked_meanwhile:
+                        bloom.add(jti)
+                    self._filter = bloom
+                self._last_id = max((pk for pk, _ in rows), default=last_id)
+                self._next_sync = time.monotonic() + self.sync_seconds
+        finally:
+            with self._lock:
+                self._syncing = False
+                self._revoked_meanwhile = []
+
+    def is_revoked(self, jti):
+        if self.use_filter:
+            self._refresh()
+        with self._lock:
+            self._counters['checks'] += 1
+            if self.use_filter and self._filter is not None:
+                if jti not in self._filter:
+                    return False
+                self._counters['filter_hits'] += 1
+            self._counters['lookups'] += 1
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """Revoke a jti until `expires_at`. False if it already was."""
+        try:
+            retry_on_locked(RevokedToken.objects.create)(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            if self._syncing:
+                self._revoked_meanwhile.append(jti)
+        return True
+
+    def purge_expired(self):
+        """
+        Delete the rows of tokens past their expiry, returns how many. Run by
+        the purge_revoked_tokens command, never on a request. Filters still
+        holding the purged jtis only send a few more checks to the table,
+        until they are rebuilt.
+        """
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+            self._next_sync = 0
+            self._counters.clear()
+
+    def snapshot(self):
+        """Checks made by this process, how many the filter did not clear and how many queried the table"""
+        with self._lock:
+            return {name: self._counters[name] for name in ('checks', 'filter_hits', 'lookups')}
+
+
+_store_settings = getattr(settings, 'TOKEN_REVOCATION', {})
+revocations = RevocationStore(
+    capacity=_store_settings.get('FILTER_CAPACITY', 100000),
+    error_rate=_store_settings.get('FILTER_ERROR_RATE', 0.001),
+    sync_seconds=_store_settings.get('SYNC_SECONDS', 1),
+)
+
+
+def _expiry(token):
+    return datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+
+
+def revoke_refresh_token(raw_token):
+    """Revoke a refresh token. Raises TokenError if it is invalid or expired."""
+    token = ClaimsRefreshToken(raw_token)
+    revocations.revoke(token[api_settings.JTI_CLAIM], _expiry(token))
+
+
+def refresh_tokens(raw_token):
+    """
+    {'access': ...} for a refresh token, with a new 'refresh' token that
+    replaces it when ROTATE_REFRESH_TOKENS is set. Raises TokenError if the
+    token is invalid, expired, revoked or already rotated, or its user is
+    gone or inactive.
+    """
+    token = ClaimsRefreshToken(raw_token)
+    jti = token[api_settings.JTI_CLAIM]
+    if revocations.is_revoked(jti):
+        raise TokenError(_("Token is blacklisted"))
+    try:
+        values = user_values(int(token[api_settings.USER_ID_CLAIM]))
+    except (KeyError, TypeError, ValueError):
+        raise TokenError(_("Token contained no recognizable user identification"))
+    if values is None or not values['is_active']:
+        raise TokenError(_("User is inactive"))
+
+    # A new pair carries the user's current claims, not those of the old token
+    fresh = ClaimsRefreshToken.for_user(user_from_values(values))
+    tokens = {'access': str(fresh.access_token)}
+    if api_settings.ROTATE_REFRESH_TOKENS:
+        if not revocations.revoke(jti, _expiry(token)):
+            raise TokenError(_("Token is blacklisted"))
+        tokens['refresh'] = str(fresh)
+    return tokens
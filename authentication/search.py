@@ -0,0 +1,190 @@
+"""
+Devotee search index.
+
+Every devotee gets a handful of normalized UserSearchToken rows. Queries are
+answered with index range scans on (kind, token) instead of LIKE over the
+users table, which works the same on SQLite and on a server database.
+A query word holding an "@" is looked up as one term, against the whole
+address or its domain. Unlike the LIKE search it replaced, a term matches
+inside a word only from 3 characters on (a shorter term still
+prefix-matches).
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import User, UserSearchToken
+
+
+# Field -> weight of its tokens in the ranking
+SEARCH_FIELDS = {
+    'first_name': 3,
+    'last_name': 3,
+    'username': 3,  # mobile number
+    'email': 1,
+}
+
+# Score of a term per token weight, by how it matched
+EXACT_SCORE = 4
+PREFIX_SCORE = 2
+INFIX_SCORE = 1
+
+# Upper bound on token rows read per query term
+MAX_CANDIDATES = 2000
+
+TOKEN_MAX_LENGTH = UserSearchToken._meta.get_field('token').max_length
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    """Lowercase, strip accents and reduce to space separated alphanumeric words"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def is_indexed(user):
+    return not (user.is_staff or user.is_superuser)
+
+
+def query_terms(query):
+    """
+    The terms of a query. A word with an "@" stays one term, so a pasted
+    address matches that address rather than each of its parts anywhere.
+    """
+    terms = []
+    for word in query.split():
+        if '@' in word:
+            terms.append(normalize(word).replace(' ', ''))
+        else:
+            terms.extend(normalize(word).split())
+    return [term[:TOKEN_MAX_LENGTH] for term in terms if term]
+
+
+def build_tokens(user):
+    """{(kind, token): weight} for one user"""
+    tokens = {}
+
+    def add(kind, token, weight):
+        token = token[:TOKEN_MAX_LENGTH]
+        tokens[(kind, token)] = max(weight, tokens.get((kind, token), 0))
+
+    for field, weight in SEARCH_FIELDS.items():
+        value = getattr(user, field) or ''
+        words = normalize(value).split()
+        for word in words:
+            add(UserSearchToken.WORD, word, weight)
+        # The whole value as one word, so "ram kumar" also prefix-matches "ramkumar"
+        # and "ram@gmail.com" matches the address it was copied from
+        if len(words) > 1:
+            add(UserSearchToken.WORD, ''.join(words), weight)
+        # The domain as one word too, for "@gmail.com"
+        domain = normalize(value.partition('@')[2]).replace(' ', '') if field == 'email' else ''
+        if domain:
+            add(UserSearchToken.WORD, domain, weight)
+        for word in words:
+            for gram in trigrams(word):
+                add(UserSearchToken.TRIGRAM, gram, 1)
+    return tokens
+
+
+def index_user(user):
+    """Bring the tokens of one user in line with its current fields"""
+    wanted = build_tokens(user) if is_indexed(user) else {}
+    existing = {
+        (kind, token): (pk, weight)
+        for pk, kind, token, weight in UserSearchToken.objects.filter(user=user).values_list('pk', 'kind', 'token', 'weight')
+    }
+    if {key: weight for key, (pk, weight) in existing.items()} == wanted:
+        return
+
+    stale = [pk for key, (pk, weight) in existing.items() if wanted.get(key) != weight]
+    with transaction.atomic():
+        if stale:
+            UserSearchToken.objects.filter(pk__in=stale).delete()
+        UserSearchToken.objects.bulk_create([
+            UserSearchToken(user=user, kind=kind, token=token, weight=weight)
+            for (kind, token), weight in wanted.items()
+            if existing.get((kind, token), (None, None))[1] != weight
+        ])
+
+
+def rebuild_search_index(batch_size=1000):
+    """Recreate every token from the users table, returns the number of users indexed"""
+    indexed = 0
+    with transaction.atomic():
+        UserSearchToken.objects.all().delete()
+        batch = []
+        for user in User.objects.filter(is_staff=False, is_superuser=False).only(*SEARCH_FIELDS).iterator(chunk_size=batch_size):
+            batch.extend(
+                UserSearchToken(user=user, kind=kind, token=token, weight=weight)
+                for (kind, token), weight in build_tokens(user).items()
+            )
+            indexed += 1
+            if len(batch) >= batch_size:
+                UserSearchToken.objects.bulk_create(batch)
+                batch = []
+        UserSearchToken.objects.bulk_create(batch)
+    return indexed
+
+
+def _term_scores(term, among=None, enough=None):
+    """
+    {user_id: best score} of the devotees matching one query term. Infix
+    matches rank below every prefix match, so they are skipped once the
+    prefix matches alone give `enough` results.
+    """
+    scores = defaultdict(int)
+    words = UserSearchToken.objects.filter(
+        kind=UserSearchToken.WORD, token__gte=term, token__lt=term + PREFIX_END
+    )
+    if among is not None:
+        words = words.filter(user_id__in=among)
+    # Best candidates first (heaviest, then exact before longer tokens, then
+    # newest), so the cut keeps the same, best ones on every run
+    words = words.order_by('-weight', 'token', '-user_id')
+    for user_id, token, weight in words.values_list('user_id', 'token', 'weight')[:MAX_CANDIDATES]:
+        score = (EXACT_SCORE if token == term else PREFIX_SCORE) * weight
+        scores[user_id] = max(scores[user_id], score)
+
+    grams = trigrams(term)
+    if grams and (enough is None or len(scores) < enough):
+        # Every trigram of the term has to be present for an infix match
+        matches = UserSearchToken.objects.filter(kind=UserSearchToken.TRIGRAM, token__in=grams)
+        if among is not None:
+            matches = matches.filter(user_id__in=among)
+        matches = (
+            matches.order_by().values('user_id')
+            .annotate(matched=Count('id')).filter(matched=len(grams))
+            .order_by('-user_id').values_list('user_id', flat=True)[:MAX_CANDIDATES]
+        )
+        for user_id in matches:
+            scores[user_id] = max(scores[user_id], INFIX_SCORE)
+    return scores
+
+
+def search_devotees(query, limit):
+    """Ids of the devotees matching every term of query, best match first"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    # Longer terms are more selective, so they narrow the candidates first
+    terms.sort(key=len, reverse=True)
+    ranked = _term_scores(terms[0], enough=limit if len(terms) == 1 else None)
+    for term in terms[1:]:
+        if not ranked:
+            break
+        scores = _term_scores(term, among=list(ranked))
+        ranked = {user_id: ranked[user_id] + score for user_id, score in scores.items()}
+
+    # Ties go to the most recently registered devotee
+    order = sorted(ranked.items(), key=lambda item: (-item[1], -item[0]))
+    return [user_id for user_id, score in order[:limit]]
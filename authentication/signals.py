@@ -0,0 +1,52 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from devotee import response_cache
+
+from .models import User
+from .qr_tokens import token_cache
+from .search import SEARCH_FIELDS, index_user
+from .token_auth import USER_CLAIMS, user_cache
+
+
+INDEX_TRIGGER_FIELDS = set(SEARCH_FIELDS) | {'is_staff', 'is_superuser'}
+
+
+@receiver(post_save, sender=User)
+def update_search_tokens(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not INDEX_TRIGGER_FIELDS.intersection(update_fields):
+        return
+    index_user(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_qr_token(sender, instance, **kwargs):
+    # Rotation, deactivation and profile changes must not be served from the cache
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_responses(sender, instance, raw=False, **kwargs):
+    # The profile is cached alongside the activity endpoints
+    if raw:
+        return
+    response_cache.bump_versions({instance.pk})
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    # Deleted and deactivated users keep valid tokens, this process refuses them at once
+    deleted = signal is post_delete
+    deactivated = 'is_active' not in instance.get_deferred_fields() and not instance.is_active
+    if deleted or deactivated:
+        user_cache.revoke(instance.pk)
+        return
+    user_cache.invalidate(instance.pk)
+    # A save that may change claimed fields (e.g. a demotion) makes older tokens read the row
+    if not created and (update_fields is None or set(USER_CLAIMS).intersection(update_fields)):
+        user_cache.claims_changed(instance.pk)
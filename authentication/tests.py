@@ -1,3 +1,422 @@
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from devotee import response_cache
+from devotee.models import DailyActivity, MonthlyActivity
+from devotee.weeks import week_for
+from .models import RevokedToken, User
+from .qr_tokens import hash_token, resolve_token, token_cache
+from .revocation import RevocationStore, revocations
+from .search import search_devotees
+from .token_auth import ClaimsRefreshToken, user_cache
+
+
+def call_command_output(name, *args):
+    output = StringIO()
+    call_command(name, *args, stdout=output)
+    return output.getvalue().strip()
+
+
+class DevoteeDetailTests(TestCase):
+    """The admin devotee detail view loads a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            '9000000000', 'Admin', 'User', 'admin@example.com', 'password', is_active=True, is_staff=True
+        )
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True
+        )
+        today = date.today()
+        for offset in range(100):
+            day = today - timedelta(days=offset * 2)
+            DailyActivity.objects.create(user=cls.devotee, date=day, week=week_for(day), daily_chanting=16)
+        for offset in range(18):
+            year, month = divmod(today.year * 12 + today.month - 1 - offset, 12)
+            monthly = MonthlyActivity.objects.create(user=cls.devotee, year=year, month=month + 1)
+            monthly.weeks.set([week_for(date(year, month + 1, 1))])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = f'/auth/admin/{self.devotee.pk}/devotee-detail/'
+
+    def test_query_count_does_not_grow_with_history(self):
+        # Devotee, daily window, monthly activities, their weeks and the streaks
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, {'days': 366, 'months': 120})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['daily_activities']), 100)
+        self.assertEqual(len(response.data['monthly_activities']), 18)
+        self.assertEqual(len(response.data['monthly_activities'][0]['weeks']), 1)
+        self.assertIsNone(response.data['daily_next_cursor'])
+        self.assertIsNone(response.data['monthly_next_cursor'])
+
+    def walk(self, key, cursor_param, cursor_key, params):
+        seen = []
+        while True:
+            with self.assertNumQueries(5):
+                data = self.client.get(self.url, params).data
+            seen += data[key]
+            if not data[cursor_key]:
+                return seen
+            params = {**params, cursor_param: data[cursor_key]}
+
+    def test_load_more_walks_the_whole_history(self):
+        daily = self.walk('daily_activities', 'cursor', 'daily_next_cursor', {'days': 30})
+        dates = [activity['date'] for activity in daily]
+        self.assertEqual(len(dates), 100)
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+        monthly = self.walk('monthly_activities', 'monthly_cursor', 'monthly_next_cursor', {'months': 5})
+        self.assertEqual(len({activity['id'] for activity in monthly}), 18)
+
+    def test_invalid_window(self):
+        self.assertEqual(self.client.get(self.url, {'days': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'x'}).status_code, 400)
+
+
+class DevoteeListTests(TestCase):
+    """The admin devotee list pages by (created_at, id) with counts from one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            '9000000000', 'Admin', 'User', 'admin@example.com', 'password', is_active=True, is_staff=True
+        )
+        for index in range(3):
+            User.objects.create_user(f'900000001{index}', 'Test', 'Devotee', f'devotee{index}@example.com', 'password')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_total_count_by_default(self):
+        data = self.client.get(reverse('admin-devotees'), {'limit': 2}).json()
+        self.assertEqual((len(data['devotees']), data['total_count']), (2, 3))
+        data = self.client.get(reverse('admin-devotees'), {'limit': 2, 'include_total': 'false'}).json()
+        self.assertNotIn('total_count', data)
+
+    def test_cursor_walks_devotees_registered_at_the_same_time(self):
+        registered = timezone.now() - timedelta(days=1)
+        for index in range(5):
+            User.objects.create_user(f'900000002{index}', 'Same', 'Time', f'same{index}@example.com', 'password')
+        User.objects.filter(username__startswith='900000002').update(created_at=registered)
+
+        expected = list(
+            User.objects.filter(is_staff=False, is_superuser=False)
+            .order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        seen = []
+        params = {'limit': 2, 'include_total': 'false'}
+        while True:
+            # The page with its activity counts, in one query
+            with self.assertNumQueries(1):
+                data = self.client.get(reverse('admin-devotees'), params).json()
+            seen += [devotee['id'] for devotee in data['devotees']]
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(seen, expected)
+
+    def test_annotated_counts_match_each_devotee(self):
+        today = date.today()
+        for index, devotee in enumerate(User.objects.filter(is_staff=False)):
+            for offset in range(index * 2):
+                day = today - timedelta(days=offset)
+                DailyActivity.objects.create(user=devotee, date=day, week=week_for(day))
+            for month in range(1, index + 1):
+                MonthlyActivity.objects.create(user=devotee, year=2024, month=month, book_name='Gita')
+
+        data = self.client.get(reverse('admin-devotees')).json()
+        self.assertEqual(len(data['devotees']), 3)
+        for devotee in data['devotees']:
+            self.assertEqual(
+                (devotee['total_daily_activities'], devotee['total_monthly_activities']),
+                (DailyActivity.objects.filter(user_id=devotee['id']).count(),
+                 MonthlyActivity.objects.filter(user_id=devotee['id']).count()),
+            )
+        self.assertEqual(sorted(devotee['total_daily_activities'] for devotee in data['devotees']), [0, 2, 4])
+
+    def test_search_has_no_total_count(self):
+        data = self.client.get(reverse('admin-devotees'), {'search': 'devotee', 'limit': 2}).json()
+        self.assertEqual(len(data['devotees']), 2)
+        self.assertNotIn('total_count', data)
+
+
+class SearchTests(TestCase):
+    """Index search finds devotees by name, mobile and email, best match first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        def create(mobile, first_name, last_name, email):
+            return User.objects.create_user(mobile, first_name, last_name, email, 'password')
+
+        cls.radha = create('9876500001', 'Radha', 'Rani', 'radha.rani@gmail.com')
+        cls.radhika = create('9876500002', 'Radhika', 'Devi', 'rd@yahoo.com')
+        cls.madhav = create('9123400003', 'Madhav', 'Das', 'madhav@gmail.com')
+        cls.rani = create('9123400004', 'Rani', 'Radha', 'rani@example.org')
+
+    def search(self, query, limit=10):
+        return search_devotees(query, limit)
+
+    def test_name_prefix(self):
+        # Exact word matches rank above prefixes, ties go to the newest
+        self.assertEqual(self.search('radha'), [self.rani.pk, self.radha.pk])
+        self.assertEqual(self.search('radh'), [self.rani.pk, self.radhika.pk, self.radha.pk])
+        self.assertEqual(self.search('radha rani'), [self.rani.pk, self.radha.pk])
+
+    def test_mobile_prefix(self):
+        self.assertEqual(self.search('98765'), [self.radhika.pk, self.radha.pk])
+        self.assertEqual(self.search('9123400003'), [self.madhav.pk])
+
+    def test_infix_through_trigrams(self):
+        self.assertEqual(self.search('adhav'), [self.madhav.pk])
+        self.assertEqual(self.search('400003'), [self.madhav.pk])
+        self.assertEqual(self.search('adh'), [self.rani.pk, self.madhav.pk, self.radhika.pk, self.radha.pk])
+        # Shorter terms only match the start of a word
+        self.assertEqual(self.search('ra'), [self.rani.pk, self.radhika.pk, self.radha.pk])
+        self.assertEqual(self.search('ad'), [])
+
+    def test_full_email_and_domain(self):
+        self.assertEqual(self.search('radha.rani@gmail.com'), [self.radha.pk])
+        self.assertEqual(self.search('RD@Yahoo.com'), [self.radhika.pk])
+        self.assertEqual(self.search('madhav@gmail'), [self.madhav.pk])
+        self.assertEqual(self.search('@gmail.com'), [self.madhav.pk, self.radha.pk])
+        self.assertEqual(self.search('gmail.com'), [self.madhav.pk, self.radha.pk])
+        self.assertEqual(self.search('@hotmail.com'), [])
+
+
+class QrTokenTests(TestCase):
+    """QR tokens resolve by hash from the cache, and stop resolving at once when rotated or deactivated"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True
+        )
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.devotee)
+
+    def generate(self):
+        return self.client.post(reverse('auth-generate-qr-token')).json()['qr_token']
+
+    def test_only_the_hash_is_stored_and_repeat_scans_use_the_cache(self):
+        token = self.generate()
+        self.devotee.refresh_from_db()
+        self.assertEqual(self.devotee.qr_token_hash, hash_token(token))
+        self.assertNotIn(token, [str(value) for value in User.objects.filter(pk=self.devotee.pk).values().get().values()])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_token(token).pk, self.devotee.pk)
+        with self.assertNumQueries(0):
+            user = resolve_token(token)
+        self.assertEqual((user.pk, user.username), (self.devotee.pk, '9000000001'))
+        self.assertIsNone(resolve_token('unknown-token'))
+
+    def test_rotated_and_deactivated_tokens_stop_resolving_at_once(self):
+        old = self.generate()
+        self.assertIsNotNone(resolve_token(old))
+        new = self.generate()
+        self.assertIsNone(resolve_token(old))
+        self.assertEqual(resolve_token(new).pk, self.devotee.pk)
+        self.assertEqual(self.client.get(reverse('validate-qr-token', kwargs={'token': old})).status_code, 404)
+
+        self.assertIsNotNone(resolve_token(new))
+        self.devotee.is_active = False
+        self.devotee.save()
+        self.assertIsNone(resolve_token(new))
+        self.assertEqual(self.client.get(reverse('validate-qr-token', kwargs={'token': new})).status_code, 404)
+
+
+class TokenAuthenticationTests(TestCase):
+    """Requests are authenticated from token claims, and cached users never overwrite newer rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True
+        )
+
+    def setUp(self):
+        user_cache.clear()
+        response_cache.clear()
+
+    def auth(self, token_class=ClaimsRefreshToken):
+        return {'HTTP_AUTHORIZATION': f'Bearer {token_class.for_user(self.devotee).access_token}'}
+
+    def test_one_query_fewer_than_loading_the_user(self):
+        url = reverse('auth-get-leaderboard-rank')
+        with CaptureQueriesContext(connection) as loaded:
+            self.assertEqual(self.client.get(url, **self.auth(RefreshToken)).status_code, 200)
+        user_cache.clear()
+        with CaptureQueriesContext(connection) as claimed:
+            self.assertEqual(self.client.get(url, **self.auth()).status_code, 200)
+        self.assertEqual(len(claimed), len(loaded) - 1)
+
+    def test_other_fields_load_once_from_the_cache(self):
+        # The profile reads fields the token does not carry
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('auth-get-profile'), **self.auth()).json()['email'], 'devotee@example.com')
+        response_cache.clear()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('auth-get-profile'), **self.auth())
+
+        # A token without claims is served from the cache too
+        response_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('auth-get-profile'), **self.auth(RefreshToken)).status_code, 200)
+
+    def test_cached_values_do_not_overwrite_newer_rows(self):
+        self.client.get(reverse('auth-get-profile'), **self.auth())
+        # Changed by another process, whose save this process never hears of
+        User.objects.filter(pk=self.devotee.pk).update(email='changed@example.com', qr_token_hash='other')
+
+        response = self.client.patch(
+            reverse('auth-update-profile'), {'first_name': 'Renamed'}, content_type='application/json', **self.auth(),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.devotee.refresh_from_db()
+        self.assertEqual(
+            (self.devotee.first_name, self.devotee.email, self.devotee.qr_token_hash),
+            ('Renamed', 'changed@example.com', 'other'),
+        )
+
+    def test_password_is_checked_against_the_row(self):
+        auth = self.auth()
+        self.client.get(reverse('auth-get-profile'), **auth)
+        passwords = {'old_password': 'password', 'new_password': 'changed', 'confirm_new_password': 'changed'}
+        url = reverse('auth-change-password')
+        self.assertEqual(self.client.post(url, passwords, content_type='application/json', **auth).status_code, 200)
+        self.assertEqual(self.client.post(url, passwords, content_type='application/json', **auth).status_code, 400)
+        self.devotee.refresh_from_db()
+        self.assertTrue(self.devotee.check_password('changed'))
+
+    def test_demoted_staff_lose_admin_access_at_once(self):
+        self.devotee.is_staff = True
+        self.devotee.save()
+        auth = self.auth()
+        url = reverse('admin-leaderboard')
+        self.assertEqual(self.client.get(url, **auth).status_code, 200)
+
+        self.devotee.is_staff = False
+        self.devotee.save()
+        # The token still claims is_staff, the row does not
+        self.assertEqual(self.client.get(url, **auth).status_code, 403)
+        user_cache.invalidate(self.devotee.pk)
+        self.assertEqual(self.client.get(url, **auth).status_code, 403)
+
+    def test_deactivated_and_deleted_users_are_refused(self):
+        auth = self.auth()
+        url = reverse('auth-get-leaderboard-rank')
+        self.assertEqual(self.client.get(url, **auth).status_code, 200)
+
+        self.devotee.is_active = False
+        self.devotee.save()
+        self.assertEqual(self.client.get(url, **auth).status_code, 401)
+        self.devotee.is_active = True
+        self.devotee.save()
+        self.assertEqual(self.client.get(url, **auth).status_code, 200)
+
+        self.devotee.delete()
+        self.assertEqual(self.client.get(url, **auth).status_code, 401)
+
+
+class TokenRevocationTests(TestCase):
+    """Logout revokes refresh tokens, refreshing rotates them, and clean tokens are checked without queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True
+        )
+
+    def setUp(self):
+        user_cache.clear()
+        revocations.clear()
+        self.refresh = str(ClaimsRefreshToken.for_user(self.devotee))
+
+    def post_refresh(self, token):
+        return self.client.post(reverse('auth-token-refresh'), {'refresh': token}, content_type='application/json')
+
+    def test_refresh_rotates_the_token(self):
+        response = self.post_refresh(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'access', 'refresh'})
+        # A replayed token is refused, its replacement is not
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+        self.assertEqual(self.post_refresh(response.json()['refresh']).status_code, 200)
+
+    def test_logout_revokes_the_refresh_token(self):
+        access = ClaimsRefreshToken.for_user(self.devotee).access_token
+        response = self.client.post(
+            reverse('auth-logout-user'), {'refresh': self.refresh}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {access}',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+    def test_inactive_users_and_invalid_tokens_are_refused(self):
+        self.assertEqual(self.post_refresh('not a token').status_code, 401)
+        self.assertEqual(self.post_refresh(str(ClaimsRefreshToken(self.refresh).access_token)).status_code, 401)
+        self.devotee.is_active = False
+        self.devotee.save()
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+    def test_clean_tokens_are_checked_without_queries(self):
+        store = RevocationStore(capacity=100, error_rate=0.001, sync_seconds=60)
+        self.assertTrue(store.revoke('revoked', timezone.now() + timedelta(hours=1)))
+        self.assertFalse(store.revoke('revoked', timezone.now() + timedelta(hours=1)))
+        self.assertFalse(store.is_revoked('first'))
+        with self.assertNumQueries(0):
+            self.assertFalse(any(store.is_revoked(f'clean-{index}') for index in range(100)))
+        self.assertTrue(store.is_revoked('revoked'))
+        self.assertEqual(store.snapshot(), {'checks': 102, 'filter_hits': 1, 'lookups': 1})
+
+    def test_other_processes_revocations_are_synced(self):
+        store = RevocationStore(capacity=100, error_rate=0.001, sync_seconds=0)
+        self.assertFalse(store.is_revoked('elsewhere'))
+        RevokedToken.objects.create(jti='elsewhere', expires_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(store.is_revoked('elsewhere'))
+
+    def test_purge_deletes_expired_tokens(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='expired', expires_at=now - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='live', expires_at=now + timedelta(hours=1))
+        self.assertTrue(revocations.is_revoked('expired'))
+        self.assertEqual(revocations.purge_expired(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+        # The filter is not rebuilt: a purged jti it still holds costs one lookup
+        with self.assertNumQueries(1):
+            self.assertFalse(revocations.is_revoked('expired'))
+        self.assertTrue(revocations.is_revoked('live'))
+        self.assertEqual(call_command_output('purge_revoked_tokens'), 'Purged 0 expired token(s).')
+
+    def test_revocations_during_a_rebuild_are_kept(self):
+        store = RevocationStore(capacity=100, error_rate=0.001, sync_seconds=60)
+        rows = RevokedToken.objects.values_list
+
+        def revoke_while_reading(*fields):
+            # Another request revokes a token once the rebuild has read the table
+            result = list(rows(*fields))
+            store.revoke('meanwhile', timezone.now() + timedelta(hours=1))
+            return result
 
-# Create your tests here.
+        with mock.patch.object(RevokedToken.objects, 'values_list', side_effect=revoke_while_reading):
+            self.assertFalse(store.is_revoked('clean'))
+        with self.assertNumQueries(1):
+            self.assertTrue(store.is_revoked('meanwhile'))
@@ -0,0 +1,227 @@
+"""
+JWT authentication without a users-table query per request.
+
+Tokens issued by ClaimsRefreshToken carry the user fields most requests
+need (USER_CLAIMS), and ClaimsJWTAuthentication builds request.user from
+them alone: a User with only those fields loaded. The first read of any
+other field loads the rest at once from user_cache, a bounded in-process
+cache of user rows with a short TTL (see User.refresh_from_db). Saving or
+deleting a user drops its entry; other worker processes see the change once
+their entry expires. The password hash is never cached, so checking it
+always reads the row.
+
+Cached and claimed values may be older than the row, so a user built from
+them only writes the fields changed since (see User.save). Claims are as
+fresh as the token: once a claimed field of a user changes (a demotion, a
+deactivation), the process that made the change stops trusting the claims
+of the user's older tokens and reads the row instead, and the other
+processes follow once the access token expires. A deleted user is refused
+the same way. Tokens without claims, issued before they were added, are
+authenticated from user_cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+
+
+# User fields carried by access tokens, besides the id
+USER_CLAIMS = ('username', 'is_staff', 'is_superuser', 'is_active', 'created_at')
+
+UNCACHED_FIELDS = ('password',)
+CACHED_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields if field.attname not in UNCACHED_FIELDS
+)
+
+
+class UserCache:
+    """
+    Thread-safe LRU mapping of user id -> field values, with a TTL per entry.
+    Revoked ids (deactivated or deleted users), and the time the claimed
+    fields of a user last changed, are remembered for as long as access
+    tokens issued before may still be valid.
+    """
+
+    def __init__(self, max_entries, ttl, revoked_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revoked_ttl = revoked_ttl
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._claims_changed = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._revoked.pop(user_id, None)
+
+    def revoke(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            now = time.monotonic()
+            # Expired ids are pruned here, revocations are rare
+            for revoked_id in [key for key, until in self._revoked.items() if until < now]:
+                del self._revoked[revoked_id]
+            self._revoked[user_id] = now + self.revoked_ttl
+
+    def is_revoked(self, user_id):
+        with self._lock:
+            until = self._revoked.get(user_id)
+            return until is not None and until >= time.monotonic()
+
+    def claims_changed(self, user_id):
+        with self._lock:
+            now = time.monotonic()
+            # Expired marks are pruned here, changes of claimed fields are rare
+            for changed_id in [key for key, (until, _) in self._claims_changed.items() if until < now]:
+                del self._claims_changed[changed_id]
+            self._claims_changed[user_id] = (now + self.revoked_ttl, time.time())
+
+    def claims_trusted(self, user_id, issued_at):
+        """Whether a token issued at `issued_at` (a timestamp) carries the user's current claims"""
+        with self._lock:
+            until, changed_at = self._claims_changed.get(user_id, (None, None))
+            if until is None or until < time.monotonic():
+                return True
+        # iat has whole seconds, a token of the same second might be older than the change
+        return issued_at is not None and issued_at > changed_at
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+            self._claims_changed.clear()
+
+
+_cache_settings = getattr(settings, 'USER_CACHE', {})
+user_cache = UserCache(
+    max_entries=_cache_settings.get('MAX_ENTRIES', 10000),
+    ttl=_cache_settings.get('TTL_SECONDS', 60),
+    revoked_ttl=api_settings.ACCESS_TOKEN_LIFETIME.total_seconds(),
+)
+
+
+def user_values(user_id):
+    """CACHED_FIELDS of a user from user_cache, or from the database on a miss. None if there is no such user."""
+    values = user_cache.get(user_id)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values(*CACHED_FIELDS).first()
+        if values is not None:
+            user_cache.set(user_id, values)
+    return values
+
+
+def user_claims(user):
+    claims = {name: getattr(user, name) for name in USER_CLAIMS}
+    claims['created_at'] = claims['created_at'].isoformat() if claims['created_at'] else None
+    return claims
+
+
+def claimed_values(validated_token, user_id):
+    """Field values of the user from the token's claims, None if it has none"""
+    if not all(name in validated_token for name in USER_CLAIMS):
+        return None
+    values = {name: validated_token[name] for name in USER_CLAIMS}
+    values['id'] = user_id
+    values['created_at'] = datetime.fromisoformat(values['created_at']) if values['created_at'] else None
+    return values
+
+
+def user_from_values(values):
+    """
+    A User with only `values` loaded. It remembers them, so that reading
+    another field loads the rest from user_cache and save() only writes
+    what changed.
+    """
+    # from_db expects the values in model field order
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db(User.objects.db, field_names, [values[name] for name in field_names])
+    user._cached_values = {name: values[name] for name in field_names}
+    return user
+
+
+def load_cached_fields(user, fields):
+    """
+    Load every cached deferred field into a user, to read `fields`. Returns
+    their names, or None when the user is not cached and `fields` include
+    one that never is, as then one query is better spent on all of them.
+    """
+    values = user_cache.get(user.pk)
+    if values is None:
+        if not set(fields) <= set(CACHED_FIELDS):
+            return None
+        values = user_values(user.pk)
+    if values is None:
+        return set()
+    loaded = user.get_deferred_fields() & set(CACHED_FIELDS)
+    for name in loaded:
+        setattr(user, name, values[name])
+        user._cached_values[name] = values[name]
+    return loaded
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """A refresh token whose access tokens carry USER_CLAIMS"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for name, value in user_claims(user).items():
+            token[name] = value
+        return token
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication building request.user from user_cache or the token's
+    claims, and only querying the users table for a user that is not cached
+    and whose token has no claims, or claims older than a change to them.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        if user_cache.is_revoked(user_id):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        values = user_cache.get(user_id)
+        if values is None and user_cache.claims_trusted(user_id, validated_token.get('iat')):
+            values = claimed_values(validated_token, user_id)
+        if values is None:
+            values = user_values(user_id)
+        if values is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not values['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user_from_values(values)
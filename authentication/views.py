@@ -5,19 +5,39 @@ from rest_framework.permissions import AllowAny,IsAuthenticated,IsAdminUser
 from rest_framework.response import Response
 from .models import User
 from .serializer import UserRegistrationSerializer,UserLoginSerializer,ChangePasswordSerializer,UserProfileSerializer
-from .admin_serializer import DevoteeListSerializer, DevoteeDetailSerializer, AdminDailyActivitySerializer
+from .qr_tokens import hash_token
+from .search import search_devotees
+from .admin_serializer import (
+    DETAIL_DAYS, DETAIL_MONTHS, MAX_DETAIL_DAYS, MAX_DETAIL_MONTHS, DetailWindow,
+    DevoteeListSerializer, DevoteeDetailSerializer, AdminDailyActivitySerializer, with_activity_counts,
+)
 from devotee.serializers import MonthlyActivitySerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from .token_auth import ClaimsRefreshToken
+from .revocation import refresh_tokens, revoke_refresh_token
 from django.contrib.auth import logout, authenticate
 from django.db.models import Q, Count, Avg, Sum, Max
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import date, timedelta, datetime
 from devotee.models import DailyActivity, MonthlyActivity, Week
+from devotee.aggregation import activity_analytics, aggregate_metrics, build_summary
+from devotee.pagination import InvalidCursor, keyset_page, page_size_from, wants_total
+from devotee.rollups import analytics_from_rollups
+from devotee.export import FORMATS as EXPORT_FORMATS, export_lines, parse_filters as parse_export_filters
+from devotee.streaming import buffered
+from devotee.write_buffer import quick_entry_buffer
+from devotee.response_cache import cached_per_user, hit_counters
+from devotee.sqlite import retry_on_locked
+from devotee.statistics import get_statistics, statistics_response
+from devotee.streaks import streak_summary
+from devotee.leaderboard import BOARDS as LEADERBOARDS, current_period, standing, top_page
+from devotee.participation import build_matrix, parse_range as parse_matrix_range, participation_report
 from collections import defaultdict
 import secrets
 import hashlib
 def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user)
+    refresh = ClaimsRefreshToken.for_user(user)
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -30,6 +50,7 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         - POST /login/
         - POST /change-password/
         - POST /logout/
+        - POST /token-refresh/
     """
     @action(detail=False,methods=['POST'],permission_classes=[AllowAny],url_path='register-user')
     def register_user(self,request):
@@ -64,7 +85,7 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
 
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         
         # Build full URL for profile image
         profile_image_url = None
@@ -102,16 +123,25 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
             refresh_token = request.data.get("refresh")
             if refresh_token:
                 try:
-                    token = RefreshToken(refresh_token)
-                    token.blacklist()
-                except Exception:
-                    pass  # Token might already be invalid
+                    revoke_refresh_token(refresh_token)
+                except TokenError:
+                    pass  # Invalid or expired, so there is nothing to revoke
             logout(request)
             return Response({"message": "User logged out successfully."}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['POST'], permission_classes=[AllowAny], url_path='token-refresh')
+    def token_refresh(self, request):
+        """New access token for a refresh token, and a new refresh token replacing it (see revocation.py)"""
+        try:
+            tokens = refresh_tokens(request.data.get("refresh") or "")
+        except TokenError as e:
+            return Response({"error": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(tokens, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='profile')
+    @cached_per_user('profile')
     def get_profile(self, request):
         """Get current user profile"""
         serializer = UserProfileSerializer(request.user, context={'request': request})
@@ -127,7 +157,8 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # Only the write holds the database lock, not the validation or the response
+        retry_on_locked(serializer.save)()
         
         # Refresh user from database to get updated data
         request.user.refresh_from_db()
@@ -155,6 +186,7 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         }, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['DELETE'], permission_classes=[IsAuthenticated], url_path='delete-profile')
+    @retry_on_locked
     def delete_profile(self, request):
         """Delete complete user profile and all associated data"""
         user = request.user
@@ -162,7 +194,6 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         # Delete all sadana data first
         DailyActivity.objects.filter(user=user).delete()
         MonthlyActivity.objects.filter(user=user).delete()
-        Week.objects.filter(created_by=user).delete()
         
         # Delete user account
         user.delete()
@@ -172,6 +203,7 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         }, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['DELETE'], permission_classes=[IsAuthenticated], url_path='delete-sadana-data')
+    @retry_on_locked
     def delete_sadana_data(self, request):
         """Delete only sadana information (activities), not account"""
         user = request.user
@@ -179,92 +211,27 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         # Delete all sadana data
         DailyActivity.objects.filter(user=user).delete()
         MonthlyActivity.objects.filter(user=user).delete()
-        Week.objects.filter(created_by=user).delete()
         
         return Response({
             "message": "All sadana information deleted successfully. Your account remains active."
         }, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='spiritual-growth')
+    @cached_per_user('spiritual-growth')
     def get_spiritual_growth(self, request):
         """Get comprehensive spiritual growth statistics for the user"""
-        user = request.user
-        
-        # 1. Total Round of chanting till now
-        total_chanting_rounds = DailyActivity.objects.filter(user=user).aggregate(
-            total=Sum('daily_chanting')
-        )['total'] or 0
-        
-        # 2. Highest chanting round in a day
-        highest_chanting = DailyActivity.objects.filter(user=user).aggregate(
-            max_rounds=Max('daily_chanting')
-        )['max_rounds'] or 0
-        
-        # 3. Total count of sport session attendance
-        sport_attended_count = DailyActivity.objects.filter(
-            user=user,
-            sport_session_attendance='Attended'
-        ).count()
-        
-        # 4. Total Number of Books read and their names
-        completed_books = MonthlyActivity.objects.filter(
-            user=user,
-            monthly_book_completed='Completed'
-        ).exclude(book_name='').values_list('book_name', flat=True).distinct()
-        
-        partially_completed_books = MonthlyActivity.objects.filter(
-            user=user,
-            monthly_book_completed='Partially Completed'
-        ).exclude(book_name='').values_list('book_name', flat=True).distinct()
-        
-        total_books_completed = completed_books.count()
-        total_books_partial = partially_completed_books.count()
-        
-        # 5. Morning Program attendance count
-        morning_program_count = MonthlyActivity.objects.filter(
-            user=user,
-            monthly_morning_program='Attended'
-        ).count()
-        
-        # 6. Weekly morning chanting session attendance (Thursday)
-        thursday_chanting_count = DailyActivity.objects.filter(
-            user=user,
-            thursday_morning_chanting_session_attendance='Attended'
-        ).count()
-        
-        # 7. Sunday offline program attendance
-        sunday_offline_count = DailyActivity.objects.filter(
-            user=user,
-            sunday_offline_program_attendance='Attended'
-        ).count()
-        
-        # 8. Sunday temple chanting session attendance
-        sunday_temple_chanting_count = DailyActivity.objects.filter(
-            user=user,
-            sunday_temple_chanting_session_attendance='Attended'
-        ).count()
-        
-        # 9. Weekly seva count
-        weekly_seva_count = DailyActivity.objects.filter(
-            user=user,
-            weekly_seva='Yes'
-        ).count()
-        
+        # Counters are kept up to date on every activity write, so this is a single row read
+        stats = get_statistics(request.user)
         return Response({
-            "total_chanting_rounds": total_chanting_rounds,
-            "highest_chanting_rounds": highest_chanting,
-            "sport_session_attendance_count": sport_attended_count,
-            "total_books_completed": total_books_completed,
-            "total_books_partially_completed": total_books_partial,
-            "completed_books": list(completed_books),
-            "partially_completed_books": list(partially_completed_books),
-            "morning_program_count": morning_program_count,
-            "thursday_chanting_count": thursday_chanting_count,
-            "sunday_offline_program_count": sunday_offline_count,
-            "sunday_temple_chanting_count": sunday_temple_chanting_count,
-            "weekly_seva_count": weekly_seva_count,
+            **statistics_response(stats),
+            "streaks": streak_summary(request.user.pk),
         }, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='leaderboard-rank')
+    def get_leaderboard_rank(self, request):
+        """The user's score and rank on every leaderboard, for the current week and month"""
+        return Response(standing(request.user.pk), status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['GET', 'POST'], permission_classes=[IsAuthenticated], url_path='generate-qr-token')
     def generate_qr_token(self, request):
         """Generate or regenerate QR token for quick entry"""
@@ -274,11 +241,11 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         token = secrets.token_urlsafe(32)
         
         # Ensure uniqueness
-        while User.objects.filter(qr_token=token).exists():
+        while User.objects.filter(qr_token_hash=hash_token(token)).exists():
             token = secrets.token_urlsafe(32)
         
-        # Save token to user
-        user.qr_token = token
+        # Only the hash is stored, the token itself is shown once here
+        user.qr_token_hash = hash_token(token)
         user.qr_token_created_at = timezone.now()
         user.save()
         
@@ -300,6 +267,7 @@ class AdminViewSet(viewsets.ViewSet):
     Admin endpoints:
     - POST /admin-login/ - Admin login
     - GET /devotees/ - List all devotees (with search)
+    - GET /export/ - Stream sadhana data as CSV or NDJSON
     - GET /devotees/{id}/ - Get devotee details
     """
     
@@ -335,7 +303,7 @@ class AdminViewSet(viewsets.ViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             "message": "Admin login successful",
             "refresh": str(refresh),
@@ -353,7 +321,13 @@ class AdminViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated])
     def devotees(self, request):
-        """List all devotees with optional search"""
+        """
+        List devotees (newest first) with optional search.
+        Query params: search, limit, cursor (from next_cursor), include_total
+        (default true, include_total=false skips the COUNT)
+        With search the top `limit` matches are returned best first, without a cursor
+        or total_count.
+        """
         # Check if user is admin
         if not (request.user.is_staff or request.user.is_superuser):
             return Response(
@@ -367,28 +341,57 @@ class AdminViewSet(viewsets.ViewSet):
         # Filter out admin users, only show regular devotees
         queryset = User.objects.filter(is_staff=False, is_superuser=False)
         
-        # Apply search filter
+        try:
+            page_size = page_size_from(request.query_params)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Search returns the best matches from the search index, ranked, in a single page
         if search:
-            queryset = queryset.filter(
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(username__icontains=search) |
-                Q(email__icontains=search)
-            )
+            ranked_ids = search_devotees(search, page_size)
+            devotees = with_activity_counts(queryset.filter(pk__in=ranked_ids)).in_bulk()
+            page = [devotees[pk] for pk in ranked_ids if pk in devotees]
+            serializer = DevoteeListSerializer(page, many=True)
+            response = {
+                "devotees": serializer.data,
+                "next_cursor": None,
+            }
+            # No total_count: the ranking stops reading candidates once it has enough
+            return Response(response, status=status.HTTP_200_OK)
         
-        # Order by creation date (newest first)
-        queryset = queryset.order_by('-created_at')
+        # Activity counts come from correlated subqueries in the same SELECT
+        devotees = with_activity_counts(queryset)
         
-        serializer = DevoteeListSerializer(queryset, many=True)
+        # Keyset pagination on (created_at, id), newest first
+        try:
+            page, next_cursor = keyset_page(
+                devotees,
+                ('-created_at', '-id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size,
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({
-            "total_count": queryset.count(),
-            "devotees": serializer.data
-        }, status=status.HTTP_200_OK)
+        serializer = DevoteeListSerializer(page, many=True)
+        
+        response = {
+            "devotees": serializer.data,
+            "next_cursor": next_cursor,
+        }
+        # Clients have always read total_count here, so only include_total=false drops the COUNT
+        if wants_total(request.query_params, default=True):
+            response["total_count"] = queryset.count()
+        return Response(response, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['GET'], permission_classes=[IsAuthenticated], url_path='devotee-detail')
     def devotee_detail(self, request, pk=None):
-        """Get detailed information about a specific devotee"""
+        """
+        Get detailed information about a specific devotee, with the daily
+        activities of the last `days` days and the latest `months` monthly activities.
+        Query params: days, months, cursor / monthly_cursor (from daily_next_cursor /
+        monthly_next_cursor) to load the next, older window
+        """
         # Check if user is admin
         if not (request.user.is_staff or request.user.is_superuser):
             return Response(
@@ -396,8 +399,19 @@ class AdminViewSet(viewsets.ViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        params = request.query_params
         try:
-            devotee = User.objects.get(pk=pk, is_staff=False, is_superuser=False)
+            window = DetailWindow(
+                days=page_size_from(params, DETAIL_DAYS, MAX_DETAIL_DAYS, name='days'),
+                months=page_size_from(params, DETAIL_MONTHS, MAX_DETAIL_MONTHS, name='months'),
+                cursor=params.get('cursor'),
+                monthly_cursor=params.get('monthly_cursor'),
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            devotee = User.objects.prefetch_related(*window.prefetches(), 'streaks').get(pk=pk, is_staff=False, is_superuser=False)
         except User.DoesNotExist:
             return Response(
                 {"error": "Devotee not found."},
@@ -410,7 +424,7 @@ class AdminViewSet(viewsets.ViewSet):
             )
         
         try:
-            serializer = DevoteeDetailSerializer(devotee)
+            serializer = DevoteeDetailSerializer(devotee, context={'window': window})
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             import traceback
@@ -423,8 +437,11 @@ class AdminViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['GET'], permission_classes=[IsAuthenticated], url_path='filter-activities')
     def filter_devotee_activities(self, request, pk=None):
         """
-        Filter devotee activities by date range, week, month, or year.
-        Query params: start_date, end_date, week_id, month, year
+        Filter devotee activities by date range, week, month, or year, newest first.
+        Query params: start_date, end_date, week_id, month, year, limit,
+        cursor / monthly_cursor (from next_cursor / monthly_next_cursor), include_total
+        (default true, include_total=false skips the total_monthly COUNT)
+        Totals and the summary cover every matching day, not just the page.
         """
         # Check if user is admin
         if not (request.user.is_staff or request.user.is_superuser):
@@ -486,22 +503,184 @@ class AdminViewSet(viewsets.ViewSet):
             except ValueError:
                 return Response({"error": "Invalid year format."}, status=400)
         
+        # Totals come from a single conditional aggregate query
+        daily_totals = aggregate_metrics(daily_activities)
+        
+        # One page of each, fetched by keyset
+        try:
+            page_size = page_size_from(request.query_params)
+            daily_page, next_cursor = keyset_page(
+                daily_activities.select_related('user', 'week'),
+                ('-date', '-id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size,
+            )
+            monthly_page, monthly_next_cursor = keyset_page(
+                monthly_activities.select_related('user').prefetch_related('weeks'),
+                ('-year', '-month', '-id'),
+                cursor=request.query_params.get('monthly_cursor'),
+                page_size=page_size,
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
+        
         # Serialize activities
-        daily_serializer = AdminDailyActivitySerializer(daily_activities.order_by('-date'), many=True)
-        monthly_serializer = MonthlyActivitySerializer(monthly_activities.order_by('-year', '-month'), many=True)
+        daily_serializer = AdminDailyActivitySerializer(daily_page, many=True)
+        monthly_serializer = MonthlyActivitySerializer(monthly_page, many=True)
         
-        return Response({
+        response = {
             "daily_activities": daily_serializer.data,
             "monthly_activities": monthly_serializer.data,
-            "total_daily": daily_activities.count(),
-            "total_monthly": monthly_activities.count()
-        }, status=status.HTTP_200_OK)
+            "next_cursor": next_cursor,
+            "monthly_next_cursor": monthly_next_cursor,
+            "total_daily": daily_totals['activities_count'],
+            "daily_summary": build_summary(daily_totals)
+        }
+        if wants_total(request.query_params, default=True):
+            response["total_monthly"] = monthly_activities.count()
+        return Response(response, status=status.HTTP_200_OK)
     
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='export')
+    def export(self, request):
+        """
+        Stream sadhana data of all or selected devotees as a file download.
+        Query params: output (csv|ndjson, default csv), dataset (daily|monthly|all, default daily;
+        all is NDJSON only), start_date, end_date, devotee_id (repeatable), week_id
+        """
+        # Check if user is admin
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {"error": "Admin access required."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        export_format = request.query_params.get('output', 'csv')
+        dataset = request.query_params.get('dataset', 'daily')
+        try:
+            filters = parse_export_filters(
+                start_date=request.query_params.get('start_date'),
+                end_date=request.query_params.get('end_date'),
+                devotee_ids=request.query_params.getlist('devotee_id'),
+                week_id=request.query_params.get('week_id'),
+            )
+            lines = export_lines(export_format, dataset, filters)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(buffered(lines), content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="sadhana-{dataset}-{date.today()}.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['GET', 'POST'], permission_classes=[IsAuthenticated], url_path='quick-entry-buffer')
+    def quick_entry_buffer_metrics(self, request):
+        """
+        Flush metrics of the quick-entry write buffer of the worker process
+        answering the request. POST flushes the buffer first.
+        """
+        # Check if user is admin
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {"error": "Admin access required."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if request.method == 'POST':
+            quick_entry_buffer.flush()
+        return Response(quick_entry_buffer.metrics(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET', 'DELETE'], permission_classes=[IsAuthenticated], url_path='response-cache')
+    def response_cache_metrics(self, request):
+        """
+        Hit and miss counts of the per-user response cache in the worker
+        process answering the request. DELETE resets the counts.
+        """
+        # Check if user is admin
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {"error": "Admin access required."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if request.method == 'DELETE':
+            hit_counters.clear()
+        return Response(hit_counters.snapshot(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='leaderboard')
+    def leaderboard(self, request):
+        """
+        Devotees ranked on one leaderboard, best first, one page at a time.
+        Query params: board (total_rounds, week_rounds, month_rounds, attendance),
+        limit, cursor (from next_cursor)
+        """
+        # Check if user is admin
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {"error": "Admin access required."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        board = request.query_params.get('board', 'total_rounds')
+        if board not in LEADERBOARDS:
+            return Response({"error": f"Invalid board. Use one of: {', '.join(LEADERBOARDS)}."}, status=400)
+        period = current_period(board)
+        try:
+            entries, next_cursor = top_page(
+                board, period,
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size_from(request.query_params),
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            "board": board,
+            "period": period,
+            "results": [
+                {
+                    "rank": rank,
+                    "user_id": entry.user_id,
+                    "username": entry.user.username,
+                    "name": f"{entry.user.first_name} {entry.user.last_name}".strip(),
+                    "score": entry.score,
+                }
+                for rank, entry in entries
+            ],
+            "next_cursor": next_cursor,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='participation-matrix')
+    def participation_matrix(self, request):
+        """
+        Devotee × day participation of the whole roster for a heatmap: rates
+        per devotee and per day, percentile bands and the encoded heatmap.
+        Query params: start_date, end_date (default the last 30 days),
+        devotee_id (repeatable)
+        """
+        # Check if user is admin
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {"error": "Admin access required."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            start, end, devotee_ids = parse_matrix_range(
+                start_date=request.query_params.get('start_date'),
+                end_date=request.query_params.get('end_date'),
+                devotee_ids=request.query_params.getlist('devotee_id'),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        matrix = build_matrix(start, end, devotee_ids)
+        return Response(participation_report(matrix), status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated], url_path='analytics')
     def get_analytics(self, request):
         """
         Get analytics data for admin dashboard.
         Query params: start_date, end_date, week_id, month, year, devotee_id (optional)
+        source=live computes the same payload from DailyActivity instead of the rollups.
         """
         # Check if user is admin
         if not (request.user.is_staff or request.user.is_superuser):
@@ -518,16 +697,17 @@ class AdminViewSet(viewsets.ViewSet):
         year = request.query_params.get('year')
         devotee_id = request.query_params.get('devotee_id')
         
-        # Base queryset
-        daily_activities = DailyActivity.objects.all()
-        monthly_activities = MonthlyActivity.objects.all()
+        # Rollup rows are scoped to one devotee, or to user=None for everyone
+        scope = Q(user__isnull=True)
+        date_range = None
+        devotee = None
+        week_obj = None
         
         # Filter by devotee if provided
         if devotee_id:
             try:
                 devotee = User.objects.get(pk=devotee_id, is_staff=False, is_superuser=False)
-                daily_activities = daily_activities.filter(user=devotee)
-                monthly_activities = monthly_activities.filter(user=devotee)
+                scope = Q(user=devotee)
             except User.DoesNotExist:
                 return Response({"error": "Devotee not found."}, status=404)
         
@@ -536,127 +716,49 @@ class AdminViewSet(viewsets.ViewSet):
             try:
                 start = date.fromisoformat(start_date)
                 end = date.fromisoformat(end_date)
-                daily_activities = daily_activities.filter(date__range=[start, end])
+                date_range = [start, end]
             except ValueError:
                 return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
         
         if week_id:
             try:
                 week_obj = Week.objects.get(id=week_id)
-                daily_activities = daily_activities.filter(week=week_obj)
             except Week.DoesNotExist:
                 return Response({"error": "Week not found."}, status=404)
+            if date_range:
+                date_range = [max(date_range[0], week_obj.start_date), min(date_range[1], week_obj.end_date)]
+            else:
+                date_range = [week_obj.start_date, week_obj.end_date]
         
         if month:
             try:
                 month = int(month)
                 if month < 1 or month > 12:
                     return Response({"error": "Invalid month. Must be 1-12."}, status=400)
-                daily_activities = daily_activities.filter(date__month=month)
-                monthly_activities = monthly_activities.filter(month=month)
             except ValueError:
                 return Response({"error": "Invalid month format."}, status=400)
         
         if year:
             try:
                 year = int(year)
-                daily_activities = daily_activities.filter(date__year=year)
-                monthly_activities = monthly_activities.filter(year=year)
             except ValueError:
                 return Response({"error": "Invalid year format."}, status=400)
         
-        # Calculate statistics
-        total_activities = daily_activities.count()
-        total_devotees = User.objects.filter(is_staff=False, is_superuser=False).count()
-        
-        # Activity completion rates
-        hearing_completed = daily_activities.filter(daily_hearing='Completed').count()
-        reading_completed = daily_activities.filter(daily_reading='Completed').count()
-        total_chanting_rounds = daily_activities.aggregate(total=Sum('daily_chanting'))['total'] or 0
-        avg_chanting_rounds = daily_activities.aggregate(avg=Avg('daily_chanting'))['avg'] or 0
-        
-        # Attendance statistics
-        sport_attended = daily_activities.filter(sport_session_attendance='Attended').count()
-        sport_total = daily_activities.exclude(sport_session_attendance='No Session Today').count()
-        
-        # Group by date for chart data
-        daily_stats = defaultdict(lambda: {
-            'date': None,
-            'hearing_completed': 0,
-            'reading_completed': 0,
-            'chanting_rounds': 0,
-            'activities_count': 0
-        })
-        
-        for activity in daily_activities:
-            date_str = str(activity.date)
-            if date_str not in daily_stats:
-                daily_stats[date_str]['date'] = date_str
-            daily_stats[date_str]['hearing_completed'] += 1 if activity.daily_hearing == 'Completed' else 0
-            daily_stats[date_str]['reading_completed'] += 1 if activity.daily_reading == 'Completed' else 0
-            daily_stats[date_str]['chanting_rounds'] += activity.daily_chanting
-            daily_stats[date_str]['activities_count'] += 1
-        
-        # Group by week for weekly chart
-        weekly_stats = defaultdict(lambda: {
-            'week_name': None,
-            'activities_count': 0,
-            'hearing_completed': 0,
-            'reading_completed': 0,
-            'chanting_rounds': 0
-        })
-        
-        for activity in daily_activities.select_related('week'):
-            week_id = activity.week.id
-            if week_id not in weekly_stats:
-                weekly_stats[week_id]['week_name'] = activity.week.name
-            weekly_stats[week_id]['activities_count'] += 1
-            weekly_stats[week_id]['hearing_completed'] += 1 if activity.daily_hearing == 'Completed' else 0
-            weekly_stats[week_id]['reading_completed'] += 1 if activity.daily_reading == 'Completed' else 0
-            weekly_stats[week_id]['chanting_rounds'] += activity.daily_chanting
-        
-        # Group by month for monthly chart
-        monthly_stats = defaultdict(lambda: {
-            'month': None,
-            'year': None,
-            'activities_count': 0,
-            'hearing_completed': 0,
-            'reading_completed': 0,
-            'chanting_rounds': 0
-        })
-        
-        for activity in daily_activities:
-            month_key = f"{activity.date.year}-{activity.date.month}"
-            if month_key not in monthly_stats:
-                monthly_stats[month_key]['month'] = activity.date.month
-                monthly_stats[month_key]['year'] = activity.date.year
-            monthly_stats[month_key]['activities_count'] += 1
-            monthly_stats[month_key]['hearing_completed'] += 1 if activity.daily_hearing == 'Completed' else 0
-            monthly_stats[month_key]['reading_completed'] += 1 if activity.daily_reading == 'Completed' else 0
-            monthly_stats[month_key]['chanting_rounds'] += activity.daily_chanting
+        if request.query_params.get('source') == 'live':
+            daily_activities = DailyActivity.objects.all()
+            if devotee:
+                daily_activities = daily_activities.filter(user=devotee)
+            if week_obj:
+                daily_activities = daily_activities.filter(week=week_obj)
+            if date_range:
+                daily_activities = daily_activities.filter(date__range=date_range)
+            if month:
+                daily_activities = daily_activities.filter(date__month=month)
+            if year:
+                daily_activities = daily_activities.filter(date__year=year)
+            analytics = activity_analytics(daily_activities)
+        else:
+            analytics = analytics_from_rollups(scope, date_range=date_range, month=month, year=year)
+        analytics["summary"]["total_devotees"] = User.objects.filter(is_staff=False, is_superuser=False).count()
         
-        return Response({
-            "summary": {
-                "total_activities": total_activities,
-                "total_devotees": total_devotees,
-                "hearing_completion_rate": round((hearing_completed / total_activities * 100) if total_activities > 0 else 0, 2),
-                "reading_completion_rate": round((reading_completed / total_activities * 100) if total_activities > 0 else 0, 2),
-                "total_chanting_rounds": total_chanting_rounds,
-                "avg_chanting_rounds": round(avg_chanting_rounds, 2),
-                "sport_attendance_rate": round((sport_attended / sport_total * 100) if sport_total > 0 else 0, 2),
-            },
-            "daily_chart_data": sorted(list(daily_stats.values()), key=lambda x: x['date']),
-            "weekly_chart_data": list(weekly_stats.values()),
-            "monthly_chart_data": sorted(list(monthly_stats.values()), key=lambda x: (x['year'], x['month'])),
-        }, status=status.HTTP_200_OK)
-
-
-
-
-
-
-
-
-
-
-
+        return Response(analytics, status=status.HTTP_200_OK)
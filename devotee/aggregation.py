@@ -0,0 +1,123 @@
+"""
+Grouped SQL aggregation over DailyActivity.
+
+Everything here runs conditional Count/Sum queries grouped by day, week or
+month and returns plain dicts, so no model instances are built and the number
+of queries does not depend on how many rows match.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+METRIC_FIELDS = (
+    'activities_count',
+    'hearing_completed',
+    'reading_completed',
+    'chanting_rounds',
+    'sport_attended',
+    'sport_sessions',
+)
+
+ACTIVITY_AGGREGATES = {
+    'activities_count': Count('id'),
+    'hearing_completed': Count('id', filter=Q(daily_hearing='Completed')),
+    'reading_completed': Count('id', filter=Q(daily_reading='Completed')),
+    'chanting_rounds': Sum('daily_chanting'),
+    'sport_attended': Count('id', filter=Q(sport_session_attendance='Attended')),
+    'sport_sessions': Count('id', filter=~Q(sport_session_attendance='No Session Today')),
+}
+
+# Expression each period is grouped by, and how a grouped row becomes its key
+PERIODS = {
+    'day': (F('date'), lambda bucket: bucket),
+    'week': (TruncWeek('date'), lambda bucket: bucket),
+    'month': (TruncMonth('date'), lambda bucket: (bucket.year, bucket.month)),
+}
+
+
+def empty_metrics():
+    return dict.fromkeys(METRIC_FIELDS, 0)
+
+
+def _metrics(row):
+    return {field: row[field] or 0 for field in METRIC_FIELDS}
+
+
+def aggregate_metrics(queryset):
+    """Totals of every metric over a DailyActivity queryset in one query"""
+    return _metrics(queryset.order_by().aggregate(**ACTIVITY_AGGREGATES))
+
+
+def grouped_metrics(queryset, period, by_user=False):
+    """
+    Metrics of a DailyActivity queryset grouped by 'day', 'week' or 'month'.
+    Returns {key: metrics} where key is the date, the week's Monday or
+    (year, month); with by_user the key is prefixed with the user id.
+    """
+    expression, to_key = PERIODS[period]
+    group_by = {'bucket': expression}
+    if by_user:
+        group_by['bucket_user'] = F('user_id')
+    rows = queryset.order_by().annotate(**group_by).values(*group_by).annotate(**ACTIVITY_AGGREGATES)
+
+    grouped = {}
+    for row in rows:
+        key = to_key(row['bucket'])
+        grouped[(row['bucket_user'], key) if by_user else key] = _metrics(row)
+    return grouped
+
+
+def _percent(part, whole):
+    return round((part / whole * 100) if whole > 0 else 0, 2)
+
+
+def build_summary(totals):
+    """Admin analytics summary block from metric totals"""
+    total_activities = totals['activities_count']
+    return {
+        "total_activities": total_activities,
+        "hearing_completion_rate": _percent(totals['hearing_completed'], total_activities),
+        "reading_completion_rate": _percent(totals['reading_completed'], total_activities),
+        "total_chanting_rounds": totals['chanting_rounds'],
+        "avg_chanting_rounds": round(totals['chanting_rounds'] / total_activities, 2) if total_activities else 0,
+        "sport_attendance_rate": _percent(totals['sport_attended'], totals['sport_sessions']),
+    }
+
+
+def _chart_metrics(metrics):
+    return {
+        'activities_count': metrics['activities_count'],
+        'hearing_completed': metrics['hearing_completed'],
+        'reading_completed': metrics['reading_completed'],
+        'chanting_rounds': metrics['chanting_rounds'],
+    }
+
+
+def build_chart_data(days, weeks, months):
+    """Daily, weekly and monthly chart series from grouped metrics, oldest first"""
+    return {
+        "daily_chart_data": [
+            {'date': str(day), **_chart_metrics(metrics)}
+            for day, metrics in sorted(days.items()) if metrics['activities_count']
+        ],
+        "weekly_chart_data": [
+            {'week_name': f"Week of {week_start}", 'start_date': str(week_start), **_chart_metrics(metrics)}
+            for week_start, metrics in sorted(weeks.items()) if metrics['activities_count']
+        ],
+        "monthly_chart_data": [
+            {'month': month, 'year': year, **_chart_metrics(metrics)}
+            for (year, month), metrics in sorted(months.items()) if metrics['activities_count']
+        ],
+    }
+
+
+def activity_analytics(queryset):
+    """Summary and all three chart series for a DailyActivity queryset (four queries)"""
+    return {
+        "summary": build_summary(aggregate_metrics(queryset)),
+        **build_chart_data(
+            grouped_metrics(queryset, 'day'),
+            grouped_metrics(queryset, 'week'),
+            grouped_metrics(queryset, 'month'),
+        ),
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DevoteeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'devotee'
+
+    def ready(self):
+        from . import signals, sqlite  # noqa: F401
@@ -0,0 +1,135 @@
+"""
+Async variants of the public QR quick-entry views, for ASGI deployments.
+
+They answer exactly like validate_qr_token and submit_quick_entry in
+views.py, but wait on the database with the async ORM API instead of
+holding a worker thread, so one ASGI worker process can keep many phones'
+requests in flight at once. Plain Django views: DRF views are sync only.
+"""
+import asyncio
+import json
+from datetime import date
+from weakref import WeakKeyDictionary
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from authentication.qr_tokens import aresolve_token
+from .models import DailyActivity
+from .quick_entry import TOKEN_REQUIRED, entry_changes, queued_payload, submission_payload, token_error, validation_payload
+from .schema import schema_for
+from .serializers import DailyActivitySerializer
+from .sqlite import retry_on_locked
+from .weeks import week_for
+from .write_buffer import quick_entry_buffer
+
+
+# Quick entries saved at once per process. Each ASGI request runs its ORM
+# calls on a thread of its own and SQLite takes one writer at a time, so
+# more writers only fight over the database lock.
+MAX_CONCURRENT_WRITES = getattr(settings, 'QUICK_ENTRY_ASYNC_WRITERS', 1)
+
+_write_slots = WeakKeyDictionary()
+
+
+def _write_slot():
+    """Semaphore limiting concurrent quick-entry writes on the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _write_slots:
+        _write_slots[loop] = asyncio.Semaphore(MAX_CONCURRENT_WRITES)
+    return _write_slots[loop]
+
+
+def _response(payload, status_code=status.HTTP_200_OK):
+    # DRF's encoder, so the JSON matches the sync views'
+    return JsonResponse(payload, status=status_code, encoder=JSONEncoder)
+
+
+def _request_data(request):
+    """Submitted fields from a JSON or form body, like DRF's request.data; None if unparsable"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+@csrf_exempt
+@require_GET
+async def validate_qr_token(request, token):
+    """
+    Validate QR token and return today's editable fields and existing data
+    No authentication required - uses token instead
+    """
+    if not token:
+        return _response(TOKEN_REQUIRED, status.HTTP_400_BAD_REQUEST)
+
+    user = await aresolve_token(token)
+    error = token_error(user)
+    if error:
+        return _response(*error)
+
+    today = date.today()
+    day_schema = schema_for(today)
+
+    # Get existing activity for today if any
+    existing_activity = None
+    activity = await DailyActivity.objects.select_related('week').filter(user=user, date=today).afirst()
+    if activity is not None:
+        activity.user = user  # already resolved from the token, avoids a users lookup
+        existing_activity = DailyActivitySerializer(activity).data
+
+    pending = quick_entry_buffer.pending(user.pk, today) if quick_entry_buffer.enabled else None
+    return _response(validation_payload(user, today, day_schema, existing_activity, pending))
+
+
+@csrf_exempt
+@require_POST
+async def submit_quick_entry(request, token):
+    """
+    Submit today's activities via QR token (no authentication required)
+    """
+    if not token:
+        return _response(TOKEN_REQUIRED, status.HTTP_400_BAD_REQUEST)
+
+    user = await aresolve_token(token)
+    error = token_error(user)
+    if error:
+        return _response(*error)
+
+    data = _request_data(request)
+    if data is None:
+        return _response({"detail": "JSON parse error."}, status.HTTP_400_BAD_REQUEST)
+
+    today = date.today()
+    day_schema = schema_for(today)
+
+    # Only today's fields, with valid values
+    update_data, error = entry_changes(day_schema, data)
+    if error:
+        return _response(*error)
+
+    if quick_entry_buffer.enabled:
+        # Acknowledged once journaled (a file write, so off the event loop), written with the next flush
+        values = await sync_to_async(quick_entry_buffer.submit, thread_sensitive=False)(user.pk, today, update_data)
+        return _response(*queued_payload(day_schema, today, values))
+
+    async with _write_slot():
+        # The calendar only queries when a week is missing
+        week_obj = await sync_to_async(week_for)(today)
+
+        activity, created = await sync_to_async(retry_on_locked(DailyActivity.objects.update_or_create))(
+            user=user,
+            date=today,
+            defaults={**update_data, "week": week_obj},
+        )
+    activity.user = user  # already resolved from the token, avoids a users lookup
+
+    return _response(*submission_payload(day_schema, DailyActivitySerializer(activity).data, created))
@@ -0,0 +1,533 @@
+"""
+Synthetic-load benchmark of the HTTP API.
+
+seed_dataset() fills a scratch database with devotees and a realistic
+history of daily and monthly activities. run_benchmark() then drives every
+route of devotee/urls.py and authentication/urls.py through the Django test
+client and reports, per endpoint, latency percentiles, the SQL query count
+and the peak Python memory of one request.
+"""
+import logging
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import count
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver, reverse
+
+from authentication.models import User
+from authentication.qr_tokens import hash_token, token_cache
+from authentication.revocation import revocations
+from authentication.search import rebuild_search_index
+from authentication.token_auth import ClaimsRefreshToken, user_cache
+
+from . import response_cache
+from .models import DailyActivity, MonthlyActivity
+from .leaderboard import rebuild_leaderboard
+from .rollups import rebuild_rollups
+from .schema import WEEKDAY_SCHEMAS
+from .serializers import DailyActivitySerializer, daily_activity_rows
+from .statistics import rebuild_statistics
+from .streaks import rebuild_streaks
+from .weeks import calendar, link_calendar_weeks
+
+
+BENCHMARK_PASSWORD = 'Bench@12345'
+BOOKS = ('Bhagavad Gita', 'Srimad Bhagavatam', 'Nectar of Devotion', 'Sri Isopanisad', 'Teachings of Lord Caitanya')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _daily_values(rng, day, diligence, target_rounds):
+    """Field values of one logged day for a devotee of the given habits"""
+    def status(p, yes, no):
+        return yes if rng.random() < p else no
+
+    values = {
+        'daily_hearing': status(diligence, 'Completed', 'Not Completed'),
+        'daily_reading': status(diligence * 0.8, 'Completed', 'Not Completed'),
+        'daily_chanting': max(0, round(rng.gauss(target_rounds, target_rounds * 0.25))),
+        'sport_session_attendance': (
+            'No Session Today' if rng.random() < 0.3 else status(diligence, 'Attended', 'Not Attended')
+        ),
+    }
+    for field in WEEKDAY_SCHEMAS[day.weekday()].editable_fields:
+        if field in values:
+            continue
+        if field == 'weekly_discussion_session':
+            values[field] = rng.choice(('Online', 'Offline', 'Not Attended'))
+        elif field in ('weekly_sloka_audio_posted', 'weekly_seva'):
+            values[field] = status(diligence * 0.7, 'Yes', 'No')
+        else:
+            values[field] = status(diligence * 0.7, 'Attended', 'Not Attended')
+    return values
+
+
+def _monthly_values(rng, diligence):
+    book_status = rng.choices(('Completed', 'Partially Completed', 'Not Completed'), (1, 2, 3))[0]
+    return {
+        'one_to_one_meeting_conducted_with_counselor': 'Yes' if rng.random() < diligence else 'No',
+        'monthly_morning_program': 'Attended' if rng.random() < diligence else 'Not Attended',
+        'monthly_book_completed': book_status,
+        'book_name': rng.choice(BOOKS) if book_status != 'Not Completed' else '',
+        'book_discussion_attended': 'Attended' if rng.random() < diligence * 0.6 else 'Not Attended',
+    }
+
+
+@contextmanager
+def scratch_database(path=None):
+    """
+    Run the block against a fresh, migrated database created the way the
+    test runner does it (SQLite in memory unless a file path is given).
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.settings_dict['TEST']['NAME'] = path
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    calendar.clear()
+    token_cache.clear()
+    user_cache.clear()
+    response_cache.clear()
+    revocations.clear()
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        calendar.clear()
+        token_cache.clear()
+        user_cache.clear()
+        response_cache.clear()
+        revocations.clear()
+
+
+def seed_dataset(devotees=50, years=1, seed=0, batch_size=2000):
+    """
+    Create `devotees` devotees and an admin with up to `years` of history
+    ending today. Devotee 0 has the full history, the others joined at random
+    points. Derived tables are rebuilt at the end. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    password = make_password(BENCHMARK_PASSWORD)
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+
+    User.objects.create(
+        username='9000000000', first_name='Bench', last_name='Admin', email='admin@bench.local',
+        password=password, is_staff=True, is_active=True,
+    )
+    users = User.objects.bulk_create([
+        User(
+            username=f'9{index + 1:09d}', first_name=rng.choice(('Ram', 'Radha', 'Krishna', 'Gopal', 'Lalita', 'Madhav')),
+            last_name=f'Devotee{index}', email=f'devotee{index}@bench.local', password=password, is_active=True,
+        )
+        for index in range(devotees)
+    ])
+
+    activities = []
+    monthly = []
+    created = Counter()
+    for index, user in enumerate(users):
+        diligence = rng.betavariate(4, 2)
+        target_rounds = rng.choice((4, 8, 16, 16, 16, 25))
+        day = first_day if index == 0 else first_day + timedelta(days=rng.randrange(365 * years))
+        months = set()
+        while day <= today:
+            if rng.random() < diligence:
+                activities.append(DailyActivity(
+                    user=user, date=day, week_id=calendar.week_for(day).pk,
+                    **_daily_values(rng, day, diligence, target_rounds),
+                ))
+                months.add((day.year, day.month))
+            day += timedelta(days=1)
+        monthly.extend(
+            MonthlyActivity(user=user, year=year, month=month, **_monthly_values(rng, diligence))
+            for year, month in sorted(months) if rng.random() < 0.8
+        )
+        if len(activities) >= batch_size:
+            created['daily_activities'] += len(DailyActivity.objects.bulk_create(activities))
+            activities = []
+    created['daily_activities'] += len(DailyActivity.objects.bulk_create(activities, batch_size=batch_size))
+    created['monthly_activities'] = len(MonthlyActivity.objects.bulk_create(monthly, batch_size=batch_size))
+    link_calendar_weeks(monthly)
+
+    # bulk_create skips the signals that keep these up to date
+    rebuild_rollups()
+    rebuild_leaderboard()
+    for user in users:
+        rebuild_statistics(user.pk)
+        rebuild_streaks(user.pk)
+    rebuild_search_index()
+
+    created['devotees'] = len(users)
+    return dict(created)
+
+
+class Fixture:
+    """Users, tokens and rows the endpoint definitions build their requests from"""
+
+    def __init__(self):
+        self.admin = User.objects.get(is_staff=True, username='9000000000')
+        # The devotee with the longest history
+        self.devotee = User.objects.filter(is_staff=False).order_by('pk').first()
+        self.other = User.objects.filter(is_staff=False).order_by('-pk').first()
+        self.qr_token = 'benchmark-qr-token'
+        User.objects.filter(pk=self.devotee.pk).update(
+            qr_token_hash=hash_token(self.qr_token), qr_token_created_at=django.utils.timezone.now()
+        )
+        self._tokens = {}
+        self._sequence = count()
+
+    def headers(self, user):
+        if user is None:
+            return {}
+        if user.pk not in self._tokens:
+            self._tokens[user.pk] = ClaimsRefreshToken.for_user(user)
+        return {'HTTP_AUTHORIZATION': f'Bearer {self._tokens[user.pk].access_token}'}
+
+    def refresh_token(self, user):
+        return str(ClaimsRefreshToken.for_user(user))
+
+    def unique(self):
+        return next(self._sequence)
+
+    def new_devotee(self, with_history=False):
+        index = self.unique()
+        user = User.objects.create(
+            username=f'8{index:09d}', first_name='Temp', last_name=f'Devotee{index}',
+            email=f'temp{index}@bench.local', password=make_password(None), is_active=True,
+        )
+        if with_history:
+            today = date.today()
+            for offset in range(7):
+                day = today - timedelta(days=offset)
+                DailyActivity.objects.create(user=user, date=day, week=calendar.week_for(day), daily_chanting=16)
+        return user
+
+    def activity(self, user=None):
+        return DailyActivity.objects.filter(user=user or self.devotee).order_by('-date').first()
+
+    def monthly(self):
+        return MonthlyActivity.objects.filter(user=self.devotee).first()
+
+    def spare_day(self):
+        """A day of the current week the devotee has a row for, recreated if needed"""
+        today = date.today()
+        activity, _ = DailyActivity.objects.get_or_create(
+            user=self.devotee, date=today, defaults={'week': calendar.week_for(today)}
+        )
+        return activity
+
+
+Call = namedtuple('Call', 'path data user', defaults=(None, None))
+Endpoint = namedtuple('Endpoint', 'label url_name method build')
+
+
+def _today():
+    return str(date.today())
+
+
+def _endpoints():
+    def url(name, **kwargs):
+        return reverse(name, kwargs=kwargs)
+
+    return [
+        # devotee/urls.py, daily activity
+        Endpoint('daily-activity list', 'daily-activity-list', 'GET',
+                 lambda fx: Call(url('daily-activity-list'), user=fx.devotee)),
+        Endpoint('daily-activity create', 'daily-activity-list', 'POST',
+                 lambda fx: Call(url('daily-activity-list'), {'date': _today(), 'daily_chanting': 4}, fx.new_devotee())),
+        Endpoint('daily-activity retrieve', 'daily-activity-detail', 'GET',
+                 lambda fx: Call(url('daily-activity-detail', pk=fx.activity().pk), user=fx.devotee)),
+        Endpoint('daily-activity update', 'daily-activity-detail', 'PATCH',
+                 lambda fx: Call(url('daily-activity-detail', pk=fx.spare_day().pk), {'daily_chanting': 16}, fx.devotee)),
+        Endpoint('daily-activity destroy', 'daily-activity-detail', 'DELETE',
+                 lambda fx: Call(url('daily-activity-detail', pk=fx.spare_day().pk), user=fx.devotee)),
+        Endpoint('daily-activity week-data', 'daily-activity-get-week-data', 'GET',
+                 lambda fx: Call(url('daily-activity-get-week-data'), user=fx.devotee)),
+        Endpoint('daily-activity add-or-edit-day', 'daily-activity-add-or-edit-day', 'POST',
+                 lambda fx: Call(url('daily-activity-add-or-edit-day'),
+                                 {'date': _today(), 'daily_chanting': 16, 'daily_hearing': 'Completed'}, fx.devotee)),
+        Endpoint('daily-activity add-or-edit-week', 'daily-activity-add-or-edit-week', 'POST',
+                 lambda fx: Call(url('daily-activity-add-or-edit-week'), {'days': [
+                     {'date': str(date.today() - timedelta(days=offset)), 'daily_chanting': 16}
+                     for offset in range(date.today().weekday() + 1)
+                 ]}, fx.devotee)),
+        Endpoint('daily-activity delete-day', 'daily-activity-delete-day', 'DELETE',
+                 lambda fx: Call(url('daily-activity-delete-day', pk=fx.spare_day().pk), user=fx.devotee)),
+        Endpoint('daily-activity filter', 'daily-activity-filter-activities', 'GET',
+                 lambda fx: Call(url('daily-activity-filter-activities'), user=fx.devotee)),
+        Endpoint('daily-activity filter?year', 'daily-activity-filter-activities', 'GET',
+                 lambda fx: Call(url('daily-activity-filter-activities') + f'?year={date.today().year}', user=fx.devotee)),
+        Endpoint('daily-activity filter?stream', 'daily-activity-filter-activities', 'GET',
+                 lambda fx: Call(url('daily-activity-filter-activities') + '?stream=true', user=fx.devotee)),
+        Endpoint('daily-activity chanting-round-count', 'daily-activity-get-chanting-round-count', 'GET',
+                 lambda fx: Call(url('daily-activity-get-chanting-round-count'), user=fx.devotee)),
+
+        # devotee/urls.py, monthly activity
+        Endpoint('monthly-activity list', 'monthly-activity-list', 'GET',
+                 lambda fx: Call(url('monthly-activity-list'), user=fx.devotee)),
+        Endpoint('monthly-activity retrieve', 'monthly-activity-detail', 'GET',
+                 lambda fx: Call(url('monthly-activity-detail', pk=fx.monthly().pk), user=fx.devotee)),
+        Endpoint('monthly-activity current-month', 'monthly-activity-get-current-month', 'GET',
+                 lambda fx: Call(url('monthly-activity-get-current-month'), user=fx.devotee)),
+        Endpoint('monthly-activity get-month', 'monthly-activity-get-month-activity', 'GET',
+                 lambda fx: Call(url('monthly-activity-get-month-activity')
+                                 + f'?month={fx.monthly().month}&year={fx.monthly().year}', user=fx.devotee)),
+        Endpoint('monthly-activity add-or-edit', 'monthly-activity-add-or-edit-monthly', 'POST',
+                 lambda fx: Call(url('monthly-activity-add-or-edit-monthly'), {
+                     'month': date.today().month, 'year': date.today().year, 'monthly_morning_program': 'Attended',
+                 }, fx.devotee)),
+        Endpoint('monthly-activity filter', 'monthly-activity-filter-monthly-activities', 'GET',
+                 lambda fx: Call(url('monthly-activity-filter-monthly-activities'), user=fx.devotee)),
+
+        # devotee/urls.py, QR quick entry (no authentication)
+        Endpoint('quick-entry validate', 'validate-qr-token', 'GET',
+                 lambda fx: Call(url('validate-qr-token', token=fx.qr_token))),
+        Endpoint('quick-entry submit', 'submit-quick-entry', 'POST',
+                 lambda fx: Call(url('submit-quick-entry', token=fx.qr_token), {'daily_chanting': 16})),
+        Endpoint('quick-entry async validate', 'validate-qr-token-async', 'GET',
+                 lambda fx: Call(url('validate-qr-token-async', token=fx.qr_token))),
+        Endpoint('quick-entry async submit', 'submit-quick-entry-async', 'POST',
+                 lambda fx: Call(url('submit-quick-entry-async', token=fx.qr_token), {'daily_chanting': 16})),
+
+        # authentication/urls.py, devotee account
+        Endpoint('auth register-user', 'auth-register-user', 'POST',
+                 lambda fx: (lambda index: Call(url('auth-register-user'), {
+                     'username': f'7{index:09d}', 'first_name': 'New', 'last_name': 'Devotee',
+                     'email': f'new{index}@bench.local', 'password': BENCHMARK_PASSWORD, 'confirm_password': BENCHMARK_PASSWORD,
+                 }))(fx.unique())),
+        Endpoint('auth login', 'auth-login', 'POST',
+                 lambda fx: Call(url('auth-login'), {'username': fx.devotee.username, 'password': BENCHMARK_PASSWORD})),
+        Endpoint('auth change-password', 'auth-change-password', 'POST',
+                 lambda fx: Call(url('auth-change-password'), {
+                     'old_password': BENCHMARK_PASSWORD, 'new_password': BENCHMARK_PASSWORD,
+                     'confirm_new_password': BENCHMARK_PASSWORD,
+                 }, fx.devotee)),
+        Endpoint('auth logout', 'auth-logout-user', 'POST',
+                 lambda fx: Call(url('auth-logout-user'), {'refresh': fx.refresh_token(fx.devotee)}, fx.devotee)),
+        Endpoint('auth token-refresh', 'auth-token-refresh', 'POST',
+                 lambda fx: Call(url('auth-token-refresh'), {'refresh': fx.refresh_token(fx.devotee)})),
+        Endpoint('auth profile', 'auth-get-profile', 'GET',
+                 lambda fx: Call(url('auth-get-profile'), user=fx.devotee)),
+        Endpoint('auth update-profile', 'auth-update-profile', 'PATCH',
+                 lambda fx: Call(url('auth-update-profile'), {'first_name': fx.devotee.first_name}, fx.devotee)),
+        Endpoint('auth delete-profile', 'auth-delete-profile', 'DELETE',
+                 lambda fx: Call(url('auth-delete-profile'), user=fx.new_devotee(with_history=True))),
+        Endpoint('auth delete-sadana-data', 'auth-delete-sadana-data', 'DELETE',
+                 lambda fx: Call(url('auth-delete-sadana-data'), user=fx.new_devotee(with_history=True))),
+        Endpoint('auth spiritual-growth', 'auth-get-spiritual-growth', 'GET',
+                 lambda fx: Call(url('auth-get-spiritual-growth'), user=fx.devotee)),
+        Endpoint('auth leaderboard-rank', 'auth-get-leaderboard-rank', 'GET',
+                 lambda fx: Call(url('auth-get-leaderboard-rank'), user=fx.devotee)),
+        Endpoint('auth generate-qr-token', 'auth-generate-qr-token', 'POST',
+                 lambda fx: Call(url('auth-generate-qr-token'), user=fx.other)),
+
+        # authentication/urls.py, admin
+        Endpoint('admin admin-login', 'admin-admin-login', 'POST',
+                 lambda fx: Call(url('admin-admin-login'), {'username': fx.admin.username, 'password': BENCHMARK_PASSWORD})),
+        Endpoint('admin devotees', 'admin-devotees', 'GET',
+                 lambda fx: Call(url('admin-devotees'), user=fx.admin)),
+        Endpoint('admin devotees?search', 'admin-devotees', 'GET',
+                 lambda fx: Call(url('admin-devotees') + '?search=ram', user=fx.admin)),
+        Endpoint('admin devotee-detail', 'admin-devotee-detail', 'GET',
+                 lambda fx: Call(url('admin-devotee-detail', pk=fx.devotee.pk), user=fx.admin)),
+        Endpoint('admin filter-activities', 'admin-filter-devotee-activities', 'GET',
+                 lambda fx: Call(url('admin-filter-devotee-activities', pk=fx.devotee.pk), user=fx.admin)),
+        Endpoint('admin export?csv', 'admin-export', 'GET',
+                 lambda fx: Call(url('admin-export') + '?output=csv', user=fx.admin)),
+        Endpoint('admin export?ndjson', 'admin-export', 'GET',
+                 lambda fx: Call(url('admin-export') + '?output=ndjson&dataset=all', user=fx.admin)),
+        Endpoint('admin quick-entry-buffer', 'admin-quick-entry-buffer-metrics', 'GET',
+                 lambda fx: Call(url('admin-quick-entry-buffer-metrics'), user=fx.admin)),
+        Endpoint('admin response-cache', 'admin-response-cache-metrics', 'GET',
+                 lambda fx: Call(url('admin-response-cache-metrics'), user=fx.admin)),
+        Endpoint('admin leaderboard', 'admin-leaderboard', 'GET',
+                 lambda fx: Call(url('admin-leaderboard'), user=fx.admin)),
+        Endpoint('admin leaderboard?week', 'admin-leaderboard', 'GET',
+                 lambda fx: Call(url('admin-leaderboard') + '?board=week_rounds&limit=20', user=fx.admin)),
+        Endpoint('admin participation-matrix', 'admin-participation-matrix', 'GET',
+                 lambda fx: Call(url('admin-participation-matrix'), user=fx.admin)),
+        Endpoint('admin participation-matrix?year', 'admin-participation-matrix', 'GET',
+                 lambda fx: Call(url('admin-participation-matrix') + f'?start_date={date.today() - timedelta(days=364)}', user=fx.admin)),
+        Endpoint('admin analytics', 'admin-get-analytics', 'GET',
+                 lambda fx: Call(url('admin-get-analytics'), user=fx.admin)),
+        Endpoint('admin analytics?year', 'admin-get-analytics', 'GET',
+                 lambda fx: Call(url('admin-get-analytics') + f'?year={date.today().year}', user=fx.admin)),
+        Endpoint('admin analytics?source=live', 'admin-get-analytics', 'GET',
+                 lambda fx: Call(url('admin-get-analytics') + '?source=live', user=fx.admin)),
+    ]
+
+
+def route_names():
+    """Names of every route of devotee/urls.py and authentication/urls.py"""
+    from authentication import urls as authentication_urls
+    from devotee import urls as devotee_urls
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name and pattern.name != 'api-root':
+                yield pattern.name
+
+    return set(walk(devotee_urls.urlpatterns)) | set(walk(authentication_urls.urlpatterns))
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list"""
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _request(client, fx, endpoint):
+    """Send one request, returns (call, seconds, response)"""
+    call = endpoint.build(fx)
+    request = getattr(client, endpoint.method.lower())
+    kwargs = fx.headers(call.user)
+    if call.data is not None:
+        kwargs.update(data=call.data, content_type='application/json')
+    start = time.perf_counter()
+    response = request(call.path, **kwargs)
+    # Streaming responses do their work while being consumed
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return call, time.perf_counter() - start, response
+
+
+def measure(client, fx, endpoint, repeat, warmup=1):
+    """Timings of `repeat` requests, then one instrumented request for queries and memory"""
+    latencies = []
+    statuses = Counter()
+    for iteration in range(warmup + repeat):
+        call, elapsed, response = _request(client, fx, endpoint)
+        if iteration >= warmup:
+            latencies.append(elapsed * 1000)
+            statuses[response.status_code] += 1
+
+    # Query capture and tracemalloc both slow requests down, so they get their own run
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            call, elapsed, response = _request(client, fx, endpoint)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'method': endpoint.method,
+        'path': call.path,
+        'status': statuses.most_common(1)[0][0],
+        'statuses': {str(code): hits for code, hits in sorted(statuses.items())},
+        **{f'p{p}_ms': round(percentile(latencies, p), 3) for p in PERCENTILES},
+        'max_ms': round(latencies[-1], 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries': len(queries.captured_queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(repeat=20, only=None, dataset=None):
+    """Report of every endpoint (or those whose label contains one of `only`)"""
+    fx = Fixture()
+    client = Client(raise_request_exception=False)
+    endpoints = _endpoints()
+    selected = [e for e in endpoints if not only or any(name in e.label for name in only)]
+
+    # Failing endpoints are reported by status code, not with a traceback per request
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    try:
+        results = {endpoint.label: measure(client, fx, endpoint, repeat) for endpoint in selected}
+    finally:
+        request_logger.setLevel(level)
+
+    return {
+        'meta': {
+            'timestamp': django.utils.timezone.now().isoformat(),
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': repeat,
+            'dataset': dataset,
+        },
+        'endpoints': results,
+        'uncovered_routes': sorted(route_names() - {e.url_name for e in endpoints}),
+    }
+
+
+def compare_serializers(repeat=10):
+    """
+    Serialize the longest activity history with DailyActivitySerializer (as
+    the views used to, and with select_related) and with the values() fast
+    path. Returns the best time of each in ms; the outputs must be identical.
+    """
+    devotee = User.objects.filter(is_staff=False).order_by('pk').first()
+    queryset = DailyActivity.objects.filter(user=devotee).order_by('-date')
+
+    variants = {
+        'model_serializer': lambda: DailyActivitySerializer(queryset.all(), many=True).data,
+        'model_serializer_select_related': lambda: DailyActivitySerializer(
+            queryset.select_related('user', 'week'), many=True
+        ).data,
+        'row_serializer': lambda: daily_activity_rows.many(daily_activity_rows.rows(queryset)),
+    }
+    outputs = {name: [dict(item) for item in build()] for name, build in variants.items()}
+    reference = outputs['model_serializer']
+    mismatched = [name for name, output in outputs.items() if output != reference]
+    if mismatched:
+        raise AssertionError(f"Output differs from DailyActivitySerializer: {', '.join(mismatched)}")
+
+    timings = {}
+    for name, build in variants.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            build()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = round(best * 1000, 3)
+    return {
+        'rows': len(reference),
+        'best_ms': timings,
+        'speedup': {
+            name: round(timings[name] / timings['row_serializer'], 2)
+            for name in variants if name != 'row_serializer'
+        },
+    }
+
+
+def find_regressions(report, baseline, threshold=1.25):
+    """Endpoints whose median latency grew by more than `threshold`x or that run more queries"""
+    regressions = []
+    for label, result in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(label)
+        if before is None:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * threshold:
+            regressions.append(f"{label}: p50 {before['p50_ms']} ms -> {result['p50_ms']} ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{label}: queries {before['queries']} -> {result['queries']}")
+    return regressions
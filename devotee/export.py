@@ -0,0 +1,168 @@
+"""
+Bulk export of sadhana data as CSV or NDJSON.
+
+Rows are read with a chunked values_list() iterator and written one line at
+a time, so an export of any size is streamed with constant memory. Used by
+the admin export endpoint and the export_sadhana command.
+"""
+import csv
+import json
+from datetime import date
+
+from django.db.models import Q
+
+from .models import DailyActivity, MonthlyActivity
+from .streaming import ROW_CHUNK_SIZE
+from .weeks import calendar
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+DATASETS = ('daily', 'monthly', 'all')
+
+# Column name -> values_list() lookup
+DAILY_COLUMNS = {
+    'id': 'id',
+    'devotee_id': 'user_id',
+    'username': 'user__username',
+    'first_name': 'user__first_name',
+    'last_name': 'user__last_name',
+    'date': 'date',
+    'week_start': 'week__start_date',
+    **{
+        field.name: field.attname
+        for field in DailyActivity._meta.concrete_fields
+        if field.name not in ('id', 'user', 'week', 'date')
+    },
+}
+MONTHLY_COLUMNS = {
+    'id': 'id',
+    'devotee_id': 'user_id',
+    'username': 'user__username',
+    'first_name': 'user__first_name',
+    'last_name': 'user__last_name',
+    **{
+        field.name: field.attname
+        for field in MonthlyActivity._meta.concrete_fields
+        if field.name not in ('id', 'user')
+    },
+}
+
+
+def parse_filters(start_date=None, end_date=None, devotee_ids=None, week_id=None):
+    """
+    Validated export filters from raw strings. Raises ValueError with a
+    message for the caller to show.
+    """
+    filters = {}
+    try:
+        if start_date:
+            filters['start_date'] = date.fromisoformat(start_date)
+        if end_date:
+            filters['end_date'] = date.fromisoformat(end_date)
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+    if 'start_date' in filters and 'end_date' in filters and filters['start_date'] > filters['end_date']:
+        raise ValueError("start_date must not be after end_date.")
+
+    if devotee_ids:
+        try:
+            filters['devotee_ids'] = [int(devotee_id) for devotee_id in devotee_ids]
+        except ValueError:
+            raise ValueError("Invalid devotee id.")
+
+    if week_id:
+        try:
+            week = calendar.get(int(week_id))
+        except ValueError:
+            week = None
+        if week is None:
+            raise ValueError("Week not found.")
+        # A week narrows the date range
+        filters['start_date'] = max(filters.get('start_date', week.start_date), week.start_date)
+        filters['end_date'] = min(filters.get('end_date', week.end_date), week.end_date)
+    return filters
+
+
+def daily_queryset(start_date=None, end_date=None, devotee_ids=None):
+    queryset = DailyActivity.objects.all()
+    if devotee_ids:
+        queryset = queryset.filter(user_id__in=devotee_ids)
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    return queryset.order_by('user_id', 'date')
+
+
+def monthly_queryset(start_date=None, end_date=None, devotee_ids=None):
+    """Monthly activities of the months overlapping the date range"""
+    queryset = MonthlyActivity.objects.all()
+    if devotee_ids:
+        queryset = queryset.filter(user_id__in=devotee_ids)
+    if start_date:
+        queryset = queryset.filter(
+            Q(year__gt=start_date.year) | Q(year=start_date.year, month__gte=start_date.month)
+        )
+    if end_date:
+        queryset = queryset.filter(
+            Q(year__lt=end_date.year) | Q(year=end_date.year, month__lte=end_date.month)
+        )
+    return queryset.order_by('user_id', 'year', 'month')
+
+
+def _rows(queryset, columns):
+    return queryset.values_list(*columns.values()).iterator(chunk_size=ROW_CHUNK_SIZE)
+
+
+def _plain(value):
+    # Dates and datetimes as ISO 8601, the same in both formats
+    return value.isoformat() if isinstance(value, date) else value
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(dataset, filters):
+    """CSV of one dataset ('daily' or 'monthly'), one line at a time"""
+    columns, queryset = (
+        (DAILY_COLUMNS, daily_queryset(**filters)) if dataset == 'daily'
+        else (MONTHLY_COLUMNS, monthly_queryset(**filters))
+    )
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in _rows(queryset, columns):
+        yield writer.writerow(_plain(value) for value in row)
+
+
+def ndjson_lines(dataset, filters):
+    """One JSON object per line; with dataset 'all' daily rows come first, then monthly ones"""
+    parts = []
+    if dataset in ('daily', 'all'):
+        parts.append(('daily', DAILY_COLUMNS, daily_queryset(**filters)))
+    if dataset in ('monthly', 'all'):
+        parts.append(('monthly', MONTHLY_COLUMNS, monthly_queryset(**filters)))
+    for record_type, columns, queryset in parts:
+        names = ('type', *columns)
+        for row in _rows(queryset, columns):
+            record = dict(zip(names, (record_type, *map(_plain, row))))
+            yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def export_lines(export_format, dataset, filters):
+    """Lines of an export; raises ValueError for an unknown or unsupported format/dataset"""
+    if export_format not in FORMATS:
+        raise ValueError(f"Invalid format. Use one of: {', '.join(FORMATS)}.")
+    if dataset not in DATASETS:
+        raise ValueError(f"Invalid dataset. Use one of: {', '.join(DATASETS)}.")
+    if export_format == 'csv':
+        if dataset == 'all':
+            raise ValueError("CSV exports one dataset at a time: use dataset=daily or dataset=monthly.")
+        return csv_lines(dataset, filters)
+    return ndjson_lines(dataset, filters)
@@ -0,0 +1,197 @@
+"""
+Incrementally maintained leaderboards.
+
+LeaderboardScore holds one row per devotee, board and period. Every
+DailyActivity write adds the difference between the old and the new values
+of the row to the scores it counts towards, so reading a board never touches
+the activity table. Rows are read through the (board, period, score DESC,
+user) index: a top-N page is a range of it, and a rank counts the entries
+ahead of the devotee's in that range.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import DailyActivity, LeaderboardScore
+from .pagination import keyset_page
+from .rollups import week_start_for
+
+
+# DailyActivity fields that count as one attended session each
+ATTENDANCE_FIELDS = (
+    'sport_session_attendance',
+    'thursday_morning_chanting_session_attendance',
+    'friday_morning_chanting_session_attendance',
+    'sunday_offline_program_attendance',
+    'sunday_temple_chanting_session_attendance',
+)
+
+RANK_ORDERING = ('-score', 'user_id')
+
+
+def _rounds(snapshot):
+    return int(snapshot['daily_chanting'] or 0)
+
+
+def _attendance(snapshot):
+    return sum(1 for field in ATTENDANCE_FIELDS if snapshot[field] == 'Attended')
+
+
+# Board -> (score of an activity snapshot, period of a date)
+BOARDS = {
+    'total_rounds': (_rounds, lambda day: ''),
+    'week_rounds': (_rounds, lambda day: week_start_for(day).isoformat()),
+    'month_rounds': (_rounds, lambda day: f'{day:%Y-%m}'),
+    'attendance': (_attendance, lambda day: ''),
+}
+
+SNAPSHOT_FIELDS = ('user_id', 'date', 'daily_chanting', *ATTENDANCE_FIELDS)
+
+
+def current_period(board, today=None):
+    """Period of a board that contains today"""
+    return BOARDS[board][1](today or date.today())
+
+
+def _scores(snapshot):
+    """((user_id, board, period), score) of every board a snapshot counts towards"""
+    for board, (score, period) in BOARDS.items():
+        value = score(snapshot)
+        if value:
+            yield (snapshot['user_id'], board, period(snapshot['date'])), value
+
+
+def apply_activity_changes(changes):
+    """Apply several (previous, current) DailyActivity changes to the scores"""
+    deltas = defaultdict(int)
+    creatable = set()
+    for previous, current in changes:
+        for snapshot, sign in ((previous, -1), (current, 1)):
+            if snapshot is None:
+                continue
+            for key, value in _scores(snapshot):
+                deltas[key] += sign * value
+                if sign > 0:
+                    creatable.add(key)
+
+    for (user_id, board, period), delta in deltas.items():
+        if not delta:
+            continue
+        scores = LeaderboardScore.objects.filter(user_id=user_id, board=board, period=period)
+        # Deletes never create rows: a missing row means there is nothing to subtract
+        if scores.update(score=F('score') + delta) or (user_id, board, period) not in creatable:
+            continue
+        try:
+            with transaction.atomic():
+                LeaderboardScore.objects.create(user_id=user_id, board=board, period=period, score=delta)
+        except IntegrityError:
+            # Another writer created the row first
+            scores.update(score=F('score') + delta)
+
+
+def expected_scores(user_ids=None):
+    """{(user_id, board, period): score} recomputed from DailyActivity"""
+    activities = DailyActivity.objects.all()
+    if user_ids is not None:
+        activities = activities.filter(user_id__in=user_ids)
+    scores = defaultdict(int)
+    for snapshot in activities.values(*SNAPSHOT_FIELDS).iterator(chunk_size=2000):
+        for key, value in _scores(snapshot):
+            scores[key] += value
+    return {key: score for key, score in scores.items() if score}
+
+
+def rebuild_leaderboard(user_ids=None):
+    """Replace the scores with values recomputed from DailyActivity, returns how many rows"""
+    expected = expected_scores(user_ids)
+    with transaction.atomic():
+        stale = LeaderboardScore.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        LeaderboardScore.objects.bulk_create(
+            [
+                LeaderboardScore(user_id=user_id, board=board, period=period, score=score)
+                for (user_id, board, period), score in expected.items()
+            ],
+            batch_size=500,
+        )
+    return len(expected)
+
+
+def find_leaderboard_drift(user_ids=None):
+    """{(user_id, board, period): (stored, expected)} for every score that no longer matches"""
+    stored_rows = LeaderboardScore.objects.filter(score__gt=0)
+    if user_ids is not None:
+        stored_rows = stored_rows.filter(user_id__in=user_ids)
+    stored = {
+        (user_id, board, period): score
+        for user_id, board, period, score in stored_rows.values_list('user_id', 'board', 'period', 'score')
+    }
+    expected = expected_scores(user_ids)
+    return {
+        key: (stored.get(key), expected.get(key))
+        for key in stored.keys() | expected.keys()
+        if stored.get(key) != expected.get(key)
+    }
+
+
+def _board(board, period):
+    # Rows that went back to zero stay until a rebuild but are not ranked, and
+    # staff accounts are scored but, as in the devotee list, never ranked
+    return LeaderboardScore.objects.filter(
+        board=board, period=period, score__gt=0, user__is_staff=False, user__is_superuser=False,
+    )
+
+
+def top_page(board, period, cursor=None, page_size=50):
+    """
+    One page of a board, best first, as (entries, next_cursor). Entries are
+    (rank, LeaderboardScore) with the user loaded; tied scores share a rank.
+    """
+    rows, next_cursor = keyset_page(
+        _board(board, period).select_related('user'), RANK_ORDERING, cursor=cursor, page_size=page_size,
+    )
+    entries = []
+    if rows:
+        first = rows[0]
+        rank = rank_of_score(board, period, first.score)
+        # Index of the first row in the whole board
+        position = rank - 1 + _board(board, period).filter(score=first.score, user_id__lt=first.user_id).count()
+        for index, row in enumerate(rows):
+            if index and row.score != rows[index - 1].score:
+                # Everyone before it in the order scored more
+                rank = position + index + 1
+            entries.append((rank, row))
+    return entries, next_cursor
+
+
+def rank_of_score(board, period, score):
+    """1 + the number of devotees with a higher score, from the index"""
+    return _board(board, period).filter(score__gt=score).count() + 1
+
+
+def standing(user_id, today=None):
+    """
+    {board: {period, score, rank, participants}} of one devotee. A devotee
+    with nothing on a board has score 0 and ranks after everyone on it.
+    """
+    periods = {board: current_period(board, today) for board in BOARDS}
+    scores = {
+        (board, period): score
+        for board, period, score in LeaderboardScore.objects.filter(user_id=user_id, score__gt=0)
+        .values_list('board', 'period', 'score')
+    }
+    result = {}
+    for board, period in periods.items():
+        score = scores.get((board, period), 0)
+        participants = _board(board, period).count()
+        result[board] = {
+            'period': period,
+            'score': score,
+            'rank': rank_of_score(board, period, score) if score else participants + 1,
+            'participants': participants,
+        }
+    return result
@@ -0,0 +1,417 @@
+"""
+Concurrent load test of the QR quick-entry endpoints, WSGI vs ASGI.
+
+Many phones scan and submit within a few minutes of a program. Each
+simulated client takes `client_latency` seconds to send its request, as a
+phone on a mobile network does, then waits for the response. The same
+traffic is served by one worker process of each kind:
+
+- WSGI: Django's WSGI handler on a pool of `threads` threads, like a
+  threaded gunicorn worker. A thread is held from the first byte of the
+  request to the last byte of the response.
+- ASGI: Django's ASGI handler on one event loop, sending the requests to
+  the async views. A slow client only costs a pending coroutine.
+
+Both handlers are driven in process, without sockets, so the numbers
+compare the request handling models rather than a particular server.
+
+run_database_load drives the database directly instead: threads mixing the
+reads of week-data with the quick-entry upsert, with SQLite at its defaults
+(one connection per operation, no PRAGMAs, deferred transactions) or with
+the connection setup of devotee/sqlite.py.
+
+run_refresh_load measures refresh-token rotation: threads of clients each
+refreshing their own token chain, with the revocation check of
+authentication/revocation.py behind its Bloom filter or querying the table
+on every refresh, against a table already holding many revoked tokens.
+"""
+import asyncio
+import io
+import logging
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+
+from authentication.models import RevokedToken, User
+from authentication.qr_tokens import hash_token, token_cache
+from authentication.revocation import refresh_tokens, revocations
+from authentication.token_auth import ClaimsRefreshToken
+
+from .benchmark import PERCENTILES, percentile
+from .models import DailyActivity
+from .sqlite import is_locked, retry_counters, retry_on_locked
+from .weeks import week_for
+from .write_buffer import quick_entry_buffer
+
+
+HOST = 'testserver'
+
+
+def quick_entry_tokens(count):
+    """Give `count` devotees a QR token, returns the tokens"""
+    tokens = []
+    for user_id in User.objects.filter(is_staff=False).order_by('pk').values_list('pk', flat=True)[:count]:
+        token = f'loadtest-{user_id}'
+        User.objects.filter(pk=user_id).update(qr_token_hash=hash_token(token), qr_token_created_at=timezone.now())
+        tokens.append(token)
+    return tokens
+
+
+def quick_entry_calls(tokens, requests, asynchronous, seed=0):
+    """(method, path, body) of `requests` quick entries: each scan validates, then submits"""
+    rng = random.Random(seed)
+    suffix = '-async' if asynchronous else ''
+    calls = []
+    while len(calls) < requests:
+        token = rng.choice(tokens)
+        calls.append(('GET', reverse(f'validate-qr-token{suffix}', kwargs={'token': token}), b''))
+        body = f'{{"daily_chanting": {rng.randrange(1, 33)}}}'.encode()
+        calls.append(('POST', reverse(f'submit-quick-entry{suffix}', kwargs={'token': token}), body))
+    return calls[:requests]
+
+
+class _WSGIServer:
+    """Runs each request on a pool thread, which first waits for the slow client"""
+
+    def __init__(self, threads, client_latency):
+        self.app = get_wsgi_application()
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.client_latency = client_latency
+
+    def _handle(self, method, path, body):
+        time.sleep(self.client_latency)
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        statuses = []
+        response = self.app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            b''.join(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        return int(statuses[0].split()[0])
+
+    async def request(self, method, path, body):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._handle, method, path, body)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class _ASGIServer:
+    """Hands each request to the ASGI application once the slow client has sent it"""
+
+    def __init__(self, client_latency):
+        self.app = get_asgi_application()
+        self.client_latency = client_latency
+
+    async def request(self, method, path, body):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [
+                (b'host', HOST.encode()), (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+        }
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                await asyncio.sleep(self.client_latency)
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # The client stays connected until the response is sent
+            await asyncio.Future()
+
+        statuses = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await self.app(scope, receive, send)
+        return statuses[0]
+
+    def close(self):
+        pass
+
+
+async def _drive(server, calls, concurrency):
+    """Send calls from `concurrency` clients at once, returns (seconds, latencies, statuses)"""
+    pending = iter(calls)
+    latencies = []
+    statuses = Counter()
+
+    async def client():
+        for method, path, body in pending:
+            start = time.perf_counter()
+            try:
+                status_code = await server.request(method, path, body)
+            except Exception as e:
+                status_code = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+def _report(seconds, latencies, statuses):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        **{f'p{p}_ms': round(percentile(latencies, p), 1) for p in PERCENTILES},
+        'max_ms': round(latencies[-1], 1),
+        'statuses': {str(code): hits for code, hits in sorted(statuses.items(), key=lambda item: str(item[0]))},
+    }
+
+
+@contextmanager
+def _write_buffer(enabled):
+    """Route submissions through the quick-entry write buffer, journaling to a temporary directory"""
+    if not enabled:
+        yield None
+        return
+    previous = quick_entry_buffer.enabled, quick_entry_buffer.journal_dir
+    with tempfile.TemporaryDirectory() as journal_dir:
+        quick_entry_buffer.enabled, quick_entry_buffer.journal_dir = True, journal_dir
+        quick_entry_buffer.reset_metrics()
+        try:
+            yield quick_entry_buffer
+        finally:
+            quick_entry_buffer.stop()
+            quick_entry_buffer.enabled, quick_entry_buffer.journal_dir = previous
+
+
+def run_quick_entry_load(tokens, requests=1000, concurrency=200, threads=4, client_latency=0.05,
+                         modes=('wsgi', 'asgi'), buffered=False):
+    """
+    Report per mode of `requests` quick-entry requests from `concurrency`
+    simultaneous clients, with or without the write buffer
+    """
+    results = {}
+    for mode in modes:
+        token_cache.clear()
+        if mode == 'wsgi':
+            server = _WSGIServer(threads, client_latency)
+        else:
+            server = _ASGIServer(client_latency)
+        # Building a handler sets logging up again, so silence it afterwards:
+        # failures are counted by status code, not logged per request
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            calls = quick_entry_calls(tokens, requests, asynchronous=mode == 'asgi')
+            with _write_buffer(buffered) as write_buffer:
+                results[mode] = _report(*asyncio.run(_drive(server, calls, concurrency)))
+            if write_buffer is not None:
+                results[mode]['write_buffer'] = write_buffer.metrics()
+        finally:
+            request_logger.setLevel(level)
+            server.close()
+    return {
+        'meta': {
+            'requests': requests,
+            'concurrency': concurrency,
+            'wsgi_threads': threads,
+            'client_latency_ms': round(client_latency * 1000, 1),
+            'devotees': len(tokens),
+            'write_buffer': buffered,
+        },
+        'results': results,
+    }
+
+
+@contextmanager
+def sqlite_defaults(enabled):
+    """Without the PRAGMAs, IMMEDIATE transactions and retries, for the connections opened inside"""
+    if not enabled:
+        yield
+        return
+    options = connection.settings_dict['OPTIONS']
+    transaction_mode = options.pop('transaction_mode', None)
+    try:
+        with override_settings(SQLITE_CONNECTION={'PRAGMAS': {}, 'LOCKED_RETRIES': 0}):
+            yield
+    finally:
+        if transaction_mode is not None:
+            options['transaction_mode'] = transaction_mode
+
+
+def _read(user_id, today):
+    start = today - timedelta(days=today.weekday())
+    list(DailyActivity.objects.filter(user_id=user_id, date__range=[start, start + timedelta(days=6)]).values())
+    DailyActivity.objects.filter(user_id=user_id).aggregate(total=Sum('daily_chanting'))
+
+
+@retry_on_locked
+def _write(user_id, today, rounds):
+    DailyActivity.objects.update_or_create(
+        user_id=user_id, date=today, defaults={'daily_chanting': rounds, 'week': week_for(today)},
+    )
+
+
+def run_database_load(user_ids, operations=4000, threads=8, write_ratio=0.2, persistent=True, seed=0):
+    """
+    Report of `operations` reads and writes of random devotees spread over
+    `threads` threads. Without `persistent` every operation opens its own
+    connection, as requests do with CONN_MAX_AGE = 0.
+    """
+    today = date.today()
+    week_for(today)  # created up front, not by the first writers at once
+    retry_counters.clear()
+    timings = {'read': [], 'write': []}
+    errors = Counter()
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        local = {'read': [], 'write': []}
+        locked = Counter()
+        try:
+            for _ in range(operations // threads + (index < operations % threads)):
+                kind = 'write' if rng.random() < write_ratio else 'read'
+                user_id = rng.choice(user_ids)
+                start = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        _write(user_id, today, rng.randrange(1, 33))
+                    else:
+                        _read(user_id, today)
+                except OperationalError as e:
+                    if not is_locked(e):
+                        raise
+                    locked[kind] += 1
+                local[kind].append((time.perf_counter() - start) * 1000)
+                if not persistent:
+                    connection.close()
+        finally:
+            connection.close()
+        return local, locked
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for local, locked in executor.map(worker, range(threads)):
+            for kind, latencies in local.items():
+                timings[kind].extend(latencies)
+            errors.update(locked)
+    seconds = time.perf_counter() - start
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+    result = {
+        'journal_mode': journal_mode,
+        'operations': operations,
+        'seconds': round(seconds, 3),
+        'operations_per_second': round(operations / seconds, 1),
+    }
+    for kind, latencies in timings.items():
+        latencies.sort()
+        result[f'{kind}s'] = {
+            'count': len(latencies),
+            'per_second': round(len(latencies) / seconds, 1),
+            'locked_errors': errors[kind],
+            **({f'p{p}_ms': round(percentile(latencies, p), 2) for p in PERCENTILES} if latencies else {}),
+        }
+    result['writes'].update(retry_counters.snapshot())
+    return result
+
+
+def seed_revoked_tokens(count, expired=0, batch_size=5000):
+    """`count` revoked tokens still to expire and `expired` ones past their expiry, as logouts leave them"""
+    now = timezone.now()
+    rows = [
+        RevokedToken(jti=f'seed-{index:08d}', expires_at=now + timedelta(hours=1 if index < count else -1))
+        for index in range(count + expired)
+    ]
+    RevokedToken.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def run_refresh_load(users, refreshes=2000, threads=8, reuse_ratio=0.05, modes=('table', 'filter'), seed=0):
+    """
+    Report of `refreshes` token refreshes per mode, spread over `threads`
+    threads. Each thread rotates a chain of refresh tokens of random users;
+    a `reuse_ratio` of the attempts replay a token already rotated, which
+    must be refused. 'table' queries the revoked tokens on every refresh,
+    'filter' only when the Bloom filter cannot clear the token.
+    """
+    report = {'revoked_tokens': RevokedToken.objects.count(), 'modes': {}}
+    for mode in modes:
+        revocations.use_filter = mode == 'filter'
+        revocations.clear()
+        revocations.is_revoked('')  # the filter is built up front, not by the first refresh
+        before = revocations.snapshot()
+        timings = []
+        outcomes = Counter()
+
+        def worker(index):
+            rng = random.Random(seed + index)
+            chains = {}
+            local = []
+            counts = Counter()
+            try:
+                for _ in range(refreshes // threads + (index < refreshes % threads)):
+                    user = rng.choice(users)
+                    chain = chains.setdefault(user.pk, [str(ClaimsRefreshToken.for_user(user))])
+                    replay = len(chain) > 1 and rng.random() < reuse_ratio
+                    token = chain[-2] if replay else chain[-1]
+                    start = time.perf_counter()
+                    try:
+                        chain.append(refresh_tokens(token)['refresh'])
+                        counts['refreshed'] += 1
+                    except TokenError:
+                        counts['refused_replays' if replay else 'refused'] += 1
+                    local.append((time.perf_counter() - start) * 1000)
+            finally:
+                connection.close()
+            return local, counts
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for local, counts in executor.map(worker, range(threads)):
+                timings.extend(local)
+                outcomes.update(counts)
+        seconds = time.perf_counter() - start
+
+        timings.sort()
+        report['modes'][mode] = {
+            'refreshes': refreshes,
+            'seconds': round(seconds, 3),
+            'refreshes_per_second': round(refreshes / seconds, 1),
+            **{f'p{p}_ms': round(percentile(timings, p), 2) for p in PERCENTILES},
+            **{name: outcomes[name] for name in ('refreshed', 'refused_replays', 'refused')},
+            **{name: count - before[name] for name, count in revocations.snapshot().items()},
+        }
+    revocations.use_filter = True
+    revocations.clear()
+
+    start = time.perf_counter()
+    purged = revocations.purge_expired()
+    report['purge'] = {'deleted': purged, 'seconds': round(time.perf_counter() - start, 3)}
+    return report
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.benchmark import find_regressions, run_benchmark, scratch_database, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with synthetic devotees and activities, drive every API route "
+        "through the test client and report latency percentiles, query counts and peak memory as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devotees', type=int, default=50, help="Devotees to seed (default: 50).")
+        parser.add_argument('--years', type=int, default=1, help="Years of history to seed (default: 1).")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per endpoint (default: 20).")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed of the dataset (default: 0).")
+        parser.add_argument('--only', action='append', help="Only endpoints whose label contains this text (repeatable).")
+        parser.add_argument('--database', help="SQLite file for the scratch database (default: in memory).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--baseline', help="Earlier JSON report to compare against; regressions fail the command.")
+        parser.add_argument('--threshold', type=float, default=1.25, help="Allowed p50 slowdown against the baseline (default: 1.25).")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        with scratch_database(options['database']):
+            self.stderr.write(f"Seeding {options['devotees']} devotee(s) x {options['years']} year(s)...")
+            dataset = {
+                'devotees': options['devotees'],
+                'years': options['years'],
+                'seed': options['seed'],
+                'rows': seed_dataset(options['devotees'], options['years'], options['seed']),
+            }
+            self.stderr.write(f"Seeded {dataset['rows']}. Running endpoints...")
+            report = run_benchmark(options['repeat'], options['only'], dataset)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if report['uncovered_routes']:
+            self.stderr.write(f"Routes without a benchmark: {', '.join(report['uncovered_routes'])}")
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                regressions = find_regressions(report, json.load(baseline_file), options['threshold'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline."))
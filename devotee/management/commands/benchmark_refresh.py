@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import User
+from devotee.benchmark import scratch_database, seed_dataset
+from devotee.loadtest import run_refresh_load, seed_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with devotees and revoked refresh tokens, then rotate refresh tokens "
+        "from concurrent threads with the revocation check querying the table on every refresh and "
+        "behind the Bloom filter, and report refresh throughput and latency percentiles as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devotees', type=int, default=200, help="Devotees refreshing tokens (default: 200).")
+        parser.add_argument('--refreshes', type=int, default=2000, help="Refreshes per mode (default: 2000).")
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent threads (default: 8).")
+        parser.add_argument('--revoked', type=int, default=100000, help="Revoked tokens not yet expired (default: 100000).")
+        parser.add_argument('--expired', type=int, default=10000, help="Revoked tokens already expired, purged at the end (default: 10000).")
+        parser.add_argument('--reuse-ratio', type=float, default=0.05, help="Share of refreshes replaying a rotated token (default: 0.05).")
+        parser.add_argument('--mode', action='append', choices=('table', 'filter'), help="Only this mode (repeatable).")
+        parser.add_argument('--database', help="SQLite file for the scratch database (default: a temporary file).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if min(options['devotees'], options['refreshes'], options['threads']) < 1:
+            raise CommandError("--devotees, --refreshes and --threads must be at least 1.")
+        if min(options['revoked'], options['expired']) < 0 or not 0 <= options['reuse_ratio'] <= 1:
+            raise CommandError("--revoked and --expired must not be negative, --reuse-ratio must be between 0 and 1.")
+
+        # Worker threads need their own connections, which an in-memory database would not share reliably
+        with tempfile.TemporaryDirectory() as directory:
+            path = options['database'] or os.path.join(directory, 'refresh.sqlite3')
+            with scratch_database(path):
+                self.stderr.write(f"Seeding {options['devotees']} devotee(s) and {options['revoked']} revoked token(s)...")
+                seed_dataset(options['devotees'], years=1)
+                seed_revoked_tokens(options['revoked'], options['expired'])
+                users = list(User.objects.filter(is_staff=False))
+
+                report = run_refresh_load(
+                    users,
+                    refreshes=options['refreshes'],
+                    threads=options['threads'],
+                    reuse_ratio=options['reuse_ratio'],
+                    modes=options['mode'] or ('table', 'filter'),
+                )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
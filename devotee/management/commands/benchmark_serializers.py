@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from devotee.benchmark import compare_serializers, scratch_database, seed_dataset
+
+
+class Command(BaseCommand):
+    help = "Compare DailyActivitySerializer with the values() fast path on a seeded scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=3, help="Years of history of the serialized devotee (default: 3).")
+        parser.add_argument('--repeat', type=int, default=10, help="Runs per serializer, the best one counts (default: 10).")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed_dataset(devotees=1, years=options['years'])
+            report = compare_serializers(options['repeat'])
+        self.stdout.write(json.dumps(report, indent=2))
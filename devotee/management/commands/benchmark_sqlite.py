@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from authentication.models import User
+from devotee.benchmark import scratch_database, seed_dataset
+from devotee.loadtest import run_database_load, sqlite_defaults
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch SQLite database per mode, then run the same mix of concurrent reads and "
+        "quick-entry writes with SQLite at its defaults and with the configured connection setup "
+        "(WAL, PRAGMAs, persistent connections, retries) and report throughput as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devotees', type=int, default=100, help="Devotees to seed (default: 100).")
+        parser.add_argument('--operations', type=int, default=4000, help="Reads and writes per mode (default: 4000).")
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent threads (default: 8).")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Share of writes (default: 0.2).")
+        parser.add_argument('--mode', action='append', choices=('default', 'tuned'), help="Only this mode (repeatable).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The default database is not SQLite.")
+        if min(options['devotees'], options['operations'], options['threads']) < 1:
+            raise CommandError("--devotees, --operations and --threads must be at least 1.")
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError("--write-ratio must be between 0 and 1.")
+
+        results = {}
+        for mode in options['mode'] or ('default', 'tuned'):
+            # WAL stays set in the file, so each mode gets its own
+            with tempfile.TemporaryDirectory() as directory, sqlite_defaults(mode == 'default'):
+                with scratch_database(os.path.join(directory, f'{mode}.sqlite3')):
+                    self.stderr.write(f"Seeding {options['devotees']} devotee(s) for the {mode} mode...")
+                    seed_dataset(options['devotees'], years=1)
+                    user_ids = list(User.objects.filter(is_staff=False).values_list('pk', flat=True))
+                    connection.close()
+                    results[mode] = run_database_load(
+                        user_ids,
+                        operations=options['operations'],
+                        threads=options['threads'],
+                        write_ratio=options['write_ratio'],
+                        persistent=mode == 'tuned',
+                    )
+
+        output = json.dumps({
+            'meta': {
+                'devotees': options['devotees'],
+                'operations': options['operations'],
+                'threads': options['threads'],
+                'write_ratio': options['write_ratio'],
+            },
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
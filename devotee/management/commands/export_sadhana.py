@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.export import DATASETS, FORMATS, export_lines, parse_filters
+from devotee.streaming import buffered
+
+
+class Command(BaseCommand):
+    help = "Export sadhana data of all or selected devotees as CSV or NDJSON, streamed row by row."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv', dest='export_format', help="Output format (default: csv).")
+        parser.add_argument('--dataset', choices=DATASETS, default='daily', help="Data to export (default: daily; all needs ndjson).")
+        parser.add_argument('--start-date', help="First date to include (YYYY-MM-DD).")
+        parser.add_argument('--end-date', help="Last date to include (YYYY-MM-DD).")
+        parser.add_argument('--devotee', action='append', dest='devotee_ids', help="Limit to a devotee id (repeatable).")
+        parser.add_argument('--week', dest='week_id', help="Limit to the dates of a week id.")
+        parser.add_argument('--output', help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(
+                start_date=options['start_date'],
+                end_date=options['end_date'],
+                devotee_ids=options['devotee_ids'],
+                week_id=options['week_id'],
+            )
+            lines = export_lines(options['export_format'], options['dataset'], filters)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in buffered(lines):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from devotee.write_buffer import QUARANTINE_NAME, quick_entry_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the quick-entry journals left by worker processes that are no longer running "
+        "and write their submissions to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journal-dir', help="Journal directory (default: QUICK_ENTRY_BUFFER['JOURNAL_DIR']).")
+        parser.add_argument(
+            '--include-running', action='store_true',
+            help="Also take over journals of processes that still run; only when every worker is stopped.",
+        )
+
+    def handle(self, *args, **options):
+        if options['journal_dir']:
+            quick_entry_buffer.journal_dir = options['journal_dir']
+        replayed = quick_entry_buffer.recover(include_running=options['include_running'])
+        written = quick_entry_buffer.flush()
+        quick_entry_buffer.stop()
+
+        metrics = quick_entry_buffer.metrics()
+        if metrics['pending']:
+            self.stderr.write(self.style.ERROR(f"Flush failed, entries stay journaled: {metrics['last_error']}"))
+        if metrics['quarantined']:
+            self.stderr.write(self.style.WARNING(
+                f"{metrics['quarantined']} entr{'y' if metrics['quarantined'] == 1 else 'ies'} could not be written, "
+                f"see {QUARANTINE_NAME} in the journal directory."
+            ))
+        self.stderr.write(f"Replayed {replayed} journal entr{'y' if replayed == 1 else 'ies'}, wrote {written} row(s).")
+        self.stdout.write(json.dumps(metrics, indent=2))
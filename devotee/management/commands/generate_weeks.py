@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.weeks import generate_weeks
+
+
+class Command(BaseCommand):
+    help = "Create the shared calendar weeks for a range of years."
+
+    def add_arguments(self, parser):
+        this_year = date.today().year
+        parser.add_argument('--from-year', type=int, default=this_year, help="First year to generate (default: this year).")
+        parser.add_argument('--to-year', type=int, default=this_year + 5, help="Last year to generate (default: five years ahead).")
+
+    def handle(self, *args, **options):
+        if options['from_year'] > options['to_year']:
+            raise CommandError("--from-year must not be after --to-year.")
+        created = generate_weeks(options['from_year'], options['to_year'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} week(s)."))
@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.benchmark import scratch_database, seed_dataset
+from devotee.loadtest import quick_entry_tokens, run_quick_entry_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database, then send the same burst of concurrent QR quick-entry requests "
+        "to one WSGI worker (sync views) and one ASGI worker (async views) and report throughput "
+        "and latency percentiles as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devotees', type=int, default=200, help="Devotees scanning QR codes (default: 200).")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per mode (default: 1000).")
+        parser.add_argument('--concurrency', type=int, default=200, help="Simultaneous clients (default: 200).")
+        parser.add_argument('--threads', type=int, default=4, help="Threads of the WSGI worker (default: 4).")
+        parser.add_argument('--client-latency-ms', type=float, default=50, help="Time a client takes to send a request (default: 50).")
+        parser.add_argument('--mode', action='append', choices=('wsgi', 'asgi'), help="Only this mode (repeatable).")
+        parser.add_argument('--buffered', action='store_true', help="Send submissions through the quick-entry write buffer.")
+        parser.add_argument('--database', help="SQLite file for the scratch database (default: a temporary file).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['threads'], options['devotees']) < 1:
+            raise CommandError("--devotees, --requests, --concurrency and --threads must be at least 1.")
+
+        # Worker threads need their own connections, which an in-memory database would not share reliably
+        with tempfile.TemporaryDirectory() as directory:
+            path = options['database'] or os.path.join(directory, 'loadtest.sqlite3')
+            with scratch_database(path):
+                self.stderr.write(f"Seeding {options['devotees']} devotee(s)...")
+                seed_dataset(options['devotees'], years=1)
+                tokens = quick_entry_tokens(options['devotees'])
+
+                report = run_quick_entry_load(
+                    tokens,
+                    requests=options['requests'],
+                    concurrency=options['concurrency'],
+                    threads=options['threads'],
+                    client_latency=options['client_latency_ms'] / 1000,
+                    modes=options['mode'] or ('wsgi', 'asgi'),
+                    buffered=options['buffered'],
+                )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
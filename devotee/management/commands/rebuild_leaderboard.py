@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.leaderboard import find_leaderboard_drift, rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recompute the leaderboard scores from the daily activities or check them for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report drift, do not rewrite anything.")
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to a devotee id (repeatable).")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['check']:
+            drift = find_leaderboard_drift(user_ids)
+            for (user_id, board, period), (stored, expected) in sorted(drift.items()):
+                self.stdout.write(f"User {user_id} {board} {period or 'all time'}: {stored} != {expected}")
+            if drift:
+                raise CommandError(f"{len(drift)} leaderboard score(s) out of date. Run rebuild_leaderboard to fix them.")
+            self.stdout.write(self.style.SUCCESS("Leaderboard is up to date."))
+            return
+
+        rows = rebuild_leaderboard(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} leaderboard score(s)."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.rollups import find_drift, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Backfill the DailyActivity rollup tables or check them for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report drift, do not rewrite anything.")
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to a devotee id (repeatable). Global rows are skipped.")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['check']:
+            drift = find_drift(user_ids)
+            for model, lookup, stored, expected in drift:
+                changed = {field: (stored[field], expected[field]) for field in expected if stored[field] != expected[field]}
+                self.stdout.write(f"{model.__name__} {lookup}: {changed}")
+            if drift:
+                raise CommandError(f"{len(drift)} rollup row(s) out of date. Run rebuild_rollups to fix them.")
+            self.stdout.write(self.style.SUCCESS("Rollups are up to date."))
+            return
+
+        counts = rebuild_rollups(user_ids)
+        for model, count in counts.items():
+            self.stdout.write(f"{model.__name__}: {count} row(s)")
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from devotee.streaks import find_streak_drift, rebuild_streaks
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-devotee streaks from the daily activities or check them for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report drift, do not rewrite anything.")
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to a devotee id (repeatable).")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if user_ids is None:
+            user_ids = get_user_model().objects.values_list('pk', flat=True).iterator()
+
+        if options['check']:
+            drifted = 0
+            for user_id in user_ids:
+                drift = find_streak_drift(user_id)
+                if drift:
+                    drifted += 1
+                    self.stdout.write(f"User {user_id}: {drift}")
+            if drifted:
+                raise CommandError(f"{drifted} devotee(s) with streaks out of date. Run rebuild_streaks to fix them.")
+            self.stdout.write(self.style.SUCCESS("Streaks are up to date."))
+            return
+
+        rebuilt = 0
+        for user_id in user_ids:
+            rebuild_streaks(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt streaks of {rebuilt} devotee(s)."))
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devotee', '0006_alter_monthlyactivity_book_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activities_count', models.IntegerField(default=0)),
+                ('hearing_completed', models.IntegerField(default=0)),
+                ('reading_completed', models.IntegerField(default=0)),
+                ('chanting_rounds', models.IntegerField(default=0)),
+                ('sport_attended', models.IntegerField(default=0)),
+                ('sport_sessions', models.IntegerField(default=0)),
+                ('date', models.DateField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_rollup_user_date'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('date',), name='unique_daily_rollup_global_date')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activities_count', models.IntegerField(default=0)),
+                ('hearing_completed', models.IntegerField(default=0)),
+                ('reading_completed', models.IntegerField(default=0)),
+                ('chanting_rounds', models.IntegerField(default=0)),
+                ('sport_attended', models.IntegerField(default=0)),
+                ('sport_sessions', models.IntegerField(default=0)),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month'), name='unique_monthly_rollup_user_month'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('year', 'month'), name='unique_monthly_rollup_global_month')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activities_count', models.IntegerField(default=0)),
+                ('hearing_completed', models.IntegerField(default=0)),
+                ('reading_completed', models.IntegerField(default=0)),
+                ('chanting_rounds', models.IntegerField(default=0)),
+                ('sport_attended', models.IntegerField(default=0)),
+                ('sport_sessions', models.IntegerField(default=0)),
+                ('week_start', models.DateField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'week_start'), name='unique_weekly_rollup_user_week'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('week_start',), name='unique_weekly_rollup_global_week')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_user_qr_token_user_qr_token_created_at'),
+        ('devotee', '0007_activity_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DevoteeStatistics',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_chanting_rounds', models.IntegerField(default=0)),
+                ('highest_chanting_rounds', models.IntegerField(default=0)),
+                ('sport_session_attendance_count', models.IntegerField(default=0)),
+                ('thursday_chanting_count', models.IntegerField(default=0)),
+                ('sunday_offline_program_count', models.IntegerField(default=0)),
+                ('sunday_temple_chanting_count', models.IntegerField(default=0)),
+                ('weekly_seva_count', models.IntegerField(default=0)),
+                ('morning_program_count', models.IntegerField(default=0)),
+                ('completed_books', models.JSONField(blank=True, default=dict)),
+                ('partially_completed_books', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Years the calendar is generated for up front; generate_weeks extends it later
+FIRST_YEAR = 2020
+LAST_YEAR = 2035
+
+
+def monday(day):
+    return day - timedelta(days=day.weekday())
+
+
+def merge_into_calendar(apps, schema_editor):
+    Week = apps.get_model('devotee', 'Week')
+    DailyActivity = apps.get_model('devotee', 'DailyActivity')
+    MonthlyActivity = apps.get_model('devotee', 'MonthlyActivity')
+
+    # The oldest row of each week becomes the shared one
+    canonical = {}
+    for week in Week.objects.order_by('id'):
+        canonical.setdefault(monday(week.start_date), week)
+
+    activity_weeks = {monday(day) for day in DailyActivity.objects.dates('date', 'day')}
+    start = monday(date(FIRST_YEAR, 1, 1))
+    if start.year < FIRST_YEAR:
+        start += timedelta(days=7)
+    calendar_weeks = set()
+    while start.year <= LAST_YEAR:
+        calendar_weeks.add(start)
+        start += timedelta(days=7)
+
+    for start in sorted(activity_weeks | calendar_weeks | set(canonical)):
+        week = canonical.get(start) or Week(start_date=start)
+        week.name = f"Week of {start}"
+        week.start_date = start
+        week.end_date = start + timedelta(days=6)
+        week.month = start.month
+        week.year = start.year
+        week.created_by = None
+        canonical[start] = week
+    new_weeks = [week for week in canonical.values() if week.pk is None]
+    Week.objects.bulk_update(
+        [week for week in canonical.values() if week.pk is not None],
+        ['name', 'start_date', 'end_date', 'month', 'year', 'created_by'],
+    )
+    Week.objects.bulk_create(new_weeks)
+    if any(week.pk is None for week in new_weeks):
+        # Backends that do not return ids from bulk_create
+        ids = dict(Week.objects.filter(created_by__isnull=True).values_list('start_date', 'id'))
+        for week in new_weeks:
+            week.pk = ids[week.start_date]
+
+    # Every day points at the week of its own date
+    for start in activity_weeks:
+        DailyActivity.objects.filter(
+            date__gte=start, date__lte=start + timedelta(days=6)
+        ).update(week_id=canonical[start].pk)
+
+    # Monthly activities keep their weeks, now the shared ones
+    Through = MonthlyActivity.weeks.through
+    links = {
+        (monthly_id, canonical[monday(start)].pk)
+        for monthly_id, start in Through.objects.values_list('monthlyactivity_id', 'week__start_date')
+    }
+    Through.objects.all().delete()
+    Through.objects.bulk_create([
+        Through(monthlyactivity_id=monthly_id, week_id=week_id) for monthly_id, week_id in links
+    ])
+
+    Week.objects.exclude(pk__in=[week.pk for week in canonical.values()]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devotee', '0008_devotee_statistics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='week',
+            name='created_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='weeks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_into_calendar, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='week',
+            name='created_by',
+        ),
+        migrations.AlterField(
+            model_name='week',
+            name='start_date',
+            field=models.DateField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='dailyactivity',
+            name='week',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='activities', to='devotee.week'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def link_month_weeks(apps, schema_editor):
+    # current-month used to link a month's weeks on every read; it no longer writes
+    MonthlyActivity = apps.get_model('devotee', 'MonthlyActivity')
+    Week = apps.get_model('devotee', 'Week')
+    Link = MonthlyActivity.weeks.through
+
+    weeks = {}
+    for week_id, year, month in Week.objects.values_list('id', 'year', 'month'):
+        weeks.setdefault((year, month), []).append(week_id)
+    unlinked = MonthlyActivity.objects.filter(weeks__isnull=True).values_list('id', 'year', 'month')
+    Link.objects.bulk_create(
+        [
+            Link(monthlyactivity_id=monthly_id, week_id=week_id)
+            for monthly_id, year, month in unlinked
+            for week_id in weeks.get((year, month), ())
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devotee', '0009_shared_week_calendar'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_month_weeks, migrations.RunPython.noop),
+    ]
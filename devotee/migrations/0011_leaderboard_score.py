@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devotee', '0010_link_month_weeks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=20)),
+                ('period', models.CharField(blank=True, default='', max_length=10)),
+                ('score', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', 'period', '-score', 'user'], name='leaderboard_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'board', 'period'), name='unique_leaderboard_score')],
+            },
+        ),
+    ]
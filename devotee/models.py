@@ -5,21 +5,31 @@ from datetime import date
 
 User=settings.AUTH_USER_MODEL
 
+
+class LoadedValuesMixin:
+    """Remembers the values a row was loaded with, so saves can be diffed against them"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
 class Week(models.Model):
+    """A Monday-to-Sunday calendar week, shared by every devotee (see weeks.py)"""
     name=models.CharField(max_length=100)
-    start_date=models.DateField()
+    start_date=models.DateField(unique=True)
     end_date=models.DateField()
     month=models.IntegerField()
     year=models.IntegerField()
-    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weeks')
     def __str__(self):
-        return f"{self.name} - {self.start_date} {self.end_date} {self.month} {self.year} {self.created_by}"
+        return f"{self.name} - {self.start_date} {self.end_date} {self.month} {self.year}"
 
 
-class DailyActivity(models.Model):
+class DailyActivity(LoadedValuesMixin, models.Model):
     # Foreign Keys
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    week = models.ForeignKey(Week, on_delete=models.CASCADE, related_name='activities')
+    week = models.ForeignKey(Week, on_delete=models.PROTECT, related_name='activities')
     date = models.DateField()
 
     # Choice fields
@@ -73,7 +83,7 @@ class DailyActivity(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
-class MonthlyActivity(models.Model):
+class MonthlyActivity(LoadedValuesMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     month = models.IntegerField()
     year = models.IntegerField()
@@ -113,9 +123,124 @@ class MonthlyActivity(models.Model):
         return f"{self.user.username} - {self.month}/{self.year}"
 
 
+class ActivityRollup(models.Model):
+    """
+    Pre-aggregated DailyActivity counters for one bucket.
+    A row with user=None holds the totals across all devotees.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    activities_count = models.IntegerField(default=0)
+    hearing_completed = models.IntegerField(default=0)
+    reading_completed = models.IntegerField(default=0)
+    chanting_rounds = models.IntegerField(default=0)
+    sport_attended = models.IntegerField(default=0)
+    sport_sessions = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyRollup(ActivityRollup):
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_rollup_user_date'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(user__isnull=True), name='unique_daily_rollup_global_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id or 'all'} - {self.date}"
+
+
+class WeeklyRollup(ActivityRollup):
+    week_start = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'week_start'], name='unique_weekly_rollup_user_week'),
+            models.UniqueConstraint(fields=['week_start'], condition=models.Q(user__isnull=True), name='unique_weekly_rollup_global_week'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id or 'all'} - week of {self.week_start}"
+
 
+class MonthlyRollup(ActivityRollup):
+    year = models.IntegerField()
+    month = models.IntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'month'], name='unique_monthly_rollup_user_month'),
+            models.UniqueConstraint(fields=['year', 'month'], condition=models.Q(user__isnull=True), name='unique_monthly_rollup_global_month'),
+        ]
 
+    def __str__(self):
+        return f"{self.user_id or 'all'} - {self.month}/{self.year}"
+
+
+class DevoteeStatistics(models.Model):
+    """
+    Denormalized lifetime counters behind the spiritual-growth screen.
+    Book columns map book name -> number of months it was reported in.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    total_chanting_rounds = models.IntegerField(default=0)
+    highest_chanting_rounds = models.IntegerField(default=0)
+    sport_session_attendance_count = models.IntegerField(default=0)
+    thursday_chanting_count = models.IntegerField(default=0)
+    sunday_offline_program_count = models.IntegerField(default=0)
+    sunday_temple_chanting_count = models.IntegerField(default=0)
+    weekly_seva_count = models.IntegerField(default=0)
+    morning_program_count = models.IntegerField(default=0)
+    completed_books = models.JSONField(default=dict, blank=True)
+    partially_completed_books = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Statistics of {self.user_id}"
 
 
+class LeaderboardScore(models.Model):
+    """
+    A devotee's score on one leaderboard (see leaderboard.py). period is ''
+    on all-time boards, otherwise the week's Monday or the month (YYYY-MM).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_scores')
+    board = models.CharField(max_length=20)
+    period = models.CharField(max_length=10, blank=True, default='')
+    score = models.IntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'board', 'period'], name='unique_leaderboard_score'),
+        ]
+        indexes = [
+            # Top-N pages read it in order and ranks count a range of it
+            models.Index(fields=['board', 'period', '-score', 'user'], name='leaderboard_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.board} {self.period}: {self.score}"
+
+
+class DevoteeStreak(models.Model):
+    """
+    The latest run of consecutive qualifying days of one streak kind (see
+    streaks.py) and the longest run that ended before it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='streaks')
+    kind = models.CharField(max_length=20)
+    current_start = models.DateField(null=True, blank=True)
+    current_end = models.DateField(null=True, blank=True)
+    longest_before = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='unique_devotee_streak'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.kind}: {self.current_start}..{self.current_end}"
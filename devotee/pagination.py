@@ -0,0 +1,108 @@
+"""
+Keyset (cursor) pagination.
+
+A page is fetched with a WHERE on the ordering columns of the last row seen,
+so its cost does not depend on how deep into the result set it is. Cursors
+are opaque url-safe strings holding those column values.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _to_json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_to_json(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor.")
+    return values
+
+
+def page_size_from(params, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE, name='limit'):
+    """Page size from the `name` query param, clamped to 1..maximum"""
+    try:
+        size = int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise InvalidCursor(f"Invalid {name}.")
+    return max(1, min(size, maximum))
+
+
+def wants_total(params, default=False):
+    """Whether the client asked for a total count (include_total=true), `default` when it did not say"""
+    value = params.get('include_total')
+    if value is None:
+        return default
+    return value in ('1', 'true', 'True')
+
+
+def _after(ordering, values):
+    """Q matching rows that come after the given ordering values"""
+    condition = Q()
+    for index in reversed(range(len(ordering))):
+        field = ordering[index].lstrip('-')
+        lookup = 'lt' if ordering[index].startswith('-') else 'gt'
+        step = Q(**{f"{field}__{lookup}": values[index]})
+        if index < len(ordering) - 1:
+            step |= Q(**{field: values[index]}) & condition
+        condition = step
+    return condition
+
+
+def after_cursor(queryset, ordering, cursor):
+    """queryset narrowed to the rows after cursor in the given ordering"""
+    try:
+        return queryset.filter(_after(ordering, decode_cursor(cursor, len(ordering))))
+    except (ValidationError, TypeError, ValueError):
+        # Values that do not fit the ordering columns
+        raise InvalidCursor("Invalid cursor.")
+
+
+def cursor_for(row, ordering):
+    """Cursor pointing just after row, a model instance or a .values() dict"""
+    fields = [name.lstrip('-') for name in ordering]
+    if isinstance(row, dict):
+        return encode_cursor([row[field] for field in fields])
+    return encode_cursor([getattr(row, field) for field in fields])
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    One page of queryset ordered by the given fields (the last one must be
+    unique, e.g. id). Rows may be model instances or .values() dicts.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = after_cursor(queryset, ordering, cursor)
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = cursor_for(rows[-1], ordering)
+    return rows, next_cursor
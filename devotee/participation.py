@@ -0,0 +1,223 @@
+"""
+Devotee × day participation matrix for the admin heatmap.
+
+One values_list() query reads every DailyActivity of the date range, and
+NumPy scatters it into dense arrays with one row per devotee and one column
+per day: whether the day was entered, its chanting rounds and whether each
+daily goal of devotee/streaks.py was met. Rates per devotee and per day,
+percentile bands and the heatmap are then whole-array operations, with no
+Python loop over devotees or days.
+"""
+import base64
+import zlib
+from datetime import date, timedelta
+from operator import itemgetter
+
+import numpy as np
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Cast
+
+from authentication.models import User
+
+from .models import DailyActivity
+from .streaks import KINDS
+
+
+DEFAULT_MATRIX_DAYS = 30
+MAX_MATRIX_DAYS = 731
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def parse_range(start_date=None, end_date=None, devotee_ids=None, today=None):
+    """
+    (start, end, devotee_ids) from raw strings, by default the last
+    DEFAULT_MATRIX_DAYS days. Raises ValueError with a message for the caller
+    to show.
+    """
+    try:
+        end = date.fromisoformat(end_date) if end_date else (today or date.today())
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=DEFAULT_MATRIX_DAYS - 1)
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+    if start > end:
+        raise ValueError("start_date must not be after end_date.")
+    if (end - start).days + 1 > MAX_MATRIX_DAYS:
+        raise ValueError(f"The range may cover at most {MAX_MATRIX_DAYS} days.")
+    try:
+        devotee_ids = [int(devotee_id) for devotee_id in devotee_ids or ()]
+    except ValueError:
+        raise ValueError("Invalid devotee id.")
+    return start, end, devotee_ids
+
+
+class ParticipationMatrix:
+    """
+    Dense arrays of a devotee roster over consecutive days. Row i is the
+    devotee devotees[i] = (id, username, name), column j is start + j days.
+    """
+
+    def __init__(self, devotees, start, days):
+        self.devotees = devotees
+        self.start = start
+        self.days = days
+        shape = (len(devotees), days)
+        self.entered = np.zeros(shape, dtype=bool)
+        # int64, so that sums over long ranges of large values cannot overflow
+        self.rounds = np.zeros(shape, dtype=np.int64)
+        self.goals = {kind: np.zeros(shape, dtype=bool) for kind in KINDS}
+
+    def fill(self, user_ids, dates, rounds, goal_bits):
+        """
+        Scatter activity columns (arrays of equal length) into the matrix.
+        Bit i of goal_bits is set when the i-th goal of KINDS was met.
+        """
+        roster = np.fromiter((devotee[0] for devotee in self.devotees), dtype=np.int64, count=len(self.devotees))
+        rows = np.searchsorted(roster, user_ids)
+        # Activities of users outside the roster (e.g. staff) are dropped
+        known = rows < len(roster)
+        known[known] = roster[rows[known]] == user_ids[known]
+        rows = rows[known]
+        columns = (dates[known] - np.datetime64(self.start, 'D')).astype(np.int64)
+        self.entered[rows, columns] = True
+        self.rounds[rows, columns] = rounds[known]
+        goal_bits = goal_bits[known]
+        for bit, kind in enumerate(KINDS):
+            self.goals[kind][rows, columns] = (goal_bits >> bit) & 1
+
+    def complete(self):
+        """Days on which every goal was met"""
+        return np.logical_and.reduce(list(self.goals.values()))
+
+    def levels(self):
+        """Heatmap level of every cell as uint8: 0 no entry, then 1 + the number of goals met"""
+        levels = self.entered.astype(np.uint8)
+        for met in self.goals.values():
+            levels += met
+        return levels
+
+    def dates(self):
+        return [self.start + timedelta(days=offset) for offset in range(self.days)]
+
+
+def build_matrix(start, end, devotee_ids=None):
+    """The ParticipationMatrix of the devotees (all by default) from start to end, in two queries"""
+    roster = User.objects.filter(is_staff=False, is_superuser=False).order_by('pk')
+    activities = DailyActivity.objects.filter(date__range=[start, end])
+    if devotee_ids:
+        roster = roster.filter(pk__in=devotee_ids)
+        activities = activities.filter(user_id__in=devotee_ids)
+    devotees = [
+        (user_id, username, f'{first_name} {last_name}'.strip())
+        for user_id, username, first_name, last_name in roster.values_list('pk', 'username', 'first_name', 'last_name')
+    ]
+    matrix = ParticipationMatrix(devotees, start, (end - start).days + 1)
+
+    # Creating a date object per row costs more than the rest of the fetch,
+    # so dates come as ISO text, which NumPy parses in bulk; the goals come
+    # as one bit mask instead of a column each
+    goal_bits = sum(
+        (Case(When(condition, then=Value(1 << bit)), default=Value(0)) for bit, (_, condition) in enumerate(KINDS.values())),
+        Value(0),
+    )
+    rows = list(activities.values_list('user_id', Cast('date', CharField()), 'daily_chanting', goal_bits))
+
+    def column(index, dtype):
+        return np.fromiter(map(itemgetter(index), rows), dtype=dtype, count=len(rows))
+
+    matrix.fill(
+        column(0, np.int64),
+        np.array(list(map(itemgetter(1), rows)), dtype='datetime64[D]'),
+        column(2, np.int64),
+        column(3, np.int64),
+    )
+    return matrix
+
+
+def _rates(matrix, axis):
+    """{name: rate array} of the days (axis=1) or devotees (axis=0) that met each goal"""
+    # An empty roster has rates of 0 rather than NaN
+    total = max(matrix.entered.shape[axis], 1)
+    rates = {'entry_rate': matrix.entered.sum(axis=axis) / total}
+    for kind, met in matrix.goals.items():
+        rates[f'{kind}_rate'] = met.sum(axis=axis) / total
+    rates['complete_rate'] = matrix.complete().sum(axis=axis) / total
+    return rates
+
+
+def _average_rounds(matrix, axis):
+    entered = matrix.entered.sum(axis=axis)
+    return matrix.rounds.sum(axis=axis) / np.maximum(entered, 1)
+
+
+def _listed(array):
+    return np.round(array, 4).tolist()
+
+
+def encode_heatmap(levels):
+    """
+    Row-major levels packed two per byte (the first in the high nibble, an odd
+    last one padded with 0), zlib-compressed and base64-encoded
+    """
+    flat = levels.astype(np.uint8).ravel()
+    if len(flat) % 2:
+        flat = np.append(flat, np.uint8(0))
+    packed = (flat[0::2] << 4) | flat[1::2]
+    # Level 1 is several times faster than the default for a few percent more bytes
+    return base64.b64encode(zlib.compress(packed.tobytes(), 1)).decode('ascii')
+
+
+def participation_report(matrix):
+    """
+    Response payload of a matrix: per-devotee and per-day rates, percentile
+    bands of the per-devotee rates and the encoded heatmap.
+    """
+    devotee_rates = _rates(matrix, 1)
+    day_rates = _rates(matrix, 0)
+
+    bands = {}
+    devotee_bands = []
+    if matrix.devotees:
+        bands = {
+            name: dict(zip((f'p{p}' for p in PERCENTILES), _listed(np.percentile(rates, PERCENTILES))))
+            for name, rates in devotee_rates.items()
+        }
+        # Quartile of each devotee's complete_rate, 1 (bottom) to 4 (top): 1 +
+        # the quartiles it is above, so a rate tied with many others (often 0)
+        # stays in the lower band
+        quartiles = np.percentile(devotee_rates['complete_rate'], (25, 50, 75))
+        devotee_bands = (np.searchsorted(quartiles, devotee_rates['complete_rate'], side='left') + 1).tolist()
+
+    devotee_columns = {name: _listed(rates) for name, rates in devotee_rates.items()}
+    devotee_columns['average_rounds'] = _listed(_average_rounds(matrix, 1))
+    devotee_columns['days_entered'] = matrix.entered.sum(axis=1).tolist()
+    day_columns = {name: _listed(rates) for name, rates in day_rates.items()}
+    day_columns['average_rounds'] = _listed(_average_rounds(matrix, 0))
+    day_columns['devotees_entered'] = matrix.entered.sum(axis=0).tolist()
+
+    return {
+        'start_date': matrix.start,
+        'end_date': matrix.start + timedelta(days=matrix.days - 1),
+        'days': matrix.days,
+        'devotees': len(matrix.devotees),
+        'per_devotee': [
+            {
+                'user_id': user_id,
+                'username': username,
+                'name': name,
+                **{column: values[index] for column, values in devotee_columns.items()},
+                'band': devotee_bands[index],
+            }
+            for index, (user_id, username, name) in enumerate(matrix.devotees)
+        ],
+        'per_day': [
+            {'date': day, **{column: values[index] for column, values in day_columns.items()}}
+            for index, day in enumerate(matrix.dates())
+        ],
+        'bands': bands,
+        'heatmap': {
+            'shape': [len(matrix.devotees), matrix.days],
+            'encoding': 'nibbles+zlib+base64',
+            'levels': ['no entry', *(f'entered, {count} of {len(KINDS)} goals met' for count in range(len(KINDS) + 1))],
+            'data': encode_heatmap(matrix.levels()),
+        },
+    }
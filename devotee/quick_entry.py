@@ -0,0 +1,88 @@
+"""
+Request handling shared by the sync and async QR quick-entry views.
+
+The steps take and return plain data; errors come back as an
+(error payload, status) pair, so the DRF views in views.py and the async
+views in async_views.py give the same responses.
+"""
+from rest_framework import status
+
+from authentication.qr_tokens import is_expired
+from .schema import clean_day_data, field_definitions
+
+
+TOKEN_REQUIRED = {"error": "Token is required."}
+INVALID_TOKEN = {"error": "Invalid or expired QR token. Please generate a new QR code from your profile."}
+EXPIRED_TOKEN = {"error": "QR token has expired. Please generate a new QR code from your profile."}
+
+
+def token_error(user):
+    """(payload, status) when a token did not resolve to a usable user, otherwise None"""
+    if user is None:
+        return INVALID_TOKEN, status.HTTP_404_NOT_FOUND
+    # Check if token is too old (1 year expiration)
+    if is_expired(user.qr_token_created_at):
+        return EXPIRED_TOKEN, status.HTTP_400_BAD_REQUEST
+    return None
+
+
+def validation_payload(user, today, day_schema, existing_activity, pending=None):
+    """
+    Response of a valid token: today's editable fields and existing data,
+    with any values still waiting in the write buffer on top
+    """
+    if pending:
+        existing_activity = {**(existing_activity or {}), **pending}
+    return {
+        "valid": True,
+        "user_name": f"{user.first_name} {user.last_name}",
+        "today": today.isoformat(),
+        "day_name": day_schema.day_name,
+        "editable_fields": list(day_schema.editable_fields),
+        # Field definitions for the frontend come precompiled, only the values are filled in
+        "field_definitions": field_definitions(day_schema, existing_activity),
+        "has_existing_data": existing_activity is not None,
+    }
+
+
+def entry_changes(day_schema, data):
+    """
+    Today's values from submitted data: (update_data, None), or
+    (None, (payload, status)) when the data is not acceptable.
+    """
+    allowed_fields = day_schema.editable_field_set
+
+    # Validate that only allowed fields are being submitted
+    invalid_fields = set(data.keys()) - allowed_fields - {'date'}  # date is allowed for validation
+    if invalid_fields:
+        return None, ({
+            "error": f"Invalid fields submitted: {', '.join(invalid_fields)}. Only today's fields are allowed."
+        }, status.HTTP_400_BAD_REQUEST)
+
+    # Every value is checked against its field's choices and range, as a
+    # buffered entry is acknowledged before the database ever sees it
+    update_data, error = clean_day_data(day_schema, data)
+    if error:
+        return None, ({"error": error}, status.HTTP_400_BAD_REQUEST)
+    return update_data, None
+
+
+def submission_payload(day_schema, activity_data, created):
+    """(payload, status) of a saved quick entry"""
+    weekday_name = day_schema.day_name
+    return {
+        "message": f"Today's ({weekday_name}) activities {'saved' if created else 'updated'} successfully!",
+        "data": activity_data,
+        "day_name": weekday_name,
+    }, status.HTTP_201_CREATED if created else status.HTTP_200_OK
+
+
+def queued_payload(day_schema, today, values):
+    """(payload, status) of a submission accepted by the write buffer, not yet written"""
+    weekday_name = day_schema.day_name
+    return {
+        "message": f"Today's ({weekday_name}) activities received and will be saved shortly!",
+        "data": {"date": today.isoformat(), **values},
+        "day_name": weekday_name,
+        "queued": True,
+    }, status.HTTP_202_ACCEPTED
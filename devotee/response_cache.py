@@ -0,0 +1,164 @@
+"""
+Per-user cache of the read-heavy GET endpoints the app calls on every open.
+
+Each user has a data version in the cache. Every write that changes what
+those endpoints show bumps it (see the signal handlers in devotee/signals.py
+and authentication/signals.py), so responses cached under an older version
+are never read again and simply expire. A hit returns the rendered JSON
+without touching the ORM or a serializer.
+
+Versions start from the clock rather than from 1, so a version key evicted
+from the cache never comes back with a value older responses were cached
+under. With several worker processes use a shared backend (e.g.
+FileBasedCache); with per-process LocMemCache another worker may serve a
+stale response for up to TIMEOUT seconds.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+_cache_settings = getattr(settings, 'RESPONSE_CACHE', {})
+ENABLED = _cache_settings.get('ENABLED', True)
+CACHE_ALIAS = _cache_settings.get('CACHE_ALIAS', 'default')
+TIMEOUT = _cache_settings.get('TIMEOUT', 300)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'response-cache:version:{user_id}'
+
+
+def data_version(user_id):
+    """Current data version of a user, started if there is none"""
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def _bump(user_ids):
+    cache = _cache()
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # Evicted or never read: a fresh start is newer than any cached response
+            cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def bump_versions(user_ids):
+    """
+    Invalidate the cached responses of these users. Inside a transaction the
+    versions are bumped again on commit, so a response read from the old
+    rows in the meantime is not kept under the new version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids or not ENABLED:
+        return
+    _bump(user_ids)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+class HitCounters:
+    """Thread-safe hit and miss counts per endpoint, for this process"""
+
+    def __init__(self):
+        self._hits = Counter()
+        self._misses = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name, hit):
+        with self._lock:
+            (self._hits if hit else self._misses)[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            hits, misses = Counter(self._hits), Counter(self._misses)
+
+        def rates(hit_count, miss_count):
+            total = hit_count + miss_count
+            return {
+                'hits': hit_count,
+                'misses': miss_count,
+                'hit_rate': round(hit_count / total, 4) if total else None,
+            }
+
+        return {
+            'enabled': ENABLED,
+            'timeout_seconds': TIMEOUT,
+            'endpoints': {name: rates(hits[name], misses[name]) for name in sorted(set(hits) | set(misses))},
+            'total': rates(sum(hits.values()), sum(misses.values())),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+
+hit_counters = HitCounters()
+
+
+def clear():
+    """Drop the whole cache alias and the counts, for tests and scratch databases"""
+    _cache().clear()
+    hit_counters.clear()
+
+
+def _response_key(name, request, version):
+    user = request.user
+    # created_at tells apart a new user given the id of a deleted one
+    joined = int(user.created_at.timestamp() * 1_000_000) if getattr(user, 'created_at', None) else 0
+    query = request.GET.urlencode()
+    # The day matters to the "current" week and month, the host to absolute URLs
+    return f'response-cache:{name}:{user.pk}:{joined}:{version}:{date.today()}:{request.get_host()}:{query}'
+
+
+def cached_per_user(name):
+    """
+    Cache a DRF view method's successful JSON responses per user, day and
+    data version. The view may only depend on the requesting user's data.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            # The browsable API and other renderers are served uncached
+            if not ENABLED or not isinstance(request.accepted_renderer, JSONRenderer):
+                return view(self, request, *args, **kwargs)
+
+            cache = _cache()
+            version = data_version(request.user.pk)
+            key = _response_key(name, request, version)
+            content = cache.get(key)
+            if content is not None:
+                hit_counters.record(name, hit=True)
+                return HttpResponse(content, content_type=request.accepted_renderer.media_type)
+
+            hit_counters.record(name, hit=False)
+            response = view(self, request, *args, **kwargs)
+            if response.status_code != 200 or getattr(response, 'data', None) is None:
+                return response
+            content = request.accepted_renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context(),
+            )
+            # A write made by the view itself (or alongside it) leaves the response uncached
+            if data_version(request.user.pk) == version:
+                cache.set(key, content, TIMEOUT)
+            return HttpResponse(content, content_type=request.accepted_renderer.media_type)
+        return wrapper
+    return decorator
@@ -0,0 +1,245 @@
+"""
+Incrementally maintained DailyActivity rollups.
+
+Every write to DailyActivity is turned into a delta that is applied to the
+per-day, per-week and per-month rollup rows of the devotee and of the global
+(user=None) scope. The admin analytics endpoint reads only these tables.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+
+from .aggregation import METRIC_FIELDS, build_chart_data, build_summary, empty_metrics, grouped_metrics
+from .models import DailyActivity, DailyRollup, WeeklyRollup, MonthlyRollup
+
+# Key columns identifying a bucket of each rollup table
+ROLLUP_KEYS = {
+    DailyRollup: ('date',),
+    WeeklyRollup: ('week_start',),
+    MonthlyRollup: ('year', 'month'),
+}
+
+
+def week_start_for(day):
+    """Monday of the week containing the given date"""
+    return day - timedelta(days=day.weekday())
+
+
+def activity_metrics(snapshot):
+    """Contribution of a single activity snapshot to every metric"""
+    return {
+        'activities_count': 1,
+        'hearing_completed': 1 if snapshot['daily_hearing'] == 'Completed' else 0,
+        'reading_completed': 1 if snapshot['daily_reading'] == 'Completed' else 0,
+        'chanting_rounds': int(snapshot['daily_chanting'] or 0),
+        'sport_attended': 1 if snapshot['sport_session_attendance'] == 'Attended' else 0,
+        'sport_sessions': 0 if snapshot['sport_session_attendance'] == 'No Session Today' else 1,
+    }
+
+
+def rollup_buckets(snapshot):
+    """All (model, lookup) pairs a snapshot contributes to"""
+    day = snapshot['date']
+    week_start = week_start_for(day)
+    for user_id in (snapshot['user_id'], None):
+        yield DailyRollup, (('user_id', user_id), ('date', day))
+        yield WeeklyRollup, (('user_id', user_id), ('week_start', week_start))
+        yield MonthlyRollup, (('user_id', user_id), ('year', day.year), ('month', day.month))
+
+
+def apply_activity_change(previous, current):
+    """
+    Apply the difference between two activity snapshots to the rollups.
+    Either side may be None for a create or a delete.
+    """
+    apply_activity_changes([(previous, current)])
+
+
+def apply_activity_changes(changes):
+    """Apply several (previous, current) changes, merging deltas that hit the same row"""
+    deltas = defaultdict(empty_metrics)
+    creatable = set()
+    for previous, current in changes:
+        for snapshot, sign in ((previous, -1), (current, 1)):
+            if snapshot is None:
+                continue
+            metrics = activity_metrics(snapshot)
+            for bucket in rollup_buckets(snapshot):
+                for field, value in metrics.items():
+                    deltas[bucket][field] += sign * value
+                if sign > 0:
+                    creatable.add(bucket)
+
+    for (model, lookup), delta in deltas.items():
+        delta = {field: value for field, value in delta.items() if value}
+        if delta:
+            # Deletes never create rows: a missing row means there is nothing to subtract
+            _apply_delta(model, dict(lookup), delta, create=(model, lookup) in creatable)
+
+
+def _apply_delta(model, lookup, delta, create):
+    updates = {field: F(field) + value for field, value in delta.items()}
+    if model.objects.filter(**lookup).update(**updates) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **delta)
+    except IntegrityError:
+        # Another writer created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+# Analytics read path
+
+def _sum_rows(rows, key):
+    """Group rollup rows by key(row) and add up their metrics"""
+    grouped = {}
+    for row in rows:
+        totals = grouped.setdefault(key(row), empty_metrics())
+        for field in METRIC_FIELDS:
+            totals[field] += row[field]
+    return grouped
+
+
+def analytics_from_rollups(scope, date_range=None, month=None, year=None):
+    """
+    Build the admin analytics summary and chart series from the rollup tables.
+    scope is a Q on the rollup user (user=None for all devotees). Weekly and
+    monthly series come from their own tables when the date filters line up
+    with whole weeks/months, otherwise they are grouped from the daily rows.
+    """
+    date_filters = Q()
+    if date_range:
+        date_filters &= Q(date__range=date_range)
+    if month:
+        date_filters &= Q(date__month=month)
+    if year:
+        date_filters &= Q(date__year=year)
+
+    daily_rows = list(DailyRollup.objects.filter(scope, date_filters).values('date', *METRIC_FIELDS))
+    days = _sum_rows(daily_rows, lambda row: row['date'])
+
+    if date_range or month or year:
+        weeks = _sum_rows(daily_rows, lambda row: week_start_for(row['date']))
+    else:
+        weeks = _sum_rows(
+            WeeklyRollup.objects.filter(scope).values('week_start', *METRIC_FIELDS),
+            lambda row: row['week_start'],
+        )
+
+    if date_range:
+        months = _sum_rows(daily_rows, lambda row: (row['date'].year, row['date'].month))
+    else:
+        month_filters = Q()
+        if month:
+            month_filters &= Q(month=month)
+        if year:
+            month_filters &= Q(year=year)
+        months = _sum_rows(
+            MonthlyRollup.objects.filter(scope, month_filters).values('year', 'month', *METRIC_FIELDS),
+            lambda row: (row['year'], row['month']),
+        )
+
+    totals = _sum_rows(daily_rows, lambda row: None).get(None, empty_metrics())
+    return {"summary": build_summary(totals), **build_chart_data(days, weeks, months)}
+
+
+def activity_count(user_id, year=None, month=None, week_start=None):
+    """
+    Number of DailyActivity rows of a devotee, summed from the rollups: at
+    most one row per month (or per day of a week) is read, however long the
+    history is.
+    """
+    if week_start is not None:
+        rows = DailyRollup.objects.filter(user_id=user_id, date__range=(week_start, week_start + timedelta(days=6)))
+        if year:
+            rows = rows.filter(date__year=year)
+        if month:
+            rows = rows.filter(date__month=month)
+    else:
+        rows = MonthlyRollup.objects.filter(user_id=user_id)
+        if year:
+            rows = rows.filter(year=year)
+        if month:
+            rows = rows.filter(month=month)
+    return rows.aggregate(total=Sum('activities_count'))['total'] or 0
+
+
+# Rebuild and drift check
+
+ROLLUP_PERIODS = {
+    DailyRollup: ('day', lambda key: (('date', key),)),
+    WeeklyRollup: ('week', lambda key: (('week_start', key),)),
+    MonthlyRollup: ('month', lambda key: (('year', key[0]), ('month', key[1]))),
+}
+
+
+def expected_rollups(user_ids=None):
+    """
+    Recompute the rollup rows straight from DailyActivity with grouped SQL.
+    Returns {model: {lookup_tuple: metrics}}. When user_ids is given only the
+    per-devotee rows of those users are computed.
+    """
+    activities = DailyActivity.objects.all()
+    if user_ids is not None:
+        activities = activities.filter(user_id__in=user_ids)
+
+    expected = {}
+    for model, (period, lookup) in ROLLUP_PERIODS.items():
+        rows = {
+            (('user_id', user_id),) + lookup(key): metrics
+            for (user_id, key), metrics in grouped_metrics(activities, period, by_user=True).items()
+        }
+        if user_ids is None:
+            rows.update(
+                ((('user_id', None),) + lookup(key), metrics)
+                for key, metrics in grouped_metrics(activities, period).items()
+            )
+        expected[model] = rows
+    return expected
+
+
+def stored_rollups(model, user_ids=None):
+    """Current rollup rows of a model as {lookup_tuple: metrics}"""
+    queryset = model.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    key_fields = ROLLUP_KEYS[model]
+    stored = {}
+    for row in queryset.values('user_id', *key_fields, *METRIC_FIELDS):
+        key = (('user_id', row['user_id']),) + tuple((name, row[name]) for name in key_fields)
+        stored[key] = {field: row[field] for field in METRIC_FIELDS}
+    return stored
+
+
+def find_drift(user_ids=None):
+    """List of (model, lookup, stored, expected) for every mismatching rollup row"""
+    drift = []
+    for model, expected in expected_rollups(user_ids).items():
+        stored = stored_rollups(model, user_ids)
+        empty = empty_metrics()
+        for key in expected.keys() | stored.keys():
+            have = stored.get(key, empty)
+            want = expected.get(key, empty)
+            if have != want:
+                drift.append((model, dict(key), have, want))
+    return drift
+
+
+@transaction.atomic
+def rebuild_rollups(user_ids=None):
+    """Replace the rollup rows with values recomputed from DailyActivity"""
+    counts = {}
+    for model, expected in expected_rollups(user_ids).items():
+        stale = model.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        model.objects.bulk_create(
+            [model(**dict(key), **metrics) for key, metrics in expected.items()],
+            batch_size=500,
+        )
+        counts[model] = len(expected)
+    return counts
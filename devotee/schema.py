@@ -0,0 +1,143 @@
+"""
+Per-weekday DailyActivity field schema.
+
+Which fields a devotee fills in depends on the day of the week. The rules,
+option lists and defaults are compiled once at import time from the
+DailyActivity model into immutable per-weekday structures that the views,
+the serializer and the QR quick-entry endpoints all share.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+from .models import DailyActivity
+
+
+# Upper bound of a PositiveIntegerField on every database backend
+MAX_NUMBER = 2147483647
+
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# ✅ Always editable fields (everyday)
+BASE_FIELDS = ("daily_hearing", "daily_reading", "daily_chanting", "sport_session_attendance")
+
+# Fields that only belong to one day of the week
+DAY_SPECIFIC_FIELDS = MappingProxyType({
+    "Monday": (),
+    "Tuesday": (),
+    "Wednesday": (),
+    "Thursday": ("thursday_morning_chanting_session_attendance",),
+    "Friday": ("friday_morning_chanting_session_attendance",),
+    "Saturday": (),
+    "Sunday": (
+        "sunday_offline_program_attendance",
+        "sunday_temple_chanting_session_attendance",
+        "weekly_discussion_session",
+        "weekly_sloka_audio_posted",
+        "weekly_seva",
+    ),
+})
+
+ALL_DAY_SPECIFIC_FIELDS = frozenset(field for fields in DAY_SPECIFIC_FIELDS.values() for field in fields)
+
+# Columns a batch upsert may overwrite on an existing day
+BATCH_UPDATE_FIELDS = ["week", *BASE_FIELDS, *sorted(ALL_DAY_SPECIFIC_FIELDS)]
+
+FIELD_LABELS = {
+    "daily_hearing": "Daily Hearing",
+    "daily_reading": "Daily Reading",
+    "daily_chanting": "Daily Chanting (Rounds)",
+    "sport_session_attendance": "Sport Session Attendance",
+    "thursday_morning_chanting_session_attendance": "Thursday Morning Chanting Session",
+    "friday_morning_chanting_session_attendance": "Friday Morning Chanting Session",
+    "sunday_offline_program_attendance": "Sunday Offline Program Attendance",
+    "sunday_temple_chanting_session_attendance": "Sunday Temple Chanting Session",
+    "weekly_discussion_session": "Weekly Discussion Session",
+    "weekly_sloka_audio_posted": "Weekly Sloka Audio Posted",
+    "weekly_seva": "Weekly Seva",
+}
+
+
+DaySchema = namedtuple('DaySchema', [
+    'day_name',
+    'editable_fields',      # tuple, in display order
+    'editable_field_set',   # frozenset of the same fields
+    'hidden_fields',        # frozenset of other days' fields, left out of responses
+    'defaults',             # {field: default value}
+    'definitions',          # {field: read-only field definition without its value}
+])
+
+
+def _field_definition(name):
+    field = DailyActivity._meta.get_field(name)
+    definition = {"label": FIELD_LABELS[name]}
+    if field.choices:
+        definition["type"] = "select"
+        definition["options"] = tuple(
+            MappingProxyType({"value": value, "label": label}) for value, label in field.choices
+        )
+    else:
+        definition["type"] = "number"
+        definition["min"] = 0
+        definition["max"] = MAX_NUMBER
+    return MappingProxyType(definition), field.get_default()
+
+
+def _compile_day(day_name, field_definitions):
+    editable = BASE_FIELDS + DAY_SPECIFIC_FIELDS[day_name]
+    definitions = {name: field_definitions[name][0] for name in editable}
+    return DaySchema(
+        day_name=day_name,
+        editable_fields=editable,
+        editable_field_set=frozenset(editable),
+        hidden_fields=ALL_DAY_SPECIFIC_FIELDS - set(DAY_SPECIFIC_FIELDS[day_name]),
+        defaults=MappingProxyType({name: field_definitions[name][1] for name in editable}),
+        definitions=MappingProxyType(definitions),
+    )
+
+
+def _compile():
+    field_definitions = {name: _field_definition(name) for name in FIELD_LABELS}
+    return tuple(_compile_day(day_name, field_definitions) for day_name in DAY_NAMES)
+
+
+# Indexed by date.weekday(): 0 is Monday
+WEEKDAY_SCHEMAS = _compile()
+
+
+def schema_for(day):
+    """Compiled schema of the weekday of a date"""
+    return WEEKDAY_SCHEMAS[day.weekday()]
+
+
+def field_definitions(schema, values=None):
+    """Field definitions of a day merged with the current values (or defaults)"""
+    values = values or {}
+    return {
+        name: {**definition, "value": values.get(name, schema.defaults[name])}
+        for name, definition in schema.definitions.items()
+    }
+
+
+def clean_day_data(schema, data):
+    """
+    Validated editable values of one day from submitted data; keys that are
+    not editable on that day are ignored. Returns (values, error).
+    """
+    values = {}
+    for name, definition in schema.definitions.items():
+        if name not in data:
+            continue
+        value = data[name]
+        if definition["type"] == "number":
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return None, f"{definition['label']} must be a valid number."
+            if value < definition["min"]:
+                return None, f"{definition['label']} cannot be negative."
+            if value > definition["max"]:
+                return None, f"{definition['label']} cannot be more than {definition['max']}."
+        elif not isinstance(value, str) or value not in {option["value"] for option in definition["options"]}:
+            return None, f"Invalid value for {definition['label']}: {value}."
+        values[name] = value
+    return values, None
@@ -1,6 +1,9 @@
+from datetime import date
+
 from rest_framework import serializers
 from .models import DailyActivity,Week,MonthlyActivity
-from datetime import datetime
+from .schema import WEEKDAY_SCHEMAS, schema_for
+from .weeks import calendar
 
 class WeekSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,53 +23,90 @@ class DailyActivitySerializer(serializers.ModelSerializer):
     
     def get_day_name(self, obj):
         """Get the day name from the date"""
-        return obj.date.strftime("%A")
+        return schema_for(obj.date).day_name
     
     def to_representation(self, instance):
         """Filter out day-specific fields that aren't relevant for this day"""
         data = super().to_representation(instance)
-        day_name = instance.date.strftime("%A")
-        
-        # Define which fields are relevant for each day
-        day_specific_fields = {
-            "Monday": [],
-            "Tuesday": [],
-            "Wednesday": [],
-            "Thursday": ["thursday_morning_chanting_session_attendance"],
-            "Friday": ["friday_morning_chanting_session_attendance"],
-            "Saturday": [],
-            "Sunday": [
-                "sunday_offline_program_attendance",
-                "sunday_temple_chanting_session_attendance",
-                "weekly_discussion_session",
-                "weekly_sloka_audio_posted",
-                "weekly_seva"
-            ]
-        }
-        
-        # Get fields that should be shown for this day
-        allowed_day_fields = day_specific_fields.get(day_name, [])
-        
-        # Collect all day-specific fields from all days
-        all_day_specific_fields = []
-        for fields_list in day_specific_fields.values():
-            all_day_specific_fields.extend(fields_list)
         
-        # Remove fields that aren't relevant for this day
         # Always remove irrelevant day-specific fields to avoid showing them in filtered views
-        for field in all_day_specific_fields:
-            if field not in allowed_day_fields and field in data:
-                del data[field]
+        for field in schema_for(instance.date).hidden_fields:
+            data.pop(field, None)
         
         return data
 
 
 
+class DailyActivityRowSerializer:
+    """
+    Read-only fast path of DailyActivitySerializer for listings.
+
+    Works on the values() rows returned by rows(queryset) and gives exactly
+    the output of DailyActivitySerializer, but the output
+    keys and converters of every weekday are worked out once instead of
+    running the DRF field machinery per row.
+    """
+    # values() key of each output key that is not a plain column; day_name comes from the date
+    sources = {
+        'user': 'user__username',
+        'week_name': 'week__name',
+        'day_name': None,
+        'week': 'week_id',
+    }
+    converters = {
+        'date': date.isoformat,
+        'created_at': serializers.DateTimeField().to_representation,
+    }
+
+    def __init__(self):
+        output_keys = list(DailyActivitySerializer().fields)
+        self.values_fields = tuple(
+            self.sources.get(name, name) for name in output_keys if self.sources.get(name, name)
+        )
+        # Per weekday: (day name, ((output key, values() key, converter or None), ...))
+        self.plans = tuple(
+            (schema.day_name, tuple(
+                (name, self.sources.get(name, name), self.converters.get(name))
+                for name in output_keys if name not in schema.hidden_fields
+            ))
+            for schema in WEEKDAY_SCHEMAS
+        )
+
+    def rows(self, queryset):
+        """The values() rows of a DailyActivity queryset this serializer reads"""
+        return queryset.values(*self.values_fields)
+
+    def to_representation(self, row):
+        day_name, plan = self.plans[row['date'].weekday()]
+        data = {}
+        for name, source, convert in plan:
+            if source is None:
+                data[name] = day_name
+                continue
+            value = row[source]
+            data[name] = convert(value) if convert is not None and value is not None else value
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+daily_activity_rows = DailyActivityRowSerializer()
+
+
 class MonthlyActivitySerializer(serializers.ModelSerializer):
-    weeks = WeekSerializer(many=True, read_only=True)
+    weeks = serializers.SerializerMethodField()
     user = serializers.ReadOnlyField(source='user.username')
 
     class Meta:
         model = MonthlyActivity
         fields = '__all__'
-        read_only_fields = ['id', 'created_at', 'updated_at', 'user']
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at', 'user']
+
+    def get_weeks(self, monthly_activity):
+        if monthly_activity.pk is None:
+            # Not saved yet (see current-month): the weeks it is linked to once saved
+            weeks = calendar.weeks_in_month(monthly_activity.year, monthly_activity.month)
+        else:
+            weeks = monthly_activity.weeks.all()
+        return WeekSerializer(weeks, many=True).data
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Keeps derived data in sync with DailyActivity and MonthlyActivity writes.
+
+Saves and deletes are turned into (previous, current) snapshots and handed to
+activity_changed / monthly_activity_changed, which every derived store hooks
+into. Bulk write paths that bypass model signals must call them themselves.
+Every change also invalidates the user's cached GET responses.
+"""
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import DailyActivity, MonthlyActivity
+from . import leaderboard, response_cache, rollups, statistics, streaks
+from .weeks import link_calendar_weeks
+
+
+def snapshot_fields(model):
+    return tuple(field.attname for field in model._meta.concrete_fields)
+
+
+SNAPSHOT_FIELDS = snapshot_fields(DailyActivity)
+MONTHLY_SNAPSHOT_FIELDS = snapshot_fields(MonthlyActivity)
+
+
+def activity_snapshot(instance):
+    """Plain dict of the concrete field values of an activity"""
+    return {field: getattr(instance, field) for field in snapshot_fields(type(instance))}
+
+
+def _changed_users(*snapshots):
+    return {snapshot['user_id'] for snapshot in snapshots if snapshot is not None}
+
+
+def activity_changed(previous, current):
+    """Propagate one DailyActivity change (snapshots or None) to derived stores"""
+    activities_changed([(previous, current)])
+
+
+def activities_changed(changes):
+    """Propagate a batch of (previous, current) DailyActivity changes to derived stores"""
+    rollups.apply_activity_changes(changes)
+    statistics.apply_activity_changes(changes)
+    leaderboard.apply_activity_changes(changes)
+    streaks.apply_activity_changes(changes)
+    response_cache.bump_versions(_changed_users(*(snapshot for change in changes for snapshot in change)))
+
+
+def monthly_activity_changed(previous, current):
+    """Propagate one MonthlyActivity change (snapshots or None) to derived stores"""
+    statistics.apply_monthly_change(previous, current)
+    response_cache.bump_versions(_changed_users(previous, current))
+
+
+HANDLERS = {
+    DailyActivity: activity_changed,
+    MonthlyActivity: monthly_activity_changed,
+}
+
+
+def _previous_snapshot(sender, instance):
+    fields = snapshot_fields(sender)
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and all(field in loaded for field in fields):
+        return loaded
+    return sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(pre_save, sender=DailyActivity)
+@receiver(pre_save, sender=MonthlyActivity)
+def remember_previous_activity(sender, instance, raw=False, **kwargs):
+    instance._previous_snapshot = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_snapshot = _previous_snapshot(sender, instance)
+
+
+@receiver(post_save, sender=DailyActivity)
+@receiver(post_save, sender=MonthlyActivity)
+def activity_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = activity_snapshot(instance)
+    HANDLERS[sender](getattr(instance, '_previous_snapshot', None), current)
+    instance._loaded_values = current
+
+
+@receiver(post_save, sender=MonthlyActivity)
+def link_new_month(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        link_calendar_weeks([instance])
+
+
+@receiver(post_delete, sender=DailyActivity)
+@receiver(post_delete, sender=MonthlyActivity)
+def activity_deleted(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None)
+    HANDLERS[sender](loaded if loaded is not None else activity_snapshot(instance), None)
+
+
+@receiver(m2m_changed, sender=MonthlyActivity.weeks.through)
+def monthly_weeks_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # weeks.set() sends the signals even when nothing is added or removed
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return
+    response_cache.bump_versions({instance.user_id})
@@ -0,0 +1,98 @@
+"""
+SQLite connection setup and retries of writes that find the database locked.
+
+Every new SQLite connection runs the PRAGMAs of settings.SQLITE_CONNECTION
+(WAL journaling, synchronous=NORMAL, busy_timeout, ...), so readers no
+longer wait for writers and one writer waits for another instead of
+failing. DATABASES sets transaction_mode IMMEDIATE, which takes the write
+lock when a transaction begins; a deferred transaction that reads first
+fails without waiting when it tries to upgrade. A writer can still give up
+after busy_timeout under a long burst, which retry_on_locked covers by
+running the whole write again after a backoff. As every transaction holds
+the write lock from its start, views wrap only their writes with it and do
+their reads and validation outside.
+"""
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+DEFAULTS = {
+    'PRAGMAS': {},
+    'LOCKED_RETRIES': 5,
+    'RETRY_BACKOFF_SECONDS': 0.05,
+}
+
+
+def connection_settings():
+    return {**DEFAULTS, **getattr(settings, 'SQLITE_CONNECTION', {})}
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in connection_settings()['PRAGMAS'].items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return 'locked' in str(error)
+
+
+class RetryCounters:
+    """Thread-safe counts of retried and abandoned writes, for this process"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'retries': self._counts['retries'], 'gave_up': self._counts['gave_up']}
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+retry_counters = RetryCounters()
+
+
+def retry_on_locked(func):
+    """
+    Run func in a transaction, again after a jittered exponential backoff
+    while it fails with "database is locked". The transaction makes a
+    retry all-or-nothing; inside an outer transaction func runs once, as
+    only the outermost block can be retried.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        options = connection_settings()
+        attempt = 0
+        while True:
+            retryable = not connection.in_atomic_block
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as error:
+                if not (retryable and is_locked(error)) or attempt >= options['LOCKED_RETRIES']:
+                    if retryable and is_locked(error):
+                        retry_counters.add('gave_up')
+                    raise
+            retry_counters.add('retries')
+            time.sleep(options['RETRY_BACKOFF_SECONDS'] * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+    return wrapper
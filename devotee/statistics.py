@@ -0,0 +1,193 @@
+"""
+Per-devotee statistics snapshot.
+
+DevoteeStatistics holds every counter shown on the spiritual-growth screen.
+Activity writes adjust it by delta; rebuild_statistics recomputes it from the
+activity tables when it is missing or has drifted.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+
+from .models import DailyActivity, MonthlyActivity, DevoteeStatistics
+
+
+# Counter column -> (DailyActivity field, value that counts)
+DAILY_COUNTERS = {
+    'sport_session_attendance_count': ('sport_session_attendance', 'Attended'),
+    'thursday_chanting_count': ('thursday_morning_chanting_session_attendance', 'Attended'),
+    'sunday_offline_program_count': ('sunday_offline_program_attendance', 'Attended'),
+    'sunday_temple_chanting_count': ('sunday_temple_chanting_session_attendance', 'Attended'),
+    'weekly_seva_count': ('weekly_seva', 'Yes'),
+}
+
+# Book column -> monthly_book_completed value
+BOOK_COLUMNS = {
+    'completed_books': 'Completed',
+    'partially_completed_books': 'Partially Completed',
+}
+
+STATISTIC_FIELDS = (
+    'total_chanting_rounds',
+    'highest_chanting_rounds',
+    *DAILY_COUNTERS,
+    'morning_program_count',
+    *BOOK_COLUMNS,
+)
+
+
+def _rounds(snapshot):
+    return int(snapshot['daily_chanting'] or 0) if snapshot else 0
+
+
+def compute_statistics(user_id):
+    """Recompute every counter from the activity tables (one query per table)"""
+    daily = DailyActivity.objects.filter(user_id=user_id).aggregate(
+        total_chanting_rounds=Sum('daily_chanting'),
+        highest_chanting_rounds=Max('daily_chanting'),
+        **{
+            column: Count('id', filter=Q(**{field: value}))
+            for column, (field, value) in DAILY_COUNTERS.items()
+        },
+    )
+    values = {field: value or 0 for field, value in daily.items()}
+
+    values['morning_program_count'] = 0
+    for column in BOOK_COLUMNS:
+        values[column] = {}
+    monthly_rows = MonthlyActivity.objects.filter(user_id=user_id).values(
+        'monthly_morning_program', 'monthly_book_completed', 'book_name'
+    )
+    for row in monthly_rows:
+        _add_monthly(values, row, 1)
+    return values
+
+
+def _add_monthly(values, snapshot, sign):
+    if snapshot['monthly_morning_program'] == 'Attended':
+        values['morning_program_count'] += sign
+    for column, status in BOOK_COLUMNS.items():
+        if snapshot['monthly_book_completed'] == status and snapshot['book_name']:
+            books = values[column]
+            books[snapshot['book_name']] = books.get(snapshot['book_name'], 0) + sign
+            if books[snapshot['book_name']] <= 0:
+                del books[snapshot['book_name']]
+
+
+def rebuild_statistics(user_id):
+    """Replace a devotee's snapshot with freshly computed values"""
+    values = compute_statistics(user_id)
+    stats, _ = DevoteeStatistics.objects.update_or_create(user_id=user_id, defaults=values)
+    return stats
+
+
+def find_statistics_drift(user_id):
+    """{field: (stored, expected)} for every counter that no longer matches"""
+    expected = compute_statistics(user_id)
+    stored = DevoteeStatistics.objects.filter(user_id=user_id).values(*STATISTIC_FIELDS).first() or {}
+    return {
+        field: (stored.get(field), value)
+        for field, value in expected.items()
+        if stored.get(field) != value
+    }
+
+
+def get_statistics(user):
+    """Snapshot of a devotee, built on first use"""
+    try:
+        return DevoteeStatistics.objects.get(pk=user.pk)
+    except DevoteeStatistics.DoesNotExist:
+        return rebuild_statistics(user.pk)
+
+
+def _locked_statistics(user_id, rebuild_if_missing):
+    stats = DevoteeStatistics.objects.select_for_update().filter(pk=user_id).first()
+    if stats is None and rebuild_if_missing:
+        # The write is already in the activity tables, so a rebuild includes it
+        rebuild_statistics(user_id)
+    return stats
+
+
+def apply_activity_change(previous, current):
+    """Adjust the snapshot for one DailyActivity change (snapshots or None)"""
+    apply_activity_changes([(previous, current)])
+
+
+@transaction.atomic
+def apply_activity_changes(changes):
+    """Adjust the snapshots for several (previous, current) DailyActivity changes"""
+    by_user = {}
+    for previous, current in changes:
+        for user_id in {snapshot['user_id'] for snapshot in (previous, current) if snapshot}:
+            by_user.setdefault(user_id, []).append((
+                previous if previous and previous['user_id'] == user_id else None,
+                current if current and current['user_id'] == user_id else None,
+            ))
+
+    for user_id, user_changes in by_user.items():
+        # Deletes never create a snapshot: the devotee may be being deleted too
+        creates = any(new is not None for old, new in user_changes)
+        stats = _locked_statistics(user_id, rebuild_if_missing=creates)
+        if stats is None:
+            continue
+
+        lookup_highest = False
+        for old, new in user_changes:
+            stats.total_chanting_rounds += _rounds(new) - _rounds(old)
+            for column, (field, value) in DAILY_COUNTERS.items():
+                change = (1 if new and new[field] == value else 0) - (1 if old and old[field] == value else 0)
+                setattr(stats, column, getattr(stats, column) + change)
+
+            if _rounds(new) >= stats.highest_chanting_rounds:
+                stats.highest_chanting_rounds = _rounds(new)
+            elif old and _rounds(old) >= stats.highest_chanting_rounds:
+                # The best day went down or away, so the maximum has to be looked up again
+                lookup_highest = True
+
+        if lookup_highest:
+            stats.highest_chanting_rounds = DailyActivity.objects.filter(user_id=user_id).aggregate(
+                highest=Max('daily_chanting')
+            )['highest'] or 0
+        stats.save()
+
+
+@transaction.atomic
+def apply_monthly_change(previous, current):
+    """Adjust the snapshot for one MonthlyActivity change (snapshots or None)"""
+    for user_id in {snapshot['user_id'] for snapshot in (previous, current) if snapshot}:
+        old = previous if previous and previous['user_id'] == user_id else None
+        new = current if current and current['user_id'] == user_id else None
+        stats = _locked_statistics(user_id, rebuild_if_missing=new is not None)
+        if stats is None:
+            continue
+
+        values = {
+            'morning_program_count': stats.morning_program_count,
+            **{column: dict(getattr(stats, column)) for column in BOOK_COLUMNS},
+        }
+        if old:
+            _add_monthly(values, old, -1)
+        if new:
+            _add_monthly(values, new, 1)
+        for field, value in values.items():
+            setattr(stats, field, value)
+        stats.save()
+
+
+def statistics_response(stats):
+    """Payload of the spiritual-growth endpoint"""
+    completed_books = sorted(stats.completed_books)
+    partially_completed_books = sorted(stats.partially_completed_books)
+    return {
+        "total_chanting_rounds": stats.total_chanting_rounds,
+        "highest_chanting_rounds": stats.highest_chanting_rounds,
+        "sport_session_attendance_count": stats.sport_session_attendance_count,
+        "total_books_completed": len(completed_books),
+        "total_books_partially_completed": len(partially_completed_books),
+        "completed_books": completed_books,
+        "partially_completed_books": partially_completed_books,
+        "morning_program_count": stats.morning_program_count,
+        "thursday_chanting_count": stats.thursday_chanting_count,
+        "sunday_offline_program_count": stats.sunday_offline_program_count,
+        "sunday_temple_chanting_count": stats.sunday_temple_chanting_count,
+        "weekly_seva_count": stats.weekly_seva_count,
+    }
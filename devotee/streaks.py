@@ -0,0 +1,196 @@
+"""
+Streaks of consecutive days a devotee met a daily goal.
+
+DevoteeStreak keeps, per devotee and kind, the latest run of qualifying days
+(current_start..current_end) and the longest run that ended before it. A
+write of the day after current_end extends the run in place, so ordinary
+in-order entry costs one row update. Edits and deletes of days inside or
+next to the latest run repair it from the days around it; only a change to
+an older run, a day joining the latest run to an older one, or removing the
+last day of the latest one recomputes the kind from the devotee's history.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import DailyActivity, DevoteeStreak
+
+
+MIN_CHANTING_ROUNDS = getattr(settings, 'STREAKS', {}).get('MIN_CHANTING_ROUNDS', 16)
+
+# Kind -> (whether an activity snapshot qualifies, the same test as a filter)
+KINDS = {
+    'chanting': (
+        lambda snapshot: int(snapshot['daily_chanting'] or 0) >= MIN_CHANTING_ROUNDS,
+        Q(daily_chanting__gte=MIN_CHANTING_ROUNDS),
+    ),
+    'hearing': (lambda snapshot: snapshot['daily_hearing'] == 'Completed', Q(daily_hearing='Completed')),
+    'reading': (lambda snapshot: snapshot['daily_reading'] == 'Completed', Q(daily_reading='Completed')),
+}
+
+ONE_DAY = timedelta(days=1)
+
+
+def _qualifying_dates(user_id, kind):
+    return DailyActivity.objects.filter(KINDS[kind][1], user_id=user_id).order_by('date').values_list('date', flat=True)
+
+
+def compute_streak(user_id, kind):
+    """(current_start, current_end, longest_before) from the devotee's whole history"""
+    start = end = None
+    longest_before = 0
+    for day in _qualifying_dates(user_id, kind).iterator():
+        if end is not None and day == end + ONE_DAY:
+            end = day
+            continue
+        if end is not None:
+            longest_before = max(longest_before, _length(start, end))
+        start = end = day
+    return start, end, longest_before
+
+
+def rebuild_streaks(user_id, kinds=KINDS):
+    """Replace the devotee's streaks with freshly computed ones, returns them by kind"""
+    streaks = {}
+    for kind in kinds:
+        start, end, longest_before = compute_streak(user_id, kind)
+        streaks[kind], _ = DevoteeStreak.objects.update_or_create(
+            user_id=user_id, kind=kind,
+            defaults={'current_start': start, 'current_end': end, 'longest_before': longest_before},
+        )
+    return streaks
+
+
+def find_streak_drift(user_id):
+    """{kind: (stored, expected)} for every streak that no longer matches"""
+    stored = {
+        streak.kind: (streak.current_start, streak.current_end, streak.longest_before)
+        for streak in DevoteeStreak.objects.filter(user_id=user_id)
+    }
+    drift = {}
+    for kind in KINDS:
+        expected = compute_streak(user_id, kind)
+        if stored.get(kind) != expected:
+            drift[kind] = (stored.get(kind), expected)
+    return drift
+
+
+def _length(start, end):
+    return (end - start).days + 1 if end is not None else 0
+
+
+def _run_start(user_id, kind, day):
+    """First day of the run of qualifying days ending on `day`, reading only that run"""
+    start = day
+    dates = _qualifying_dates(user_id, kind).filter(date__lt=day).order_by('-date')
+    for earlier in dates.iterator(chunk_size=100):
+        if earlier != start - ONE_DAY:
+            break
+        start = earlier
+    return start
+
+
+def _apply_day(streak, day, qualifies):
+    """
+    Move the stored run for one day that started or stopped qualifying.
+    Returns False when only a recompute can tell the new state.
+    """
+    start, end = streak.current_start, streak.current_end
+    if qualifies:
+        if end is None:
+            streak.current_start = streak.current_end = day
+        elif day == end + ONE_DAY:
+            streak.current_end = day
+        elif day > end:
+            streak.longest_before = max(streak.longest_before, _length(start, end))
+            streak.current_start = streak.current_end = day
+        elif day == start - ONE_DAY:
+            streak.current_start = _run_start(streak.user_id, streak.kind, day)
+            # Joining the run that ended the day before takes it out of longest_before
+            if streak.current_start != day:
+                return False
+        else:
+            return False
+    else:
+        if end is None or not start <= day <= end or start == end:
+            return False
+        if day == end:
+            streak.current_end = day - ONE_DAY
+        elif day == start:
+            streak.current_start = day + ONE_DAY
+        else:
+            streak.longest_before = max(streak.longest_before, _length(start, day - ONE_DAY))
+            streak.current_start = day + ONE_DAY
+    return True
+
+
+@transaction.atomic
+def apply_activity_changes(changes):
+    """Update the streaks for several (previous, current) DailyActivity changes"""
+    days = {}
+    for previous, current in changes:
+        for snapshot in (previous, current):
+            if snapshot is not None:
+                days.setdefault((snapshot['user_id'], snapshot['date']), [None, None])
+        if previous is not None:
+            days[(previous['user_id'], previous['date'])][0] = previous
+        if current is not None:
+            days[(current['user_id'], current['date'])][1] = current
+
+    by_user = {}
+    writers = set()
+    for (user_id, day), (old, new) in sorted(days.items()):
+        by_user.setdefault(user_id, {})
+        if new is not None:
+            writers.add(user_id)
+        for kind, (qualifies, _) in KINDS.items():
+            was, now = bool(old and qualifies(old)), bool(new and qualifies(new))
+            if was != now:
+                by_user[user_id].setdefault(kind, []).append((day, now))
+
+    for user_id, kinds in by_user.items():
+        if not kinds:
+            continue
+        streaks = {
+            streak.kind: streak
+            for streak in DevoteeStreak.objects.select_for_update().filter(user_id=user_id)
+        }
+        # Every kind at once, so a devotee's first goal met also starts the others
+        missing = [kind for kind in KINDS if kind not in streaks]
+        if missing and user_id in writers:
+            # The write is already in the activity table, so a rebuild includes it.
+            # Deletes never create streaks: the devotee may be being deleted too.
+            rebuild_streaks(user_id, missing)
+        for kind, streak in streaks.items():
+            if kind not in kinds:
+                continue
+            if all(_apply_day(streak, day, now) for day, now in kinds[kind]):
+                streak.save()
+            else:
+                rebuild_streaks(user_id, [kind])
+
+
+def streak_summary(user_id, streaks=None, today=None):
+    """
+    {kind: {current, longest, last_day}} of a devotee, from `streaks` (its
+    DevoteeStreak rows) when given. A run still counts as current when its
+    last day is yesterday, as today may not be entered yet.
+    """
+    today = today or date.today()
+    by_kind = {streak.kind: streak for streak in (streaks if streaks is not None else DevoteeStreak.objects.filter(user_id=user_id))}
+    missing = [kind for kind in KINDS if kind not in by_kind]
+    if missing:
+        by_kind.update(rebuild_streaks(user_id, missing))
+
+    summary = {}
+    for kind in KINDS:
+        streak = by_kind[kind]
+        length = _length(streak.current_start, streak.current_end)
+        summary[kind] = {
+            'current': length if streak.current_end and streak.current_end >= today - ONE_DAY else 0,
+            'longest': max(streak.longest_before, length),
+            'last_day': streak.current_end,
+        }
+    return summary
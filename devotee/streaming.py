@@ -0,0 +1,75 @@
+"""
+Helpers for responses that are written while the rows are still being read.
+
+Rows come from a chunked queryset iterator and are rendered piece by piece,
+so memory use does not grow with the number of rows.
+"""
+import json
+from datetime import timedelta
+
+from .serializers import daily_activity_rows
+from .weeks import calendar
+
+
+# Rows fetched from the database per round trip
+ROW_CHUNK_SIZE = 500
+
+# Approximate size of each chunk handed to the streaming response
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+
+def buffered(parts, size=OUTPUT_CHUNK_SIZE):
+    """Join small strings into chunks of about `size` characters"""
+    buffer = []
+    length = 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def week_header(week, today):
+    """Week block of the DailyActivity filter response, without its activities"""
+    current_week_start = today - timedelta(days=today.weekday())
+    return {
+        "week_id": week.id,
+        "week_name": week.name,
+        "start_date": str(week.start_date),
+        "end_date": str(week.end_date),
+        "month": week.month,
+        "year": week.year,
+        "is_current_week": current_week_start <= week.start_date <= current_week_start + timedelta(days=6),
+    }
+
+
+def week_grouped_json(queryset, today):
+    """
+    JSON text of {"weeks": [...], "total_count": n} for a DailyActivity
+    queryset ordered by date, produced one row at a time. Days of a week are
+    contiguous in date order, so each week block is closed before the next
+    one starts.
+    """
+    rows = daily_activity_rows.rows(queryset).iterator(chunk_size=ROW_CHUNK_SIZE)
+    current_week_id = None
+    total = 0
+    yield '{"weeks":['
+    for row in rows:
+        if row['week_id'] != current_week_id:
+            if current_week_id is not None:
+                yield ']},'
+            current_week_id = row['week_id']
+            header = week_header(calendar.get(current_week_id), today)
+            yield '{' + ''.join(f'{json.dumps(key)}:{json.dumps(value)},' for key, value in header.items())
+            yield '"activities":['
+        else:
+            yield ','
+        yield json.dumps(daily_activity_rows.to_representation(row))
+        total += 1
+    if current_week_id is not None:
+        yield ']}'
+    yield f'],"total_count":{total}}}'
@@ -1,3 +1,1163 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import zlib
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import m2m_changed
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from authentication.qr_tokens import hash_token, token_cache
+from authentication.token_auth import ClaimsRefreshToken
+from . import response_cache
+from .aggregation import activity_analytics, grouped_metrics
+from .leaderboard import find_leaderboard_drift, standing, top_page
+from .schema import WEEKDAY_SCHEMAS, clean_day_data
+from .serializers import DailyActivitySerializer, daily_activity_rows
+from .statistics import compute_statistics, find_statistics_drift, get_statistics
+from .streaks import find_streak_drift, streak_summary
+from .sqlite import retry_counters, retry_on_locked
+from .models import DailyActivity, DailyRollup, MonthlyActivity, Week
+from .rollups import find_drift
+from .participation import build_matrix, participation_report
+from .weeks import calendar, week_for
+from .write_buffer import QuickEntryBuffer
+
+
+class CleanDayDataTests(SimpleTestCase):
+    """Submitted values the database could not store are rejected with a message"""
+
+    def test_values_out_of_range_or_of_the_wrong_type(self):
+        schema = WEEKDAY_SCHEMAS[0]
+        self.assertEqual(
+            clean_day_data(schema, {'daily_chanting': '16', 'daily_reading': 'Completed'}),
+            ({'daily_chanting': 16, 'daily_reading': 'Completed'}, None),
+        )
+        for data in (
+            {'daily_chanting': 2 ** 31},
+            {'daily_chanting': 2 ** 70},
+            {'daily_chanting': -1},
+            {'daily_reading': ['Completed']},
+            {'daily_reading': {'value': 'Completed'}},
+            {'daily_reading': 'Done'},
+        ):
+            values, error = clean_day_data(schema, data)
+            self.assertIsNone(values, data)
+            self.assertTrue(error)
+
+
+class DailyActivityRowSerializerTests(TestCase):
+    """The values() fast path gives exactly the output of DailyActivitySerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+        start = date(2024, 1, 1)
+        for offset in range(7):
+            day = start + timedelta(days=offset)
+            DailyActivity.objects.create(
+                user=cls.devotee, date=day, week=week_for(day), daily_chanting=offset * 4,
+                feedback_for_this_week=None if offset % 2 else f'Feedback {offset}',
+                sunday_offline_program_attendance='Attended',
+            )
+
+    def test_every_weekday(self):
+        queryset = DailyActivity.objects.filter(user=self.devotee).order_by('date')
+        expected = [dict(item) for item in DailyActivitySerializer(queryset, many=True).data]
+        rows = list(daily_activity_rows.rows(queryset))
+        self.assertEqual(daily_activity_rows.many(rows), expected)
+        self.assertEqual([item['day_name'] for item in expected][0::6], ['Monday', 'Sunday'])
+        self.assertEqual({item['user'] for item in expected}, {'9000000001'})
+        self.assertEqual({item['week_name'] for item in expected}, {'Week of 2024-01-01'})
+        self.assertNotIn('sunday_offline_program_attendance', expected[0])
+        self.assertEqual(expected[6]['sunday_offline_program_attendance'], 'Attended')
+
+    def test_null_week_and_values(self):
+        # As a row without a week would come out of the outer join
+        activity = DailyActivity.objects.filter(user=self.devotee).select_related('user').order_by('date')[1]
+        row = {**daily_activity_rows.rows(DailyActivity.objects.filter(pk=activity.pk)).get(), 'week_id': None, 'week__name': None}
+        activity.week = None
+        expected = dict(DailyActivitySerializer(activity).data)
+        self.assertEqual((expected['week'], expected['week_name'], expected['feedback_for_this_week']), (None, None, None))
+        self.assertEqual(daily_activity_rows.to_representation(row), expected)
+
+
+class AsyncQuickEntryTests(TestCase):
+    """The async quick-entry views answer exactly like the sync ones"""
+
+    token = 'quick-entry-test-token'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+            qr_token_hash=hash_token(cls.token), qr_token_created_at=timezone.now(),
+        )
+
+    def setUp(self):
+        token_cache.clear()
+
+    def both(self, method, name, token=None, data=None):
+        """(sync response, async response) of the same request"""
+        responses = []
+        for suffix in ('', '-async'):
+            url = reverse(name + suffix, kwargs={'token': token or self.token})
+            if method == 'post':
+                responses.append(self.client.post(url, data, content_type='application/json'))
+            else:
+                responses.append(self.client.get(url))
+        return responses
+
+    def assertSameResponse(self, responses):
+        sync, asynchronous = responses
+        self.assertEqual(sync.status_code, asynchronous.status_code)
+        self.assertEqual(sync.json(), asynchronous.json())
+
+    def test_validate(self):
+        self.assertSameResponse(self.both('get', 'validate-qr-token'))
+        self.assertSameResponse(self.both('get', 'validate-qr-token', token='unknown'))
+
+    def test_submit_errors(self):
+        self.assertSameResponse(self.both('post', 'submit-quick-entry', data={'not_a_field': 1}))
+        self.assertSameResponse(self.both('post', 'submit-quick-entry', data={'daily_chanting': 'many'}))
+        self.assertSameResponse(self.both('post', 'submit-quick-entry', data={'daily_chanting': -1}))
+        self.assertSameResponse(self.both('post', 'submit-quick-entry', data={'daily_chanting': 2 ** 70}))
+        self.assertSameResponse(self.both('post', 'submit-quick-entry', data={'daily_reading': 'Done'}))
+        self.assertEqual(self.both('post', 'submit-quick-entry', data={'daily_reading': ['Completed']})[0].status_code, 400)
+        self.assertSameResponse(self.both('post', 'submit-quick-entry', token='unknown', data={'daily_chanting': 1}))
+
+    def test_submit_then_validate(self):
+        url = reverse('submit-quick-entry-async', kwargs={'token': self.token})
+        created = self.client.post(url, {'daily_chanting': 16}, content_type='application/json')
+        self.assertEqual(created.status_code, 201)
+        updated = self.client.post(url, {'daily_chanting': 8}, content_type='application/json')
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.json()['data']['daily_chanting'], 8)
+        self.assertEqual(DailyActivity.objects.get(user=self.devotee).daily_chanting, 8)
+
+        self.assertSameResponse(self.both('get', 'validate-qr-token'))
+        self.assertTrue(self.client.get(reverse('validate-qr-token-async', kwargs={'token': self.token})).json()['has_existing_data'])
+
+
+class QuickEntryBufferTests(TestCase):
+    """Buffered quick entries are merged, journaled and written in one batch"""
+
+    token = 'quick-entry-test-token'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+            qr_token_hash=hash_token(cls.token), qr_token_created_at=timezone.now(),
+        )
+
+    def setUp(self):
+        token_cache.clear()
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.journal_dir = journal_dir.name
+        self.buffer = QuickEntryBuffer(enabled=True, journal_dir=self.journal_dir, flush_interval=None, fsync=False)
+
+    def test_submissions_are_merged_and_flushed(self):
+        day = date.today()
+        self.buffer.submit(self.devotee.pk, day, {'daily_chanting': 4})
+        merged = self.buffer.submit(self.devotee.pk, day, {'daily_chanting': 16, 'daily_reading': 'Completed'})
+        self.assertEqual(merged, {'daily_chanting': 16, 'daily_reading': 'Completed'})
+        self.assertFalse(DailyActivity.objects.exists())
+
+        self.assertEqual(self.buffer.flush(), 1)
+        activity = DailyActivity.objects.get(user=self.devotee, date=day)
+        self.assertEqual((activity.daily_chanting, activity.daily_reading), (16, 'Completed'))
+        # Derived stores follow, although bulk_create skips the signals
+        self.assertEqual(DailyRollup.objects.get(user=self.devotee, date=day).chanting_rounds, 16)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+        metrics = self.buffer.metrics()
+        self.assertEqual((metrics['submissions'], metrics['coalesced'], metrics['flushes'], metrics['rows_written']), (2, 1, 1, 1))
+        self.assertEqual(metrics['pending'], 0)
+
+    def test_journal_of_a_crashed_process_is_replayed(self):
+        day = date.today()
+        # A process that died before flushing, with its last line cut short
+        with open(os.path.join(self.journal_dir, 'quick-entry-999999999.journal'), 'w') as journal:
+            journal.write(json.dumps({'user_id': self.devotee.pk, 'date': day.isoformat(), 'values': {'daily_chanting': 8}}) + '\n')
+            journal.write(json.dumps({'user_id': self.devotee.pk, 'date': day.isoformat(), 'values': {'daily_hearing': 'Completed'}}) + '\n')
+            journal.write('{"user_id": ')
+
+        self.assertEqual(self.buffer.recover(), 2)
+        self.assertEqual(self.buffer.pending(self.devotee.pk, day), {'daily_chanting': 8, 'daily_hearing': 'Completed'})
+        self.assertEqual(self.buffer.flush(), 1)
+        activity = DailyActivity.objects.get(user=self.devotee, date=day)
+        self.assertEqual((activity.daily_chanting, activity.daily_hearing), (8, 'Completed'))
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_journals_of_an_earlier_process_with_the_same_pid_are_replayed(self):
+        day = date.today()
+        # A worker that had this pid before, under the old naming and the current one
+        for name, rounds in (('quick-entry-%d.journal', 4), ('quick-entry-%d-0123abcd.flushing', 6)):
+            with open(os.path.join(self.journal_dir, name % os.getpid()), 'w') as journal:
+                journal.write(json.dumps({'user_id': self.devotee.pk, 'date': day.isoformat(), 'values': {'daily_chanting': rounds}}) + '\n')
+        self.buffer.submit(self.devotee.pk, day, {'daily_reading': 'Completed'})
+
+        self.assertEqual(self.buffer.metrics()['replayed'], 2)
+        self.assertEqual(self.buffer.flush(), 1)
+        activity = DailyActivity.objects.get(user=self.devotee, date=day)
+        self.assertEqual((activity.daily_chanting, activity.daily_reading), (6, 'Completed'))
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_an_entry_that_cannot_be_written_is_quarantined(self):
+        other = User.objects.create_user('9000000002', 'Other', 'Devotee', 'other@example.com', 'password', is_active=True)
+        day = date.today()
+        self.buffer.submit(self.devotee.pk, day, {'daily_chanting': 2 ** 70})
+        self.buffer.submit(other.pk, day, {'daily_chanting': 16})
+
+        with self.assertLogs('devotee.write_buffer', 'WARNING') as logs:
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertIn('quarantined', logs.output[-1])
+        self.assertEqual(DailyActivity.objects.get(user=other).daily_chanting, 16)
+        self.assertFalse(DailyActivity.objects.filter(user=self.devotee).exists())
+        metrics = self.buffer.metrics()
+        self.assertEqual((metrics['pending'], metrics['quarantined'], metrics['failed_flushes']), (0, 1, 0))
+        self.assertEqual(os.listdir(self.journal_dir), ['quick-entry-quarantine.jsonl'])
+        with open(os.path.join(self.journal_dir, 'quick-entry-quarantine.jsonl')) as quarantine:
+            record = json.loads(quarantine.readline())
+        self.assertEqual((record['user_id'], record['values']), (self.devotee.pk, {'daily_chanting': 2 ** 70}))
+
+    def test_submit_view_acknowledges_before_writing(self):
+        with mock.patch('devotee.views.quick_entry_buffer', self.buffer):
+            url = reverse('submit-quick-entry', kwargs={'token': self.token})
+            response = self.client.post(url, {'daily_chanting': 12}, content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['data'], {'date': date.today().isoformat(), 'daily_chanting': 12})
+            self.assertFalse(DailyActivity.objects.exists())
+
+            # The validate view already shows the pending values
+            validated = self.client.get(reverse('validate-qr-token', kwargs={'token': self.token})).json()
+            self.assertTrue(validated['has_existing_data'])
+
+        self.buffer.flush()
+        self.assertEqual(DailyActivity.objects.get(user=self.devotee).daily_chanting, 12)
+
+
+class AggregationTests(TestCase):
+    """Grouped SQL gives the numbers of the per-row Python passes it replaced"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(5)
+        devotees = [
+            User.objects.create_user(f'900000000{index}', 'Test', 'Devotee', f'devotee{index}@example.com', 'password')
+            for index in range(3)
+        ]
+        # Weeks and months that cross the turn of the year
+        start = date(2023, 11, 20)
+        for offset in range(75):
+            day = start + timedelta(days=offset)
+            for devotee in devotees:
+                if rng.random() < 0.6:
+                    DailyActivity.objects.create(
+                        user=devotee, date=day, week=week_for(day), daily_chanting=rng.randrange(33),
+                        daily_hearing=rng.choice(('Completed', 'Not Completed')),
+                        daily_reading=rng.choice(('Completed', 'Not Completed')),
+                        sport_session_attendance=rng.choice(('Attended', 'Not Attended', 'No Session Today')),
+                    )
+
+    @staticmethod
+    def python_passes(activities):
+        """Metrics by day, Monday and (year, month), one pass over model instances each"""
+        def add(totals, activity):
+            totals['activities_count'] += 1
+            totals['hearing_completed'] += activity.daily_hearing == 'Completed'
+            totals['reading_completed'] += activity.daily_reading == 'Completed'
+            totals['chanting_rounds'] += activity.daily_chanting
+            totals['sport_attended'] += activity.sport_session_attendance == 'Attended'
+            totals['sport_sessions'] += activity.sport_session_attendance != 'No Session Today'
+
+        periods = {
+            'day': lambda day: day,
+            'week': lambda day: day - timedelta(days=day.weekday()),
+            'month': lambda day: (day.year, day.month),
+        }
+        grouped = {}
+        for period, key in periods.items():
+            grouped[period] = {}
+            for activity in activities:
+                add(grouped[period].setdefault(key(activity.date), dict.fromkeys(
+                    ('activities_count', 'hearing_completed', 'reading_completed',
+                     'chanting_rounds', 'sport_attended', 'sport_sessions'), 0,
+                )), activity)
+        return grouped
+
+    def test_grouped_metrics_match_python_passes(self):
+        devotee = User.objects.order_by('pk').first()
+        for queryset in (
+            DailyActivity.objects.all(),
+            DailyActivity.objects.filter(user=devotee),
+            DailyActivity.objects.filter(date__range=(date(2023, 12, 27), date(2024, 1, 9))),
+        ):
+            expected = self.python_passes(list(queryset))
+            for period in ('day', 'week', 'month'):
+                self.assertEqual(grouped_metrics(queryset, period), expected[period], period)
+
+        by_user = grouped_metrics(DailyActivity.objects.all(), 'week', by_user=True)
+        for user in User.objects.all():
+            expected = self.python_passes(list(DailyActivity.objects.filter(user=user)))['week']
+            self.assertEqual({key: metrics for (user_id, key), metrics in by_user.items() if user_id == user.pk}, expected)
+
+    def test_analytics_match_python_passes(self):
+        activities = list(DailyActivity.objects.all())
+        expected = self.python_passes(activities)
+        total = len(activities)
+        rounds = sum(activity.daily_chanting for activity in activities)
+        sessions = [activity for activity in activities if activity.sport_session_attendance != 'No Session Today']
+        with self.assertNumQueries(4):
+            analytics = activity_analytics(DailyActivity.objects.all())
+
+        self.assertEqual(analytics['summary'], {
+            'total_activities': total,
+            'hearing_completion_rate': round(sum(a.daily_hearing == 'Completed' for a in activities) / total * 100, 2),
+            'reading_completion_rate': round(sum(a.daily_reading == 'Completed' for a in activities) / total * 100, 2),
+            'total_chanting_rounds': rounds,
+            'avg_chanting_rounds': round(rounds / total, 2),
+            'sport_attendance_rate': round(
+                sum(a.sport_session_attendance == 'Attended' for a in sessions) / len(sessions) * 100, 2
+            ),
+        })
+        chart_fields = ('activities_count', 'hearing_completed', 'reading_completed', 'chanting_rounds')
+        self.assertEqual(
+            [(row['date'], *(row[field] for field in chart_fields)) for row in analytics['daily_chart_data']],
+            [(str(day), *(metrics[field] for field in chart_fields)) for day, metrics in sorted(expected['day'].items())],
+        )
+        self.assertEqual(
+            [(row['start_date'], *(row[field] for field in chart_fields)) for row in analytics['weekly_chart_data']],
+            [(str(week), *(metrics[field] for field in chart_fields)) for week, metrics in sorted(expected['week'].items())],
+        )
+        self.assertEqual(
+            [((row['year'], row['month']), *(row[field] for field in chart_fields)) for row in analytics['monthly_chart_data']],
+            [(key, *(metrics[field] for field in chart_fields)) for key, metrics in sorted(expected['month'].items())],
+        )
+        self.assertEqual(activity_analytics(DailyActivity.objects.none())['summary']['avg_chanting_rounds'], 0)
+
+
+class RollupTests(TestCase):
+    """Every write path keeps the rollups equal to a recompute, and analytics read the same numbers"""
+
+    token = 'quick-entry-test-token'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            '9000000000', 'Admin', 'User', 'admin@example.com', 'password', is_active=True, is_staff=True,
+        )
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+            qr_token_hash=hash_token(cls.token), qr_token_created_at=timezone.now(),
+        )
+        cls.other = User.objects.create_user(
+            '9000000002', 'Other', 'Devotee', 'other@example.com', 'password', is_active=True,
+        )
+        today = date.today()
+        for offset in range(1, 60, 3):
+            day = today - timedelta(days=offset)
+            for user in (cls.devotee, cls.other):
+                DailyActivity.objects.create(
+                    user=user, date=day, week=week_for(day), daily_chanting=offset % 17,
+                    daily_hearing='Completed' if offset % 2 else 'Not Completed',
+                )
+
+    def setUp(self):
+        token_cache.clear()
+        response_cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+        self.admin_auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'}
+
+    def assertInSync(self):
+        self.assertEqual(find_drift(), [])
+        today = date.today()
+        for params in (
+            {},
+            {'year': today.year, 'month': today.month},
+            {'start_date': (today - timedelta(days=20)).isoformat(), 'end_date': today.isoformat()},
+            {'week_id': week_for(today).pk},
+            {'devotee_id': self.devotee.pk},
+        ):
+            url = reverse('admin-get-analytics')
+            stored = self.client.get(url, params, **self.admin_auth)
+            live = self.client.get(url, {**params, 'source': 'live'}, **self.admin_auth)
+            self.assertEqual(stored.status_code, 200)
+            self.assertEqual(stored.json(), live.json(), params)
+
+    def post(self, name, data, **kwargs):
+        response = self.client.post(reverse(name, **kwargs), data, content_type='application/json', **self.auth)
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def test_every_write_path(self):
+        today = date.today().isoformat()
+        self.assertInSync()
+
+        created = self.post('daily-activity-add-or-edit-day', {'date': today, 'daily_chanting': 16})
+        self.assertEqual(created.status_code, 201)
+        self.assertInSync()
+        self.post('daily-activity-add-or-edit-day', {'date': today, 'daily_chanting': 8, 'daily_hearing': 'Completed'})
+        self.assertInSync()
+
+        self.post('daily-activity-add-or-edit-week', {'days': [{'date': today, 'daily_chanting': 12}]})
+        self.assertInSync()
+
+        activity = DailyActivity.objects.get(user=self.devotee, date=today)
+        deleted = self.client.delete(reverse('daily-activity-delete-day', kwargs={'pk': activity.pk}), **self.auth)
+        self.assertEqual(deleted.status_code, 204)
+        self.assertInSync()
+
+        self.post('submit-quick-entry', {'daily_chanting': 4}, kwargs={'token': self.token})
+        self.assertInSync()
+        self.post('submit-quick-entry-async', {'daily_chanting': 20, 'daily_reading': 'Completed'}, kwargs={'token': self.token})
+        self.assertInSync()
+
+        with tempfile.TemporaryDirectory() as journal_dir:
+            buffer = QuickEntryBuffer(enabled=True, journal_dir=journal_dir, flush_interval=None, fsync=False)
+            with mock.patch('devotee.views.quick_entry_buffer', buffer):
+                self.post('submit-quick-entry', {'daily_chanting': 6}, kwargs={'token': self.token})
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(DailyActivity.objects.get(user=self.devotee, date=today).daily_chanting, 6)
+        self.assertInSync()
+
+        response = self.client.delete(reverse('auth-delete-sadana-data'), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(DailyActivity.objects.filter(user=self.devotee).exists())
+        self.assertFalse(DailyRollup.objects.filter(user=self.devotee, activities_count__gt=0).exists())
+        self.assertInSync()
+
+
+class FixedDate(date):
+    """date whose today() is a Wednesday, so a week batch can hold earlier days"""
+
+    @classmethod
+    def today(cls):
+        return cls(2024, 5, 15)
+
+
+@mock.patch('devotee.views.date', FixedDate)
+class WeekBatchTests(TestCase):
+    """add-or-edit-week upserts every day at once, or none of them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+        # Monday is already saved, with a value the batch does not send
+        DailyActivity.objects.create(
+            user=cls.devotee, date=date(2024, 5, 13), week=week_for(date(2024, 5, 13)),
+            daily_chanting=4, daily_reading='Completed',
+        )
+
+    def setUp(self):
+        response_cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+
+    def submit(self, *days):
+        return self.client.post(
+            reverse('daily-activity-add-or-edit-week'), {'days': list(days)},
+            content_type='application/json', **self.auth,
+        )
+
+    def test_creates_and_updates_in_one_upsert(self):
+        response = self.submit(
+            {'date': '2024-05-13', 'daily_chanting': 16},
+            {'date': '2024-05-14', 'daily_chanting': 8, 'daily_hearing': 'Completed'},
+            {'date': '2024-05-15', 'daily_chanting': 12},
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['updated', 'created', 'created'])
+        self.assertEqual([result['day'] for result in results], ['Monday', 'Tuesday', 'Wednesday'])
+
+        saved = {activity.date: activity for activity in DailyActivity.objects.filter(user=self.devotee)}
+        self.assertEqual({day: activity.daily_chanting for day, activity in saved.items()}, {
+            date(2024, 5, 13): 16, date(2024, 5, 14): 8, date(2024, 5, 15): 12,
+        })
+        # Fields a day did not send keep their stored values
+        self.assertEqual(saved[date(2024, 5, 13)].daily_reading, 'Completed')
+        self.assertEqual({activity.week_id for activity in saved.values()}, {week_for(date(2024, 5, 13)).pk})
+        # Derived stores follow the bulk upsert
+        self.assertEqual(find_drift(), [])
+        self.assertEqual(find_statistics_drift(self.devotee.pk), {})
+        self.assertEqual(find_streak_drift(self.devotee.pk), {})
+        self.assertEqual(get_statistics(self.devotee).total_chanting_rounds, 36)
+
+    def test_one_invalid_day_rejects_the_week(self):
+        before = list(DailyActivity.objects.values())
+        for invalid in (
+            {'date': '2024-05-16', 'daily_chanting': 16},
+            {'date': '2024-05-06', 'daily_chanting': 16},
+            {'date': '2024-05-14', 'daily_chanting': -1},
+            {'date': '2024-05-14', 'daily_reading': 'Done'},
+            {'date': '2024-05-13', 'daily_chanting': 1},
+            {'daily_chanting': 1},
+        ):
+            response = self.submit(
+                {'date': '2024-05-13', 'daily_chanting': 16},
+                {'date': '2024-05-15', 'daily_chanting': 12},
+                invalid,
+            )
+            self.assertEqual(response.status_code, 400, invalid)
+            self.assertEqual([result['status'] for result in response.json()['results']], ['not saved', 'not saved', 'error'])
+            self.assertEqual(list(DailyActivity.objects.values()), before)
+        self.assertEqual(find_drift(), [])
+
+
+class ExportTests(TestCase):
+    """Exports hold exactly the stored rows, in CSV and NDJSON, from the endpoint and the command"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            '9000000000', 'Admin', 'User', 'admin@example.com', 'password', is_active=True, is_staff=True,
+        )
+        cls.devotees = [
+            User.objects.create_user(f'900000000{index}', 'Test', f'Devotee, "{index}"', f'd{index}@example.com', 'password')
+            for index in (1, 2)
+        ]
+        start = date(2024, 1, 25)
+        for devotee in cls.devotees:
+            for offset in range(0, 14, 2):
+                day = start + timedelta(days=offset)
+                DailyActivity.objects.create(
+                    user=devotee, date=day, week=week_for(day), daily_chanting=offset,
+                    feedback_for_this_week='Line one\nline "two", three' if offset == 4 else None,
+                )
+            for month in (1, 2):
+                MonthlyActivity.objects.create(user=devotee, year=2024, month=month, book_name=f'Book {month}')
+
+    def setUp(self):
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'}
+
+    def export(self, **params):
+        response = self.client.get(reverse('admin-export'), params, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    @staticmethod
+    def stored(queryset):
+        """The exported fields of each row, as text keyed by id"""
+        def text(value):
+            return '' if value is None else value.isoformat() if isinstance(value, date) else str(value)
+
+        rows = {}
+        for row in queryset.values('user__username', 'user__last_name', *(
+            field.attname for field in queryset.model._meta.concrete_fields
+        )):
+            rows[row['id']] = {
+                'devotee_id': text(row['user_id']), 'username': row['user__username'], 'last_name': row['user__last_name'],
+                **{name: text(value) for name, value in row.items() if not name.startswith('user') and name != 'week_id'},
+            }
+        return rows
+
+    def assertRowsEqual(self, exported, queryset):
+        stored = self.stored(queryset)
+        self.assertEqual(len(exported), len(stored))
+        for row in exported:
+            expected = stored[int(row['id'])]
+            self.assertEqual({name: row[name] for name in expected}, expected)
+
+    def test_csv_round_trip(self):
+        daily = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertRowsEqual(daily, DailyActivity.objects.all())
+        self.assertEqual([row['date'] for row in daily[:2]], ['2024-01-25', '2024-01-27'])
+        self.assertEqual(daily[0]['week_start'], '2024-01-22')
+
+        monthly = list(csv.DictReader(io.StringIO(self.export(dataset='monthly'))))
+        self.assertRowsEqual(monthly, MonthlyActivity.objects.all())
+
+    def test_ndjson_filters_and_command(self):
+        devotee = self.devotees[1]
+        week = week_for(date(2024, 1, 29))
+        body = self.export(output='ndjson', dataset='all', devotee_id=devotee.pk, week_id=week.pk)
+        records = [json.loads(line) for line in body.splitlines()]
+        daily = [record for record in records if record['type'] == 'daily']
+        monthly = [record for record in records if record['type'] == 'monthly']
+        self.assertEqual([record['date'] for record in daily], ['2024-01-29', '2024-01-31', '2024-02-02', '2024-02-04'])
+        self.assertRowsEqual(
+            [{name: '' if value is None else str(value) for name, value in record.items()} for record in daily],
+            DailyActivity.objects.filter(user=devotee, date__range=(week.start_date, week.end_date)),
+        )
+        self.assertEqual([(record['devotee_id'], record['month']) for record in monthly], [(devotee.pk, 1), (devotee.pk, 2)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson')
+            call_command(
+                'export_sadhana', '--format', 'ndjson', '--dataset', 'all',
+                '--devotee', str(devotee.pk), '--week', str(week.pk), '--output', path,
+            )
+            with open(path) as output:
+                self.assertEqual(output.read(), body)
+
+        response = self.client.get(reverse('admin-export'), {'output': 'csv', 'dataset': 'all'}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTests(TestCase):
+    """Repeat reads are served from the cache until the user writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+        cls.other = User.objects.create_user(
+            '9000000002', 'Other', 'Devotee', 'other@example.com', 'password', is_active=True,
+        )
+
+    def setUp(self):
+        response_cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+
+    def get(self, name):
+        return self.client.get(reverse(name), **self.auth)
+
+    def test_write_invalidates_cached_response(self):
+        self.assertEqual(self.get('daily-activity-get-chanting-round-count').json()['total_chanting_rounds'], 0)
+        # The token's claims stand for the user, so a hit reads nothing
+        with self.assertNumQueries(0):
+            cached = self.get('daily-activity-get-chanting-round-count')
+        self.assertEqual(cached.json()['total_chanting_rounds'], 0)
+
+        response = self.client.post(
+            reverse('daily-activity-add-or-edit-day'),
+            {'date': date.today().isoformat(), 'daily_chanting': 16},
+            content_type='application/json', **self.auth,
+        )
+        self.assertIn(response.status_code, (200, 201))
+        self.assertEqual(self.get('daily-activity-get-chanting-round-count').json()['total_chanting_rounds'], 16)
+
+        counts = response_cache.hit_counters.snapshot()['endpoints']['chanting-round-count']
+        self.assertEqual((counts['hits'], counts['misses']), (1, 2))
+
+    def test_writes_of_other_users_keep_the_cache(self):
+        self.get('auth-get-profile')
+        self.other.first_name = 'Renamed'
+        self.other.save()
+        DailyActivity.objects.create(user=self.other, date=date.today(), week=week_for(date.today()), daily_chanting=4)
+        with self.assertNumQueries(0):
+            self.get('auth-get-profile')
+
+        self.devotee.first_name = 'Renamed'
+        self.devotee.save()
+        self.assertEqual(self.get('auth-get-profile').json()['first_name'], 'Renamed')
+
+    def test_current_month_is_cached(self):
+        first = self.get('monthly-activity-get-current-month')
+        with self.assertNumQueries(0):
+            second = self.get('monthly-activity-get-current-month')
+        self.assertEqual(first.json(), second.json())
+
+
+class ActivityTotalsTests(TestCase):
+    """Activity lists keep their totals unless asked not to"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+        today = date.today()
+        for offset in range(3):
+            day = today - timedelta(days=offset)
+            DailyActivity.objects.create(user=cls.devotee, date=day, week=week_for(day), daily_chanting=16)
+        MonthlyActivity.objects.create(user=cls.devotee, year=today.year, month=today.month, book_name='Gita')
+
+    def setUp(self):
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+
+    def test_total_count_by_default(self):
+        for name, total in (
+            ('daily-activity-list', 3),
+            ('daily-activity-filter-activities', 3),
+            ('monthly-activity-list', 1),
+            ('monthly-activity-filter-monthly-activities', 1),
+        ):
+            data = self.client.get(reverse(name), {'limit': 2}, **self.auth).json()
+            self.assertEqual(data['total_count'], total, name)
+            data = self.client.get(reverse(name), {'limit': 2, 'include_total': 'false'}, **self.auth).json()
+            self.assertNotIn('total_count', data, name)
+
+
+class StreamedFilterTests(TestCase):
+    """stream=true returns the same week-grouped JSON as the paged filter"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+        today = date.today()
+        for offset in range(0, 40, 3):
+            day = today - timedelta(days=offset)
+            DailyActivity.objects.create(
+                user=cls.devotee, date=day, week=week_for(day), daily_chanting=offset,
+                feedback_for_this_week='"Quoted", with a comma}' if offset % 2 else None,
+            )
+
+    def test_streamed_body_matches_the_paged_response(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+        url = reverse('daily-activity-filter-activities')
+        for params, weeks in (({}, 6), ({'week_id': week_for(date.today()).pk}, 1), ({'year': 1999}, 0)):
+            paged = self.client.get(url, {**params, 'limit': 200}, **auth).json()
+            response = self.client.get(url, {**params, 'stream': 'true'}, **auth)
+            self.assertTrue(response.streaming)
+            streamed = json.loads(b''.join(response.streaming_content))
+            self.assertEqual(streamed, {'weeks': paged['weeks'], 'total_count': paged['total_count']}, params)
+            self.assertGreaterEqual(len(streamed['weeks']), weeks)
+
+
+class CurrentMonthTests(TestCase):
+    """Reading the current month writes nothing, saving it keeps unchanged weeks"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+
+    def setUp(self):
+        response_cache.clear()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+
+    def save_month(self, **data):
+        today = date.today()
+        return self.client.post(
+            reverse('monthly-activity-add-or-edit-monthly'), {'month': today.month, 'year': today.year, **data},
+            content_type='application/json', **self.auth,
+        )
+
+    def test_unsaved_month_is_not_created_by_a_read(self):
+        unsaved = self.client.get(reverse('monthly-activity-get-current-month'), **self.auth).json()
+        self.assertIsNone(unsaved['id'])
+        self.assertFalse(MonthlyActivity.objects.exists())
+
+        created = self.save_month()
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(created.json()['data']['weeks'], unsaved['weeks'])
+        saved = self.client.get(reverse('monthly-activity-get-current-month'), **self.auth).json()
+        self.assertEqual(saved['weeks'], unsaved['weeks'])
+        self.assertEqual(saved['id'], created.json()['data']['id'])
+
+    def test_unchanged_weeks_are_not_rewritten(self):
+        self.save_month()
+        weeks_changed = mock.Mock()
+        m2m_changed.connect(weeks_changed, sender=MonthlyActivity.weeks.through)
+        self.addCleanup(m2m_changed.disconnect, weeks_changed, sender=MonthlyActivity.weeks.through)
+
+        self.assertEqual(self.save_month(monthly_morning_program='Attended').status_code, 200)
+        weeks_changed.assert_not_called()
+
+        first_week = MonthlyActivity.objects.get().weeks.order_by('start_date').first()
+        self.save_month(week_ids=[first_week.pk])
+        self.assertTrue(weeks_changed.called)
+        self.assertEqual(list(MonthlyActivity.objects.get().weeks.all()), [first_week])
+
+    def test_weeks_created_later_are_linked(self):
+        today = date.today()
+        monthly = MonthlyActivity.objects.create(user=self.devotee, month=today.month, year=today.year)
+        linked = set(monthly.weeks.values_list('start_date', flat=True))
+        self.assertTrue(linked)
+
+        monthly.weeks.through.objects.filter(week__start_date=min(linked)).delete()
+        Week.objects.filter(start_date=min(linked)).delete()
+        calendar.clear()
+        self.addCleanup(calendar.clear)
+        week_for(min(linked))
+        self.assertEqual(set(monthly.weeks.values_list('start_date', flat=True)), linked)
+
+
+class SharedWeekMigrationTests(TransactionTestCase):
+    """0009 merges the per-user weeks into one calendar without losing a link"""
+
+    migrate_from = [('devotee', '0008_devotee_statistics')]
+    migrate_to = [('devotee', '0009_shared_week_calendar')]
+
+    def setUp(self):
+        Week.objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        Week_ = apps.get_model('devotee', 'Week')
+        DailyActivity_ = apps.get_model('devotee', 'DailyActivity')
+        MonthlyActivity_ = apps.get_model('devotee', 'MonthlyActivity')
+
+        def week(user, start):
+            end = start + timedelta(days=6)
+            return Week_.objects.create(
+                name=f"{user.username} {start}", start_date=start, end_date=end,
+                month=start.month, year=start.year, created_by_id=user.pk,
+            )
+
+        # Both devotees made their own copies of the same weeks, one starting
+        # mid-week, and only the first has the week after
+        first = User.objects.create_user('9000000001', 'First', 'Devotee', 'first@example.com', 'password')
+        second = User.objects.create_user('9000000002', 'Second', 'Devotee', 'second@example.com', 'password')
+        first_weeks = [week(first, date(2024, 1, 1)), week(first, date(2024, 1, 8)), week(first, date(2024, 1, 15))]
+        second_weeks = [week(second, date(2024, 1, 3)), week(second, date(2024, 1, 8))]
+
+        self.days = {}
+        for user, weeks, days in (
+            (first, first_weeks, [date(2024, 1, 1), date(2024, 1, 7), date(2024, 1, 10), date(2024, 1, 16)]),
+            (second, second_weeks, [date(2024, 1, 3), date(2024, 1, 8), date(2024, 1, 14)]),
+        ):
+            for day in days:
+                own = max((week for week in weeks if week.start_date <= day), key=lambda week: week.start_date)
+                activity = DailyActivity_.objects.create(user_id=user.pk, date=day, week=own)
+                self.days[activity.pk] = day
+        self.months = {}
+        for user, weeks in ((first, first_weeks), (second, second_weeks)):
+            monthly = MonthlyActivity_.objects.create(user_id=user.pk, year=2024, month=1, book_name='Gita')
+            monthly.weeks.set(weeks)
+            self.months[monthly.pk] = sorted(week.start_date - timedelta(days=week.start_date.weekday()) for week in weeks)
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_activities_and_months_move_to_the_shared_weeks(self):
+        Week_ = self.apps.get_model('devotee', 'Week')
+        DailyActivity_ = self.apps.get_model('devotee', 'DailyActivity')
+        MonthlyActivity_ = self.apps.get_model('devotee', 'MonthlyActivity')
+
+        activities = DailyActivity_.objects.select_related('week')
+        self.assertEqual({activity.pk: activity.date for activity in activities}, self.days)
+        for activity in activities:
+            self.assertEqual(activity.week.start_date, activity.date - timedelta(days=activity.date.weekday()))
+            self.assertEqual(activity.week.end_date, activity.week.start_date + timedelta(days=6))
+
+        for monthly in MonthlyActivity_.objects.all():
+            starts = sorted(monthly.weeks.values_list('start_date', flat=True))
+            self.assertEqual(starts, self.months[monthly.pk])
+
+        # One Monday-aligned week per start date, and none left over
+        starts = list(Week_.objects.values_list('start_date', flat=True))
+        self.assertEqual(len(starts), len(set(starts)))
+        self.assertTrue(all(start.weekday() == 0 for start in starts))
+        self.assertEqual(Week_.objects.filter(start_date__lt=date(2020, 1, 1)).count(), 0)
+        self.assertEqual(Week_.objects.filter(start_date__year=2024, start_date__month=1).count(), 5)
+
+
+class SqliteConnectionTests(TransactionTestCase):
+    """New connections are configured from settings, locked writes run again"""
+
+    def test_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    @override_settings(SQLITE_CONNECTION={'LOCKED_RETRIES': 2, 'RETRY_BACKOFF_SECONDS': 0})
+    def test_locked_writes_are_retried(self):
+        retry_counters.clear()
+        attempts = []
+
+        @retry_on_locked
+        def write():
+            attempts.append(connection.in_atomic_block)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'written'
+
+        self.assertEqual(write(), 'written')
+        self.assertEqual(attempts, [True, True, True])
+
+        @retry_on_locked
+        def always_locked():
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            always_locked()
+        self.assertEqual(retry_counters.snapshot(), {'retries': 4, 'gave_up': 1})
+
+
+class LeaderboardTests(TestCase):
+    """Scores follow every write and rank devotees without reading activities"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            '9000000000', 'Admin', 'User', 'admin@example.com', 'password', is_active=True, is_staff=True,
+        )
+        cls.devotees = [
+            User.objects.create_user(
+                f'900000000{index}', 'Test', f'Devotee{index}', f'devotee{index}@example.com', 'password', is_active=True,
+            )
+            for index in range(1, 5)
+        ]
+
+    def log(self, user, rounds, day=None, **values):
+        day = day or date.today()
+        activity, _ = DailyActivity.objects.update_or_create(
+            user=user, date=day, defaults={'week': week_for(day), 'daily_chanting': rounds, **values},
+        )
+        return activity
+
+    def test_ranks_with_ties(self):
+        first, second, third, idle = self.devotees
+        self.log(first, 16)
+        self.log(second, 8, sport_session_attendance='Attended')
+        self.log(third, 8)
+        self.log(third, 4)  # an edit replaces the day's rounds
+
+        entries, next_cursor = top_page('week_rounds', standing(first.pk)['week_rounds']['period'], page_size=2)
+        self.assertEqual([(rank, entry.user_id) for rank, entry in entries], [(1, first.pk), (2, second.pk)])
+        more, _ = top_page('week_rounds', standing(first.pk)['week_rounds']['period'], cursor=next_cursor)
+        self.assertEqual([(rank, entry.user_id) for rank, entry in more], [(3, third.pk)])
+
+        self.log(third, 8)
+        self.assertEqual(standing(third.pk)['total_rounds'], {'period': '', 'score': 8, 'rank': 2, 'participants': 3})
+        self.assertEqual(standing(second.pk)['attendance']['rank'], 1)
+        self.assertEqual(standing(idle.pk)['total_rounds']['rank'], 4)
+
+        DailyActivity.objects.filter(user=first).delete()
+        self.assertEqual(standing(second.pk)['total_rounds']['rank'], 1)
+        self.assertEqual(find_leaderboard_drift(), {})
+
+    def test_staff_are_not_ranked(self):
+        self.log(self.admin, 32)
+        self.log(self.devotees[0], 16)
+        period = standing(self.devotees[0].pk)['week_rounds']['period']
+        self.assertEqual([entry.user_id for _, entry in top_page('week_rounds', period)[0]], [self.devotees[0].pk])
+        self.assertEqual(standing(self.devotees[0].pk)['total_rounds'], {'period': '', 'score': 16, 'rank': 1, 'participants': 1})
+
+    def test_admin_leaderboard(self):
+        self.log(self.devotees[0], 16)
+        url = reverse('admin-leaderboard')
+        admin = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'}
+        devotee = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotees[0]).access_token}'}
+
+        self.assertEqual(self.client.get(url, **devotee).status_code, 403)
+        self.assertEqual(self.client.get(url + '?board=unknown', **admin).status_code, 400)
+        results = self.client.get(url + '?board=month_rounds', **admin).json()['results']
+        self.assertEqual([(row['rank'], row['username'], row['score']) for row in results], [(1, '9000000001', 16)])
+
+
+class StatisticsTests(TestCase):
+    """The stored spiritual-growth counters follow creates, edits and deletes exactly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+
+    def setUp(self):
+        get_statistics(self.devotee)
+
+    def log(self, day, rounds, **fields):
+        DailyActivity.objects.update_or_create(
+            user=self.devotee, date=day, defaults={'week': week_for(day), 'daily_chanting': rounds, **fields},
+        )
+
+    def month(self, month, book_name, completed, **fields):
+        MonthlyActivity.objects.update_or_create(
+            user=self.devotee, year=2024, month=month,
+            defaults={'book_name': book_name, 'monthly_book_completed': completed, **fields},
+        )
+
+    def assertStored(self, **expected):
+        self.assertEqual(find_statistics_drift(self.devotee.pk), {})
+        stored = get_statistics(self.devotee)
+        self.assertEqual({field: getattr(stored, field) for field in expected}, expected)
+
+    def test_highest_day_is_looked_up_again(self):
+        today = date.today()
+        self.log(today, 16)
+        self.log(today - timedelta(days=1), 25, sport_session_attendance='Attended')
+        self.log(today - timedelta(days=2), 25)
+        self.assertStored(total_chanting_rounds=66, highest_chanting_rounds=25, sport_session_attendance_count=1)
+
+        # One of two best days goes down, then the other is deleted
+        self.log(today - timedelta(days=1), 8)
+        self.assertStored(total_chanting_rounds=49, highest_chanting_rounds=25, sport_session_attendance_count=1)
+        DailyActivity.objects.filter(user=self.devotee, date=today - timedelta(days=2)).delete()
+        self.assertStored(total_chanting_rounds=24, highest_chanting_rounds=16)
+        DailyActivity.objects.filter(user=self.devotee).delete()
+        self.assertStored(total_chanting_rounds=0, highest_chanting_rounds=0, sport_session_attendance_count=0)
+
+    def test_books_are_removed_with_their_last_month(self):
+        self.month(1, 'Gita', 'Completed', monthly_morning_program='Attended')
+        self.month(2, 'Gita', 'Completed')
+        self.month(3, 'Isopanisad', 'Partially Completed')
+        self.assertStored(morning_program_count=1, completed_books={'Gita': 2}, partially_completed_books={'Isopanisad': 1})
+
+        self.month(3, 'Isopanisad', 'Completed')
+        self.assertStored(completed_books={'Gita': 2, 'Isopanisad': 1}, partially_completed_books={})
+        MonthlyActivity.objects.filter(user=self.devotee, month=1).delete()
+        self.assertStored(morning_program_count=0, completed_books={'Gita': 1, 'Isopanisad': 1})
+        self.month(2, 'Nectar of Devotion', 'Completed')
+        self.assertStored(completed_books={'Isopanisad': 1, 'Nectar of Devotion': 1})
+
+    def test_random_writes_match_a_recompute(self):
+        rng = random.Random(11)
+        today = date.today()
+        for _ in range(120):
+            if rng.random() < 0.7:
+                day = today - timedelta(days=rng.randrange(15))
+                if rng.random() < 0.25:
+                    DailyActivity.objects.filter(user=self.devotee, date=day).delete()
+                else:
+                    self.log(
+                        day, rng.choice((0, 4, 16, 25, 32)),
+                        weekly_seva=rng.choice(('Yes', 'No')),
+                        sport_session_attendance=rng.choice(('Attended', 'Not Attended')),
+                    )
+            else:
+                month = rng.randrange(1, 6)
+                if rng.random() < 0.25:
+                    MonthlyActivity.objects.filter(user=self.devotee, month=month).delete()
+                else:
+                    self.month(
+                        month, rng.choice(('Gita', 'Isopanisad', '')),
+                        rng.choice(('Completed', 'Partially Completed', 'Not Completed')),
+                        monthly_morning_program=rng.choice(('Attended', 'Not Attended')),
+                    )
+            self.assertEqual(find_statistics_drift(self.devotee.pk), {})
+        self.assertEqual(
+            {field: getattr(get_statistics(self.devotee), field) for field in compute_statistics(self.devotee.pk)},
+            compute_statistics(self.devotee.pk),
+        )
+
+
+class StreakTests(TestCase):
+    """Streaks follow in-order entry, edits and deletes exactly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devotee = User.objects.create_user(
+            '9000000001', 'Test', 'Devotee', 'devotee@example.com', 'password', is_active=True,
+        )
+
+    def log(self, day, rounds, hearing='Not Completed'):
+        DailyActivity.objects.update_or_create(
+            user=self.devotee, date=day,
+            defaults={'week': week_for(day), 'daily_chanting': rounds, 'daily_hearing': hearing},
+        )
+
+    def test_in_order_entry_and_repairs(self):
+        today = date.today()
+        for offset in range(10, -1, -1):
+            self.log(today - timedelta(days=offset), 16, hearing='Completed' if offset % 3 else 'Not Completed')
+        summary = streak_summary(self.devotee.pk)
+        self.assertEqual((summary['chanting']['current'], summary['chanting']['longest']), (11, 11))
+        self.assertEqual(summary['hearing']['longest'], 2)
+
+        # A day inside the run stops qualifying, then is entered again
+        self.log(today - timedelta(days=3), 4)
+        summary = streak_summary(self.devotee.pk)
+        self.assertEqual((summary['chanting']['current'], summary['chanting']['longest']), (3, 7))
+        self.log(today - timedelta(days=3), 16)
+        self.assertEqual(streak_summary(self.devotee.pk)['chanting']['current'], 11)
+
+        DailyActivity.objects.filter(user=self.devotee, date=today).delete()
+        self.assertEqual(streak_summary(self.devotee.pk)['chanting']['current'], 10)
+        self.assertEqual(find_streak_drift(self.devotee.pk), {})
+
+    def test_random_edits_match_a_recompute(self):
+        rng = random.Random(7)
+        today = date.today()
+        for _ in range(150):
+            day = today - timedelta(days=rng.randrange(21))
+            if rng.random() < 0.2:
+                DailyActivity.objects.filter(user=self.devotee, date=day).delete()
+            else:
+                self.log(day, rng.choice((4, 16, 16, 25)), rng.choice(('Completed', 'Not Completed')))
+            self.assertEqual(find_streak_drift(self.devotee.pk), {})
+
+    def test_spiritual_growth_shows_streaks(self):
+        self.log(date.today(), 16)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotee).access_token}'}
+        streaks = self.client.get(reverse('auth-get-spiritual-growth'), **auth).json()['streaks']
+        self.assertEqual(streaks['chanting'], {'current': 1, 'longest': 1, 'last_day': date.today().isoformat()})
+        self.assertEqual(streaks['reading'], {'current': 0, 'longest': 0, 'last_day': None})
+
+
+class ParticipationMatrixTests(TestCase):
+    """The admin matrix places each entry in its devotee's row and day's column"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            '9000000000', 'Admin', 'User', 'admin@example.com', 'password', is_active=True, is_staff=True,
+        )
+        cls.devotees = [
+            User.objects.create_user(
+                f'900000000{index}', 'Test', f'Devotee{index}', f'devotee{index}@example.com', 'password', is_active=True,
+            )
+            for index in range(1, 4)
+        ]
+
+    def log(self, user, day, rounds, **values):
+        DailyActivity.objects.create(user=user, date=day, week=week_for(day), daily_chanting=rounds, **values)
+
+    def test_rates_bands_and_heatmap(self):
+        start = date(2025, 3, 1)
+        first, second, idle = self.devotees
+        self.log(first, start, 16, daily_hearing='Completed', daily_reading='Completed')
+        self.log(first, start + timedelta(days=1), 4)
+        self.log(second, start + timedelta(days=1), 20, daily_hearing='Completed')
+        self.log(self.admin, start, 16)  # staff are not on the roster
+
+        url = reverse('admin-participation-matrix') + f'?start_date={start}&end_date={start + timedelta(days=2)}'
+        admin = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'}
+        # The roster and the activities
+        with self.assertNumQueries(2):
+            report = self.client.get(url, **admin).json()
+
+        self.assertEqual((report['devotees'], report['days']), (3, 3))
+        rows = {row['user_id']: row for row in report['per_devotee']}
+        self.assertEqual(
+            {key: rows[first.pk][key] for key in ('days_entered', 'entry_rate', 'chanting_rate', 'complete_rate', 'average_rounds')},
+            {'days_entered': 2, 'entry_rate': 0.6667, 'chanting_rate': 0.3333, 'complete_rate': 0.3333, 'average_rounds': 10.0},
+        )
+        self.assertEqual([rows[user.pk]['band'] for user in self.devotees], [4, 1, 1])
+        self.assertEqual([day['devotees_entered'] for day in report['per_day']], [1, 2, 0])
+        self.assertEqual(report['bands']['entry_rate']['p50'], 0.3333)
+
+        heatmap = report['heatmap']
+        packed = np.frombuffer(zlib.decompress(base64.b64decode(heatmap['data'])), dtype=np.uint8)
+        levels = np.stack([packed >> 4, packed & 0xF], axis=1).ravel()[:9].reshape(heatmap['shape'])
+        self.assertEqual(levels.tolist(), [[4, 1, 0], [0, 3, 0], [0, 0, 0]])
+
+    def test_rounds_at_the_field_maximum_do_not_overflow(self):
+        start = date(2025, 3, 1)
+        for offset in range(3):
+            self.log(self.devotees[0], start + timedelta(days=offset), 2147483647)
+        matrix = build_matrix(start, start + timedelta(days=2), [self.devotees[0].pk])
+        self.assertEqual(int(matrix.rounds.sum()), 3 * 2147483647)
+        self.assertEqual(participation_report(matrix)['per_devotee'][0]['average_rounds'], 2147483647.0)
+
+    def test_invalid_range(self):
+        admin = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}'}
+        url = reverse('admin-participation-matrix')
+        self.assertEqual(self.client.get(url + '?start_date=2025-03-02&end_date=2025-03-01', **admin).status_code, 400)
+        self.assertEqual(self.client.get(url + '?start_date=2020-01-01&end_date=2025-01-01', **admin).status_code, 400)
+        devotee = {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(self.devotees[0]).access_token}'}
+        self.assertEqual(self.client.get(url, **devotee).status_code, 403)
@@ -13,6 +13,7 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import DailyActivityViewSet, MonthlyActivityViewSet, validate_qr_token, submit_quick_entry
 
 router = DefaultRouter()
@@ -24,4 +25,7 @@ urlpatterns = [
     # QR Code quick entry endpoints (public, no auth required)
     path('quick-entry/validate/<str:token>/', validate_qr_token, name='validate-qr-token'),
     path('quick-entry/submit/<str:token>/', submit_quick_entry, name='submit-quick-entry'),
+    # Async variants with the same contract, for ASGI deployments
+    path('quick-entry/async/validate/<str:token>/', async_views.validate_qr_token, name='validate-qr-token-async'),
+    path('quick-entry/async/submit/<str:token>/', async_views.submit_quick_entry, name='submit-quick-entry-async'),
 ]
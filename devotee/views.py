@@ -4,27 +4,30 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from datetime import date, timedelta
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Sum
+from django.http import StreamingHttpResponse
 from .models import DailyActivity, Week, MonthlyActivity
-from .serializers import DailyActivitySerializer, WeekSerializer, MonthlyActivitySerializer
+from .serializers import DailyActivitySerializer, WeekSerializer, MonthlyActivitySerializer, daily_activity_rows
+from .schema import BATCH_UPDATE_FIELDS, WEEKDAY_SCHEMAS, clean_day_data, schema_for
+from .quick_entry import TOKEN_REQUIRED, entry_changes, queued_payload, submission_payload, token_error, validation_payload
+from .pagination import InvalidCursor, keyset_page, page_size_from, wants_total
+from .response_cache import cached_per_user
+from .rollups import activity_count
+from .signals import activities_changed, activity_snapshot
+from .sqlite import retry_on_locked
+from .streaming import buffered, week_grouped_json, week_header
+from .weeks import calendar, week_for
+from .write_buffer import quick_entry_buffer
 from authentication.models import User
+from authentication.qr_tokens import resolve_token
 
 
 
 
 
-DAY_SPECIFIC_FIELDS = {
-    "Monday": [],
-    "Tuesday": [],
-    "Wednesday": [],
-    "Thursday": ["thursday_morning_chanting_session_attendance"],
-    "Friday": ["friday_morning_chanting_session_attendance"],
-    "Saturday": [],
-    "Sunday": ["sunday_offline_program_attendance", "sunday_temple_chanting_session_attendance"]
-}
-
-# ✅ Always editable fields (everyday)
-BASE_FIELDS = ["daily_hearing", "daily_reading", "daily_chanting", "sport_session_attendance"]
+# Most days a single add-or-edit-week request may carry
+MAX_BATCH_DAYS = 7
 
 class DailyActivityViewSet(viewsets.ModelViewSet):
     queryset = DailyActivity.objects.all()
@@ -37,9 +40,31 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        The devotee's days, oldest first, one page at a time.
+        Query params: limit, cursor (from next_cursor), include_total
+        (default true, include_total=false skips the count)
+        """
+        try:
+            rows, next_cursor = keyset_page(
+                daily_activity_rows.rows(self.get_queryset()),
+                ('date', 'id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size_from(request.query_params),
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
+
+        response = {"results": daily_activity_rows.many(rows), "next_cursor": next_cursor}
+        if wants_total(request.query_params, default=True):
+            response["total_count"] = activity_count(request.user.pk)
+        return Response(response)
+
     # 🟢 API 1 — Fetch all week data (Mon–Sun)
     #
     @action(detail=False, methods=['GET'], url_path='week-data')
+    @cached_per_user('week-data')
     def get_week_data(self, request):
         """
         Return all days of current week with editable fields for each day.
@@ -48,50 +73,31 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
         start_of_week = today - timedelta(days=today.weekday())  # Monday
         end_of_week = start_of_week + timedelta(days=6)
 
-        week_obj, _ = Week.objects.get_or_create(
-            start_date=start_of_week,
-            end_date=end_of_week,
-            month=start_of_week.month,
-            year=start_of_week.year,
-            created_by=request.user,
-            defaults={"name": f"Week of {start_of_week}"}
-        )
+        week_obj = week_for(start_of_week)
 
         # Fetch user’s existing daily activities
-        activities = DailyActivity.objects.filter(
-            user=request.user,
-            date__range=[start_of_week, end_of_week]
-        )
+        activities = {
+            row['date']: row for row in daily_activity_rows.rows(DailyActivity.objects.filter(
+                user=request.user,
+                date__range=[start_of_week, end_of_week]
+            ))
+        }
 
         week_data = []
         for i in range(7):
             current_date = start_of_week + timedelta(days=i)
-            activity = next((a for a in activities if a.date == current_date), None)
-            day_name = current_date.strftime("%A")
-
-            # Define editable fields dynamically based on weekday
-            editable_fields = ["daily_hearing", "daily_reading", "daily_chanting","sport_session_attendance"]
-
-            if day_name == "Thursday":
-                editable_fields.append("thursday_morning_chanting_session_attendance")
-            elif day_name == "Sunday":
-                editable_fields.extend([
-                    "sunday_offline_program_attendance",
-                    "sunday_temple_chanting_session_attendance",
-                    "weekly_discussion_session",
-                    "weekly_sloka_audio_posted",
-                    "weekly_seva"
-                ])
+            activity = activities.get(current_date)
+            day_schema = WEEKDAY_SCHEMAS[i]
 
             # Only make editable if date <= today
             is_editable = current_date <= today
 
             week_data.append({
                 "date": str(current_date),
-                "day": day_name,
+                "day": day_schema.day_name,
                 "is_editable": is_editable,
-                "editable_fields": editable_fields if is_editable else [],
-                "activity": DailyActivitySerializer(activity).data if activity else None
+                "editable_fields": list(day_schema.editable_fields) if is_editable else [],
+                "activity": daily_activity_rows.to_representation(activity) if activity else None
             })
 
         return Response({
@@ -122,35 +128,24 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
         if activity_date > today:
             return Response({"error": "Cannot add future data."}, status=400)
 
-        # Compute week start/end
+        # Compute week start
         start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
 
         if activity_date < start_of_week:
             return Response({"error": "Cannot edit previous week’s data."}, status=400)
 
         # Get week object
-        week_obj, _ = Week.objects.get_or_create(
-            start_date=start_of_week,
-            end_date=end_of_week,
-            month=start_of_week.month,
-            year=start_of_week.year,
-            created_by=user,
-            defaults={"name": f"Week of {start_of_week}"}
-        )
+        week_obj = week_for(start_of_week)
         # ✅ Determine which fields are editable for this date
-        weekday_name = activity_date.strftime("%A")
-        allowed_fields = BASE_FIELDS + DAY_SPECIFIC_FIELDS.get(weekday_name, [])
-        
-        # Add Sunday weekly fields if it's Sunday
-        if weekday_name == "Sunday":
-            allowed_fields.extend(["weekly_discussion_session", "weekly_sloka_audio_posted", "weekly_seva"])
+        day_schema = schema_for(activity_date)
+        weekday_name = day_schema.day_name
+        allowed_fields = list(day_schema.editable_fields)
 
         # Filter only allowed fields from request data
-        update_data = {k: v for k, v in request.data.items() if k in allowed_fields}
+        update_data = {k: v for k, v in request.data.items() if k in day_schema.editable_field_set}
 
-        # Update or create activity
-        activity, created = DailyActivity.objects.update_or_create(
+        # Update or create activity; only this write holds the database lock
+        activity, created = retry_on_locked(DailyActivity.objects.update_or_create)(
             user=user,
             date=activity_date,
             defaults={**update_data, "week": week_obj}
@@ -163,6 +158,108 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
             "data": serializer.data
         }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
+    # 🟣 API 2b — Add or Edit several days of the current week at once
+    @action(detail=False, methods=['POST'], url_path='add-or-edit-week')
+    def add_or_edit_week(self, request):
+        """
+        Add or edit up to seven days of the current week in one transaction.
+        Body: {"days": [{"date": "YYYY-MM-DD", <editable fields>}, ...]}
+        Each day follows the add-or-edit-day rules. Days are saved all or none:
+        if any day is invalid, nothing is written and every day's result is reported.
+        """
+        user = request.user
+        days = request.data.get("days")
+
+        if not isinstance(days, list) or not days:
+            return Response({"error": "days must be a non-empty list."}, status=400)
+        if len(days) > MAX_BATCH_DAYS:
+            return Response({"error": f"At most {MAX_BATCH_DAYS} days can be submitted at once."}, status=400)
+
+        today = date.today()
+        start_of_week = today - timedelta(days=today.weekday())
+
+        # Validate every day before writing anything
+        results = []
+        accepted = {}
+        for entry in days:
+            if not isinstance(entry, dict):
+                results.append({"date": None, "status": "error", "error": "Each day must be an object."})
+                continue
+            date_str = entry.get("date")
+            try:
+                activity_date = date.fromisoformat(date_str) if date_str else None
+            except (TypeError, ValueError):
+                activity_date = None
+                error = "Invalid date format. Use YYYY-MM-DD."
+            else:
+                error = None if activity_date else "Date is required."
+
+            if activity_date and activity_date > today:
+                error = "Cannot add future data."
+            elif activity_date and activity_date < start_of_week:
+                error = "Cannot edit previous week’s data."
+            elif activity_date in accepted:
+                error = "Date submitted more than once."
+
+            if not error:
+                day_schema = schema_for(activity_date)
+                values, error = clean_day_data(day_schema, entry)
+            if error:
+                results.append({"date": date_str, "status": "error", "error": error})
+                continue
+
+            accepted[activity_date] = values
+            results.append({
+                "date": str(activity_date),
+                "day": day_schema.day_name,
+                "editable_fields": list(day_schema.editable_fields),
+            })
+
+        if len(accepted) < len(days):
+            for result in results:
+                result.setdefault("status", "not saved")
+            return Response({"error": "Invalid days submitted, nothing was saved.", "results": results}, status=400)
+
+        week_obj = week_for(start_of_week)
+
+        @retry_on_locked
+        def save():
+            existing = {a.date: a for a in DailyActivity.objects.filter(user=user, date__in=accepted)}
+
+            # Unsubmitted fields keep their stored values, so one upsert can cover every day
+            upserts = []
+            for activity_date, values in accepted.items():
+                current = existing.get(activity_date)
+                stored = {field: getattr(current, field) for field in BATCH_UPDATE_FIELDS[1:]} if current else {}
+                upserts.append(DailyActivity(user=user, date=activity_date, week=week_obj, **{**stored, **values}))
+            DailyActivity.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["user", "date"],
+                update_fields=BATCH_UPDATE_FIELDS,
+            )
+
+            saved = list(DailyActivity.objects.filter(user=user, date__in=accepted).select_related("week").order_by("date"))
+            # bulk_create skips model signals, so derived stores are updated here
+            activities_changed([
+                (existing[a.date]._loaded_values if a.date in existing else None, activity_snapshot(a))
+                for a in saved
+            ])
+            return existing, saved
+
+        existing, saved = save()
+        for result in results:
+            if "status" not in result:
+                result["status"] = "updated" if date.fromisoformat(result["date"]) in existing else "created"
+        for activity in saved:
+            activity.user = user
+
+        return Response({
+            "message": f"{len(saved)} day(s) saved successfully.",
+            "results": results,
+            "data": self.get_serializer(saved, many=True).data
+        }, status=status.HTTP_200_OK)
+
     # 🔴 API 3 — Delete specific day data
     @action(detail=True, methods=['DELETE'], url_path='delete-day')
     def delete_day(self, request, pk=None):
@@ -175,7 +272,7 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
             if not (week_start <= activity.date <= today):
                 return Response({"error": "Cannot delete this date’s data."}, status=400)
 
-            activity.delete()
+            retry_on_locked(activity.delete)()
             return Response({"message": "Deleted successfully."}, status=204)
         except DailyActivity.DoesNotExist:
             return Response({"error": "Not found."}, status=404)
@@ -184,24 +281,31 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['GET'], url_path='filter')
     def filter_activities(self, request):
         """
-        Filter activities by week, month, or year.
-        Query params: week_id, month, year
+        Filter activities by week, month, or year, newest first, one page at a time.
+        Query params: week_id, month, year, limit, cursor (from next_cursor), include_total, stream
+        (include_total defaults to true, include_total=false skips the count)
+        A week can continue on the next page under the same week_id.
+        With stream=true every matching day is streamed week by week instead,
+        with total_count at the end, so long histories use constant memory.
         """
         user = request.user
-        week_id = request.query_params.get('week_id')
+        week_id_param = request.query_params.get('week_id')
         month = request.query_params.get('month')
         year = request.query_params.get('year')
+        stream = request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
 
         # Start with user's activities
         queryset = DailyActivity.objects.filter(user=user).order_by('-date')
 
         # Filter by week_id if provided
-        if week_id:
+        if week_id_param:
             try:
-                week_obj = Week.objects.get(id=week_id, created_by=user)
-                queryset = queryset.filter(week=week_obj)
-            except Week.DoesNotExist:
+                week_obj = calendar.get(int(week_id_param))
+            except ValueError:
+                week_obj = None
+            if week_obj is None:
                 return Response({"error": "Week not found."}, status=404)
+            queryset = queryset.filter(week=week_obj)
 
         # Filter by month if provided
         if month:
@@ -221,37 +325,41 @@ class DailyActivityViewSet(viewsets.ModelViewSet):
             except ValueError:
                 return Response({"error": "Invalid year format."}, status=400)
 
-        # Get current week for editable check
         today = date.today()
-        current_week_start = today - timedelta(days=today.weekday())
-        current_week_end = current_week_start + timedelta(days=6)
+        if stream:
+            return StreamingHttpResponse(buffered(week_grouped_json(queryset, today)), content_type='application/json')
+
+        try:
+            rows, next_cursor = keyset_page(
+                daily_activity_rows.rows(queryset),
+                ('-date', '-id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size_from(request.query_params),
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
 
         # Group by week for better organization
         weeks_data = {}
-        for activity in queryset:
-            week_id = activity.week.id
+        for row in rows:
+            week_id = row['week_id']
             if week_id not in weeks_data:
-                is_current_week = current_week_start <= activity.week.start_date <= current_week_end
-                weeks_data[week_id] = {
-                    "week_id": week_id,
-                    "week_name": activity.week.name,
-                    "start_date": str(activity.week.start_date),
-                    "end_date": str(activity.week.end_date),
-                    "month": activity.week.month,
-                    "year": activity.week.year,
-                    "is_current_week": is_current_week,
-                    "activities": []
-                }
-            # Serialize each activity individually
-            activity_serializer = DailyActivitySerializer(activity)
-            weeks_data[week_id]["activities"].append(activity_serializer.data)
+                weeks_data[week_id] = {**week_header(calendar.get(week_id), today), "activities": []}
+            weeks_data[week_id]["activities"].append(daily_activity_rows.to_representation(row))
 
-        return Response({
-            "total_count": queryset.count(),
-            "weeks": list(weeks_data.values())
-        }, status=status.HTTP_200_OK)
+        response = {
+            "weeks": list(weeks_data.values()),
+            "next_cursor": next_cursor,
+        }
+        if wants_total(request.query_params, default=True):
+            response["total_count"] = activity_count(
+                user.pk, year=year or None, month=month or None,
+                week_start=week_obj.start_date if week_id_param else None,
+            )
+        return Response(response, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['GET'], url_path='chanting-round-count')
+    @cached_per_user('chanting-round-count')
     def get_chanting_round_count(self, request):
         """
         Get the total number of chanting rounds 
@@ -274,30 +382,47 @@ class MonthlyActivityViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        The devotee's months, newest first, one page at a time.
+        Query params: limit, cursor (from next_cursor), include_total
+        (default true, include_total=false skips the COUNT)
+        """
+        return self._monthly_page(request, self.get_queryset(), "results")
+
+    def _monthly_page(self, request, queryset, key):
+        try:
+            page, next_cursor = keyset_page(
+                queryset.select_related('user').prefetch_related('weeks'),
+                ('-year', '-month', '-id'),
+                cursor=request.query_params.get('cursor'),
+                page_size=page_size_from(request.query_params),
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
+
+        response = {key: self.get_serializer(page, many=True).data, "next_cursor": next_cursor}
+        if wants_total(request.query_params, default=True):
+            # At most twelve rows per year
+            response["total_count"] = queryset.count()
+        return Response(response, status=status.HTTP_200_OK)
+
     # 🟢 API 1 — Get current month's activity
     @action(detail=False, methods=['GET'], url_path='current-month')
+    @cached_per_user('current-month')
     def get_current_month(self, request):
         """
-        Get or create monthly activity for current month.
+        Get monthly activity for current month. A month that was never saved
+        is returned with its defaults and no id; add-or-edit creates it.
         """
         today = date.today()
-        current_month = today.month
-        current_year = today.year
-
-        monthly_activity, created = MonthlyActivity.objects.get_or_create(
-            user=request.user,
-            month=current_month,
-            year=current_year,
-            defaults={}
-        )
 
-        # Get all weeks for this month
-        weeks = Week.objects.filter(
-            created_by=request.user,
-            month=current_month,
-            year=current_year
-        )
-        monthly_activity.weeks.set(weeks)
+        monthly_activity = self.get_queryset().filter(
+            month=today.month, year=today.year,
+        ).select_related('user').prefetch_related('weeks').first()
+        if monthly_activity is None:
+            # A GET must not write, the row is created by the first save
+            monthly_activity = MonthlyActivity(user=request.user, month=today.month, year=today.year)
 
         serializer = self.get_serializer(monthly_activity)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -357,54 +482,45 @@ class MonthlyActivityViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({"error": "Invalid month or year format."}, status=400)
 
-        # Get or create monthly activity
-        monthly_activity, created = MonthlyActivity.objects.get_or_create(
-            user=request.user,
-            month=month,
-            year=year,
-            defaults={}
-        )
+        # Update weeks - use provided week_ids or auto-assign weeks for this month
+        week_ids = request.data.get('week_ids')
+        if isinstance(week_ids, list) and len(week_ids) > 0:
+            weeks = set(Week.objects.filter(id__in=week_ids).values_list('id', flat=True))
+        else:
+            weeks = {week.pk for week in calendar.weeks_in_month(year, month)}
+
+        # Only the writes run in the transaction, retried while the database is locked
+        @retry_on_locked
+        def save():
+            # Get or create monthly activity
+            monthly_activity, created = MonthlyActivity.objects.get_or_create(
+                user=request.user,
+                month=month,
+                year=year,
+                defaults={}
+            )
 
-        # Update fields
-        update_fields = [
-            'one_to_one_meeting_conducted_with_counselor',
-            'monthly_morning_program',
-            'monthly_book_completed',
-            'book_name',
-            'book_discussion_attended'
-        ]
+            # Update fields
+            update_fields = [
+                'one_to_one_meeting_conducted_with_counselor',
+                'monthly_morning_program',
+                'monthly_book_completed',
+                'book_name',
+                'book_discussion_attended'
+            ]
 
-        for field in update_fields:
-            if field in request.data:
-                setattr(monthly_activity, field, request.data[field])
+            for field in update_fields:
+                if field in request.data:
+                    setattr(monthly_activity, field, request.data[field])
 
-        monthly_activity.save()
+            monthly_activity.save()
 
-        # Update weeks - use provided week_ids or auto-assign weeks for this month
-        if 'week_ids' in request.data and request.data['week_ids']:
-            week_ids = request.data['week_ids']
-            if isinstance(week_ids, list) and len(week_ids) > 0:
-                weeks = Week.objects.filter(
-                    id__in=week_ids,
-                    created_by=request.user
-                )
-                monthly_activity.weeks.set(weeks)
-            else:
-                # Auto-assign weeks for this month if week_ids is empty or invalid
-                weeks = Week.objects.filter(
-                    created_by=request.user,
-                    month=month,
-                    year=year
-                )
+            # Most saves keep the weeks; set() would still diff them in a transaction and send m2m signals
+            if set(monthly_activity.weeks.values_list('id', flat=True)) != weeks:
                 monthly_activity.weeks.set(weeks)
-        else:
-            # Auto-assign weeks for this month if not provided
-            weeks = Week.objects.filter(
-                created_by=request.user,
-                month=month,
-                year=year
-            )
-            monthly_activity.weeks.set(weeks)
+            return monthly_activity, created
+
+        monthly_activity, created = save()
 
         # Serialize and return response
         serializer = self.get_serializer(monthly_activity)
@@ -417,8 +533,9 @@ class MonthlyActivityViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['GET'], url_path='filter')
     def filter_monthly_activities(self, request):
         """
-        Filter monthly activities by year or month.
-        Query params: year, month (optional)
+        Filter monthly activities by year or month, newest first, one page at a time.
+        Query params: year, month (optional), limit, cursor (from next_cursor), include_total
+        (default true, include_total=false skips the COUNT)
         """
         user = request.user
         queryset = MonthlyActivity.objects.filter(user=user).order_by('-year', '-month')
@@ -442,11 +559,7 @@ class MonthlyActivityViewSet(viewsets.ModelViewSet):
             except ValueError:
                 return Response({"error": "Invalid month format."}, status=400)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            "total_count": queryset.count(),
-            "activities": serializer.data
-        }, status=status.HTTP_200_OK)
+        return self._monthly_page(request, queryset, "activities")
 
 
 # QR Code Quick Entry Views (Public - No Authentication Required)
@@ -459,179 +572,29 @@ def validate_qr_token(request, token):
     No authentication required - uses token instead
     """
     if not token:
-        return Response({"error": "Token is required."}, status=status.HTTP_400_BAD_REQUEST)
-    
-    try:
-        user = User.objects.get(qr_token=token, is_active=True)
-    except User.DoesNotExist:
-        return Response({
-            "error": "Invalid or expired QR token. Please generate a new QR code from your profile."
-        }, status=status.HTTP_404_NOT_FOUND)
+        return Response(TOKEN_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
     
-    # Check if token is too old (optional - 1 year expiration)
-    if user.qr_token_created_at:
-        days_old = (timezone.now() - user.qr_token_created_at).days
-        if days_old > 365:
-            return Response({
-                "error": "QR token has expired. Please generate a new QR code from your profile."
-            }, status=status.HTTP_400_BAD_REQUEST)
+    user = resolve_token(token)
+    error = token_error(user)
+    if error:
+        return Response(*error)
     
     # Get today's date
     today = date.today()
-    weekday_name = today.strftime("%A")
-    
-    # Determine editable fields for today
-    allowed_fields = BASE_FIELDS + DAY_SPECIFIC_FIELDS.get(weekday_name, [])
-    
-    # Add Sunday weekly fields if it's Sunday
-    if weekday_name == "Sunday":
-        allowed_fields.extend(["weekly_discussion_session", "weekly_sloka_audio_posted", "weekly_seva"])
+    day_schema = schema_for(today)
     
     # Get existing activity for today if any
     existing_activity = None
     try:
-        activity = DailyActivity.objects.get(user=user, date=today)
+        activity = DailyActivity.objects.select_related('week').get(user=user, date=today)
+        activity.user = user  # already resolved from the token, avoids a users lookup
         serializer = DailyActivitySerializer(activity)
         existing_activity = serializer.data
     except DailyActivity.DoesNotExist:
         pass
     
-    # Build field definitions for frontend
-    field_definitions = {}
-    
-    # Base fields
-    if "daily_hearing" in allowed_fields:
-        field_definitions["daily_hearing"] = {
-            "label": "Daily Hearing",
-            "type": "select",
-            "options": [
-                {"value": "Completed", "label": "Completed"},
-                {"value": "Not Completed", "label": "Not Completed"}
-            ],
-            "value": existing_activity.get("daily_hearing", "Not Completed") if existing_activity else "Not Completed"
-        }
-    
-    if "daily_reading" in allowed_fields:
-        field_definitions["daily_reading"] = {
-            "label": "Daily Reading",
-            "type": "select",
-            "options": [
-                {"value": "Completed", "label": "Completed"},
-                {"value": "Not Completed", "label": "Not Completed"}
-            ],
-            "value": existing_activity.get("daily_reading", "Not Completed") if existing_activity else "Not Completed"
-        }
-    
-    if "daily_chanting" in allowed_fields:
-        field_definitions["daily_chanting"] = {
-            "label": "Daily Chanting (Rounds)",
-            "type": "number",
-            "min": 0,
-            "value": existing_activity.get("daily_chanting", 0) if existing_activity else 0
-        }
-    
-    if "sport_session_attendance" in allowed_fields:
-        field_definitions["sport_session_attendance"] = {
-            "label": "Sport Session Attendance",
-            "type": "select",
-            "options": [
-                {"value": "Attended", "label": "Attended"},
-                {"value": "Not Attended", "label": "Not Attended"},
-                {"value": "No Session Today", "label": "No Session Today"}
-            ],
-            "value": existing_activity.get("sport_session_attendance", "Not Attended") if existing_activity else "Not Attended"
-        }
-    
-    # Thursday specific
-    if "thursday_morning_chanting_session_attendance" in allowed_fields:
-        field_definitions["thursday_morning_chanting_session_attendance"] = {
-            "label": "Thursday Morning Chanting Session",
-            "type": "select",
-            "options": [
-                {"value": "Attended", "label": "Attended"},
-                {"value": "Not Attended", "label": "Not Attended"}
-            ],
-            "value": existing_activity.get("thursday_morning_chanting_session_attendance", "Not Attended") if existing_activity else "Not Attended"
-        }
-    
-    # Friday specific
-    if "friday_morning_chanting_session_attendance" in allowed_fields:
-        field_definitions["friday_morning_chanting_session_attendance"] = {
-            "label": "Friday Morning Chanting Session",
-            "type": "select",
-            "options": [
-                {"value": "Attended", "label": "Attended"},
-                {"value": "Not Attended", "label": "Not Attended"}
-            ],
-            "value": existing_activity.get("friday_morning_chanting_session_attendance", "Not Attended") if existing_activity else "Not Attended"
-        }
-    
-    # Sunday specific
-    if "sunday_offline_program_attendance" in allowed_fields:
-        field_definitions["sunday_offline_program_attendance"] = {
-            "label": "Sunday Offline Program Attendance",
-            "type": "select",
-            "options": [
-                {"value": "Attended", "label": "Attended"},
-                {"value": "Not Attended", "label": "Not Attended"}
-            ],
-            "value": existing_activity.get("sunday_offline_program_attendance", "Not Attended") if existing_activity else "Not Attended"
-        }
-    
-    if "sunday_temple_chanting_session_attendance" in allowed_fields:
-        field_definitions["sunday_temple_chanting_session_attendance"] = {
-            "label": "Sunday Temple Chanting Session",
-            "type": "select",
-            "options": [
-                {"value": "Attended", "label": "Attended"},
-                {"value": "Not Attended", "label": "Not Attended"}
-            ],
-            "value": existing_activity.get("sunday_temple_chanting_session_attendance", "Not Attended") if existing_activity else "Not Attended"
-        }
-    
-    if "weekly_discussion_session" in allowed_fields:
-        field_definitions["weekly_discussion_session"] = {
-            "label": "Weekly Discussion Session",
-            "type": "select",
-            "options": [
-                {"value": "Online", "label": "Online"},
-                {"value": "Offline", "label": "Offline"},
-                {"value": "Not Attended", "label": "Not Attended"}
-            ],
-            "value": existing_activity.get("weekly_discussion_session", "Not Attended") if existing_activity else "Not Attended"
-        }
-    
-    if "weekly_sloka_audio_posted" in allowed_fields:
-        field_definitions["weekly_sloka_audio_posted"] = {
-            "label": "Weekly Sloka Audio Posted",
-            "type": "select",
-            "options": [
-                {"value": "Yes", "label": "Yes"},
-                {"value": "No", "label": "No"}
-            ],
-            "value": existing_activity.get("weekly_sloka_audio_posted", "No") if existing_activity else "No"
-        }
-    
-    if "weekly_seva" in allowed_fields:
-        field_definitions["weekly_seva"] = {
-            "label": "Weekly Seva",
-            "type": "select",
-            "options": [
-                {"value": "Yes", "label": "Yes"},
-                {"value": "No", "label": "No"}
-            ],
-            "value": existing_activity.get("weekly_seva", "No") if existing_activity else "No"
-        }
-    
-    return Response({
-        "valid": True,
-        "user_name": f"{user.first_name} {user.last_name}",
-        "today": today.isoformat(),
-        "day_name": weekday_name,
-        "editable_fields": allowed_fields,
-        "field_definitions": field_definitions,
-        "has_existing_data": existing_activity is not None
-    }, status=status.HTTP_200_OK)
+    pending = quick_entry_buffer.pending(user.pk, today) if quick_entry_buffer.enabled else None
+    return Response(validation_payload(user, today, day_schema, existing_activity, pending), status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -641,83 +604,37 @@ def submit_quick_entry(request, token):
     
     """
     if not token:
-        return Response({"error": "Token is required."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TOKEN_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        user = User.objects.get(qr_token=token, is_active=True)
-    except User.DoesNotExist:
-        return Response({
-            "error": "Invalid or expired QR token. Please generate a new QR code from your profile."
-        }, status=status.HTTP_404_NOT_FOUND)
-    
-    # Check token expiration
-    if user.qr_token_created_at:
-        days_old = (timezone.now() - user.qr_token_created_at).days
-        if days_old > 365:
-            return Response({
-                "error": "QR token has expired. Please generate a new QR code from your profile."
-            }, status=status.HTTP_400_BAD_REQUEST)
+    user = resolve_token(token)
+    error = token_error(user)
+    if error:
+        return Response(*error)
     
     # Get today's date
     today = date.today()
-    weekday_name = today.strftime("%A")
-    
-    # Determine editable fields for today
-    allowed_fields = BASE_FIELDS + DAY_SPECIFIC_FIELDS.get(weekday_name, [])
+    day_schema = schema_for(today)
     
-    # Add Sunday weekly fields if it's Sunday
-    if weekday_name == "Sunday":
-        allowed_fields.extend(["weekly_discussion_session", "weekly_sloka_audio_posted", "weekly_seva"])
+    # Only today's fields, with valid values
+    update_data, error = entry_changes(day_schema, request.data)
+    if error:
+        return Response(*error)
     
-    # Validate that only allowed fields are being submitted
-    submitted_fields = set(request.data.keys())
-    invalid_fields = submitted_fields - set(allowed_fields + ['date'])  # date is allowed for validation
-    
-    if invalid_fields:
-        return Response({
-            "error": f"Invalid fields submitted: {', '.join(invalid_fields)}. Only today's fields are allowed."
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Compute week start/end
-    start_of_week = today - timedelta(days=today.weekday())
-    end_of_week = start_of_week + timedelta(days=6)
-    
-    # Get or create week object
-    week_obj, _ = Week.objects.get_or_create(
-        start_date=start_of_week,
-        end_date=end_of_week,
-        month=start_of_week.month,
-        year=start_of_week.year,
-        created_by=user,
-        defaults={"name": f"Week of {start_of_week}"}
-    )
+    if quick_entry_buffer.enabled:
+        # Acknowledged once journaled, written with the next flush
+        values = quick_entry_buffer.submit(user.pk, today, update_data)
+        return Response(*queued_payload(day_schema, today, values))
     
-    # Filter only allowed fields from request data
-    update_data = {k: v for k, v in request.data.items() if k in allowed_fields}
-    
-    # Validate data types
-    if 'daily_chanting' in update_data:
-        try:
-            update_data['daily_chanting'] = int(update_data['daily_chanting'])
-            if update_data['daily_chanting'] < 0:
-                return Response({"error": "Daily chanting rounds cannot be negative."}, status=status.HTTP_400_BAD_REQUEST)
-        except (ValueError, TypeError):
-            return Response({"error": "Daily chanting must be a valid number."}, status=status.HTTP_400_BAD_REQUEST)
+    # Shared calendar week
+    week_obj = week_for(today)
     
     # Update or create activity
-    activity, created = DailyActivity.objects.update_or_create(
+    activity, created = retry_on_locked(DailyActivity.objects.update_or_create)(
         user=user,
         date=today,
         defaults={**update_data, "week": week_obj}
     )
+    activity.user = user  # already resolved from the token, avoids a users lookup
     
     serializer = DailyActivitySerializer(activity)
-    return Response({
-        "message": f"Today's ({weekday_name}) activities {'saved' if created else 'updated'} successfully!",
-        "data": serializer.data,
-        "day_name": weekday_name
-    }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
-
-
-
-
+    return Response(*submission_payload(day_schema, serializer.data, created))
@@ -0,0 +1,160 @@
+"""
+Shared calendar of Monday-to-Sunday weeks.
+
+Every devotee's activities point at the same canonical Week row, one per
+start date. The calendar is generated ahead of time (see the generate_weeks
+command) and kept in an in-process map, so finding the week of a date does
+not query the database. Week rows never change once created, so the cached
+instances are shared and must be treated as read-only.
+
+A MonthlyActivity is linked to the weeks starting in its month when it is
+created, and weeks created later are linked to the months already saved, so
+reading a month never has to repair its weeks.
+"""
+import threading
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import response_cache
+from .models import MonthlyActivity, Week
+from .rollups import week_start_for
+
+
+def week_values(start_date):
+    """Column values of the week starting on start_date (a Monday)"""
+    return {
+        "name": f"Week of {start_date}",
+        "end_date": start_date + timedelta(days=6),
+        "month": start_date.month,
+        "year": start_date.year,
+    }
+
+
+def generate_weeks(first_year, last_year):
+    """Create the missing weeks starting in first_year..last_year, returns how many were created"""
+    start = week_start_for(date(first_year, 1, 1))
+    if start.year < first_year:
+        start += timedelta(days=7)
+    existing = set(Week.objects.filter(year__gte=first_year, year__lte=last_year).values_list('start_date', flat=True))
+    missing = []
+    while start.year <= last_year:
+        if start not in existing:
+            missing.append(Week(start_date=start, **week_values(start)))
+        start += timedelta(days=7)
+    Week.objects.bulk_create(missing, ignore_conflicts=True)
+    if missing:
+        # ignore_conflicts leaves the ids unset
+        link_new_weeks(Week.objects.filter(start_date__in=[week.start_date for week in missing]))
+    return len(missing)
+
+
+def _link(pairs, user_ids):
+    """Add (monthly activity id, week id) pairs to the M2M table, skipping existing ones"""
+    Link = MonthlyActivity.weeks.through
+    links = [Link(monthlyactivity_id=monthly_id, week_id=week_id) for monthly_id, week_id in pairs]
+    if links:
+        Link.objects.bulk_create(links, ignore_conflicts=True)
+        # bulk_create sends no m2m_changed
+        response_cache.bump_versions(user_ids)
+
+
+def link_new_weeks(weeks):
+    """Add newly created weeks to the monthly activities of the month they start in"""
+    weeks = list(weeks)
+    if not weeks:
+        return
+    by_month = {}
+    for week in weeks:
+        by_month.setdefault((week.year, week.month), []).append(week.pk)
+    months = MonthlyActivity.objects.filter(
+        reduce(or_, (Q(year=year, month=month) for year, month in by_month))
+    ).values_list('id', 'user_id', 'year', 'month')
+    pairs, user_ids = [], set()
+    for monthly_id, user_id, year, month in months:
+        pairs.extend((monthly_id, week_id) for week_id in by_month[(year, month)])
+        user_ids.add(user_id)
+    _link(pairs, user_ids)
+
+
+def link_calendar_weeks(monthly_activities):
+    """Link newly created monthly activities to the weeks starting in their month"""
+    monthly_activities = list(monthly_activities)
+    _link(
+        [
+            (monthly.pk, week.pk)
+            for monthly in monthly_activities
+            for week in calendar.weeks_in_month(monthly.year, monthly.month)
+        ],
+        {monthly.user_id for monthly in monthly_activities},
+    )
+
+
+class WeekCalendar:
+    """Thread-safe in-process map of start date -> Week, loaded from the table on first use"""
+
+    def __init__(self):
+        self._by_start = {}
+        self._by_id = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if not self._loaded:
+                for week in Week.objects.all():
+                    self._add(week)
+                self._loaded = True
+
+    def _add(self, week):
+        self._by_start[week.start_date] = week
+        self._by_id[week.pk] = week
+
+    def week_for(self, day):
+        """Canonical week containing a date, created if the calendar does not reach it yet"""
+        if not self._loaded:
+            self._load()
+        start_date = week_start_for(day)
+        week = self._by_start.get(start_date)
+        if week is None:
+            week, created = Week.objects.get_or_create(start_date=start_date, defaults=week_values(start_date))
+            if created:
+                link_new_weeks([week])
+            # Only cache the row once it is known to be committed
+            transaction.on_commit(lambda: self._add(week))
+        return week
+
+    def get(self, week_id):
+        """Week by id, or None"""
+        if not self._loaded:
+            self._load()
+        week = self._by_id.get(week_id)
+        if week is None:
+            week = Week.objects.filter(pk=week_id).first()
+            if week is not None:
+                transaction.on_commit(lambda: self._add(week))
+        return week
+
+    def weeks_in_month(self, year, month):
+        """Weeks starting in the given month, in order"""
+        start = week_start_for(date(year, month, 1))
+        if start.month != month:
+            start += timedelta(days=7)
+        weeks = []
+        while start.month == month:
+            weeks.append(self.week_for(start))
+            start += timedelta(days=7)
+        return weeks
+
+    def clear(self):
+        with self._lock:
+            self._by_start.clear()
+            self._by_id.clear()
+            self._loaded = False
+
+
+calendar = WeekCalendar()
+week_for = calendar.week_for
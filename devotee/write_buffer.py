@@ -0,0 +1,459 @@
+"""
+Optional write-coalescing buffer for QR quick-entry submissions.
+
+Right after a program many phones submit within a few minutes, and on
+SQLite every separate upsert competes for the single writer lock. With the
+buffer enabled (settings.QUICK_ENTRY_BUFFER) a validated submission is
+appended to a local journal and acknowledged at once. Repeated submissions
+for the same (user, date) are merged, later values winning, and a
+background thread writes everything pending in one transaction every
+FLUSH_INTERVAL_SECONDS, or sooner once MAX_PENDING entries are waiting.
+
+Crash safety: each worker process appends to its own journal file in
+JOURNAL_DIR, named by its pid and a token drawn when it starts, so a
+restarted worker that gets the same pid never mistakes its predecessor's
+journal for its own. A flush moves the journal aside and deletes it only
+after its transaction committed. A worker that starts replays the journals
+of processes that are no longer running, and the flush_quick_entries
+command does the same offline.
+
+Submissions are validated like any other write before they are journaled.
+Should an entry still fail to write, a failed batch is retried one entry at
+a time: the entry that fails on its own is moved to the quarantine file
+with its error instead of holding back everyone else's. A database error
+that may pass (locked, disconnected) keeps the whole batch for the next
+flush instead.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+from authentication.models import User
+from .models import DailyActivity
+from .schema import BATCH_UPDATE_FIELDS
+from .signals import activities_changed, activity_snapshot
+from .sqlite import retry_on_locked
+from .weeks import week_for
+
+
+logger = logging.getLogger(__name__)
+
+# quick-entry-<pid>-<token>.journal / .flushing, plus .claimed-<pid>-<token> while another
+# process takes them over (files of older versions have no tokens)
+JOURNAL_NAME = re.compile(
+    r'^quick-entry-(\d+)(?:-([0-9a-f]+))?\.(journal|flushing)(?:\.claimed-(\d+)(?:-([0-9a-f]+))?)?$'
+)
+QUARANTINE_NAME = 'quick-entry-quarantine.jsonl'
+
+# Failures of the database rather than of an entry: the batch is kept for the next flush
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+@retry_on_locked
+def write_entries(entries):
+    """
+    Upsert merged submissions {(user_id, date): values} into DailyActivity
+    in one transaction; fields a submission leaves out keep their stored
+    values. Entries of deleted users are dropped. Returns the rows written.
+    """
+    user_ids = {user_id for user_id, _ in entries}
+    live_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    entries = {key: values for key, values in entries.items() if key[0] in live_users}
+    if not entries:
+        return 0
+    dates = {day for _, day in entries}
+
+    with transaction.atomic():
+        existing = {
+            (activity.user_id, activity.date): activity
+            for activity in DailyActivity.objects.filter(user_id__in=live_users, date__in=dates)
+            if (activity.user_id, activity.date) in entries
+        }
+        upserts = []
+        for (user_id, day), values in entries.items():
+            current = existing.get((user_id, day))
+            stored = {field: getattr(current, field) for field in BATCH_UPDATE_FIELDS[1:]} if current else {}
+            upserts.append(DailyActivity(user_id=user_id, date=day, week=week_for(day), **{**stored, **values}))
+        DailyActivity.objects.bulk_create(
+            upserts,
+            update_conflicts=True,
+            unique_fields=["user", "date"],
+            update_fields=BATCH_UPDATE_FIELDS,
+        )
+
+        saved = [
+            activity for activity in DailyActivity.objects.filter(user_id__in=live_users, date__in=dates)
+            if (activity.user_id, activity.date) in entries
+        ]
+        # bulk_create skips model signals, so derived stores are updated here
+        activities_changed([
+            (existing[key]._loaded_values if key in existing else None, activity_snapshot(activity))
+            for activity in saved
+            for key in [(activity.user_id, activity.date)]
+        ])
+    return len(saved)
+
+
+def _process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class QuickEntryBuffer:
+    """Thread-safe map of (user_id, date) -> pending values, journaled and flushed in batches"""
+
+    def __init__(self, enabled=False, journal_dir=None, flush_interval=1.0, max_pending=200, fsync=True):
+        self.enabled = enabled
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started_pid = None
+        self._journal = None
+        self._pid = None
+        self._token = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self._metrics = {
+            'submissions': 0,
+            'coalesced': 0,
+            'replayed': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'quarantined': 0,
+            'rows_written': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': None,
+            'total_flush_ms': 0.0,
+            'last_flush_at': None,
+            'last_error': None,
+        }
+
+    # Journal files
+
+    def _path(self, kind):
+        return os.path.join(self.journal_dir, f'quick-entry-{self._pid}-{self._token}.{kind}')
+
+    def _append(self, records):
+        if self._journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._journal = open(self._path('journal'), 'a', encoding='utf-8')
+        self._journal.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _set_aside(self):
+        """Move the journal to the .flushing file, after any entries a failed flush left there"""
+        self._close_journal()
+        journal = self._path('journal')
+        flushing = self._path('flushing')
+        if not os.path.exists(journal):
+            return
+        if os.path.exists(flushing):
+            with open(journal, 'rb') as source, open(flushing, 'ab') as target:
+                target.write(source.read())
+                target.flush()
+                os.fsync(target.fileno())
+            os.remove(journal)
+        else:
+            os.replace(journal, flushing)
+
+    @staticmethod
+    def _read(path):
+        records = []
+        with open(path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                    records.append((record['user_id'], date.fromisoformat(record['date']), record['values']))
+                except (ValueError, KeyError, TypeError):
+                    # A line cut short by a crash
+                    continue
+        return records
+
+    def recover(self, include_running=False):
+        """
+        Take over the journals of processes that are no longer running (or
+        of every other process), adding their entries to this buffer.
+        Returns how many entries were replayed.
+        """
+        if not self.journal_dir or not os.path.isdir(self.journal_dir):
+            return 0
+        with self._lock:
+            self._ensure_process()
+            pid, token = str(self._pid), self._token
+        orphans = []
+        for name in os.listdir(self.journal_dir):
+            match = JOURNAL_NAME.match(name)
+            if not match:
+                continue
+            file_pid, file_token, kind, claim_pid, claim_token = match.groups()
+            owner = (claim_pid, claim_token) if claim_pid else (file_pid, file_token)
+            if owner == (pid, token):
+                continue
+            # Other files of this process's pid belong to a worker that had it before
+            if owner[0] != pid and not include_running and _process_running(int(owner[0])):
+                continue
+            try:
+                modified = os.path.getmtime(os.path.join(self.journal_dir, name))
+            except FileNotFoundError:
+                continue
+            base = f"quick-entry-{file_pid}{f'-{file_token}' if file_token else ''}.{kind}"
+            # Oldest first, and .flushing entries before the .journal ones of the same process
+            orphans.append((modified, kind == 'journal', name, base))
+
+        records = []
+        claimed = []
+        for _, _, name, base in sorted(orphans):
+            # Renaming claims the file, so two workers never replay the same one
+            claim = os.path.join(self.journal_dir, f'{base}.claimed-{pid}-{token}')
+            try:
+                os.rename(os.path.join(self.journal_dir, name), claim)
+            except FileNotFoundError:
+                continue
+            records.extend(self._read(claim))
+            claimed.append(claim)
+        if not records:
+            for claim in claimed:
+                os.remove(claim)
+            return 0
+
+        recovered = {}
+        for user_id, day, values in records:
+            recovered[(user_id, day)] = {**recovered.get((user_id, day), {}), **values}
+        with self._lock:
+            self._ensure_process()
+            for key, values in recovered.items():
+                # Anything already pending here is newer
+                self._pending[key] = {**values, **self._pending.get(key, {})}
+            # Journaled under this process before the claimed files go
+            self._append({'user_id': user_id, 'date': day.isoformat(), 'values': values} for user_id, day, values in records)
+            self._metrics['replayed'] += len(records)
+        for claim in claimed:
+            os.remove(claim)
+        return len(records)
+
+    # Submissions
+
+    def _ensure_process(self):
+        # Called with the lock held. A forked worker starts over with a journal of its own.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex[:12]
+            self._journal = None
+            self._thread = None
+
+    def _ensure_flusher(self):
+        if self.flush_interval is None:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='quick-entry-flusher', daemon=True)
+            self._thread.start()
+
+    def _start(self):
+        # First submission of this process: take over what crashed workers left behind first
+        with self._start_lock:
+            if self._started_pid != os.getpid():
+                self.recover()
+                if self._started_pid is None:
+                    atexit.register(self.stop)
+                self._started_pid = os.getpid()
+
+    def submit(self, user_id, day, values):
+        """Journal a validated submission and queue it; returns the merged pending values of the day"""
+        if self._started_pid != os.getpid():
+            self._start()
+        with self._lock:
+            self._ensure_process()
+            key = (user_id, day)
+            if key in self._pending:
+                self._metrics['coalesced'] += 1
+            self._append([{'user_id': user_id, 'date': day.isoformat(), 'values': values}])
+            merged = self._pending[key] = {**self._pending.get(key, {}), **values}
+            self._metrics['submissions'] += 1
+            full = len(self._pending) >= self.max_pending
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+        return dict(merged)
+
+    def pending(self, user_id, day):
+        """Values waiting to be written for a day, or None"""
+        with self._lock:
+            values = self._pending.get((user_id, day))
+            return dict(values) if values is not None else None
+
+    # Flushing
+
+    def flush(self):
+        """Write everything pending in one transaction; returns the rows written"""
+        with self._flush_lock:
+            with self._lock:
+                self._ensure_process()
+                batch = self._pending
+                if not batch:
+                    return 0
+                self._pending = {}
+                self._set_aside()
+
+            started = time.perf_counter()
+            retry = {}
+            try:
+                written = write_entries(batch)
+            except TRANSIENT_ERRORS as e:
+                written, retry, error = 0, batch, e
+            except Exception as e:
+                logger.warning("Quick-entry flush of %d entries failed, writing them one at a time", len(batch), exc_info=True)
+                written, retry, error = self._write_each(batch)
+
+            if retry:
+                with self._lock:
+                    # Submissions that arrived meanwhile are newer and win
+                    for key, values in retry.items():
+                        self._pending[key] = {**values, **self._pending.get(key, {})}
+                    self._metrics['failed_flushes'] += 1
+                    self._metrics['rows_written'] += written
+                    self._metrics['last_error'] = f'{type(error).__name__}: {error}'
+                logger.error("Quick-entry flush failed, %d entries will be retried: %s", len(retry), error)
+                return written
+
+            elapsed = (time.perf_counter() - started) * 1000
+            flushing = self._path('flushing')
+            if os.path.exists(flushing):
+                os.remove(flushing)
+            with self._lock:
+                metrics = self._metrics
+                metrics['flushes'] += 1
+                metrics['rows_written'] += written
+                metrics['last_batch_size'] = len(batch)
+                metrics['max_batch_size'] = max(metrics['max_batch_size'], len(batch))
+                metrics['last_flush_ms'] = round(elapsed, 3)
+                metrics['max_flush_ms'] = round(max(metrics['max_flush_ms'] or 0, elapsed), 3)
+                metrics['total_flush_ms'] += elapsed
+                metrics['last_flush_at'] = timezone.now().isoformat()
+            return written
+
+    def _write_each(self, batch):
+        """
+        Write the entries of a failed batch one at a time, quarantining those
+        that fail on their own. Returns (rows written, entries to retry, last
+        error); entries are only retried once the database itself fails.
+        """
+        written, error = 0, None
+        entries = list(batch.items())
+        for index, (key, values) in enumerate(entries):
+            try:
+                written += write_entries({key: values})
+            except TRANSIENT_ERRORS as e:
+                return written, dict(entries[index:]), e
+            except Exception as e:
+                self._quarantine(key, values, e)
+                error = e
+        return written, {}, error
+
+    def _quarantine(self, key, values, error):
+        """Set aside an entry that cannot be written, with its error, for an operator to look at"""
+        user_id, day = key
+        record = {
+            'user_id': user_id,
+            'date': day.isoformat(),
+            'values': values,
+            'error': f'{type(error).__name__}: {error}',
+            'quarantined_at': timezone.now().isoformat(),
+        }
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(os.path.join(self.journal_dir, QUARANTINE_NAME), 'a', encoding='utf-8') as quarantine:
+            quarantine.write(json.dumps(record, separators=(',', ':'), default=str) + '\n')
+            quarantine.flush()
+            if self.fsync:
+                os.fsync(quarantine.fileno())
+        with self._lock:
+            self._metrics['quarantined'] += 1
+            self._metrics['last_error'] = record['error']
+        logger.error("Quick entry of user %s on %s cannot be written, quarantined: %s", user_id, day, record['error'])
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # The thread's connection is not closed by any request cycle
+                close_old_connections()
+
+    def stop(self):
+        """Stop the flusher thread and write what is left"""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.flush_interval or 0, 1) * 5)
+        self._thread = None
+        self.flush()
+        with self._lock:
+            self._close_journal()
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            pending = len(self._pending)
+            journal = self._journal
+        flushes = metrics['flushes']
+        metrics['mean_flush_ms'] = round(metrics.pop('total_flush_ms') / flushes, 3) if flushes else None
+        journal_bytes = 0
+        if journal is not None:
+            try:
+                journal_bytes = os.path.getsize(journal.name)
+            except OSError:
+                pass
+        return {
+            'enabled': self.enabled,
+            'pending': pending,
+            'journal_bytes': journal_bytes,
+            'flush_interval_seconds': self.flush_interval,
+            'max_pending': self.max_pending,
+            **metrics,
+        }
+
+
+_buffer_settings = getattr(settings, 'QUICK_ENTRY_BUFFER', {})
+quick_entry_buffer = QuickEntryBuffer(
+    enabled=_buffer_settings.get('ENABLED', False),
+    journal_dir=str(_buffer_settings.get('JOURNAL_DIR', settings.BASE_DIR / 'quick_entry_journal')),
+    flush_interval=_buffer_settings.get('FLUSH_INTERVAL_SECONDS', 1.0),
+    max_pending=_buffer_settings.get('MAX_PENDING', 200),
+    fsync=_buffer_settings.get('FSYNC', True),
+)
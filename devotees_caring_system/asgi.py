@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'devotees_caring_system.settings')
+# Connections are not kept between requests, as any thread may serve one (see settings.DATABASES)
+os.environ.setdefault('DJANGO_SERVER_MODE', 'asgi')
 
 application = get_asgi_application()
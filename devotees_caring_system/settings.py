@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -82,13 +83,42 @@ WSGI_APPLICATION = 'devotees_caring_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# 'wsgi' or 'asgi', set by the entry point the server loads
+SERVER_MODE = os.environ.get('DJANGO_SERVER_MODE', 'wsgi')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep a thread's connection between requests under WSGI. Under ASGI a
+        # request may run on any thread and persistent connections pile up,
+        # so asgi.py sets DJANGO_SERVER_MODE=asgi and connections close after
+        # each request. DJANGO_CONN_MAX_AGE overrides either default.
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 0 if SERVER_MODE == 'asgi' else 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock at BEGIN, so transactions wait for each other instead of failing
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Run on every new SQLite connection (see devotee/sqlite.py). WAL lets readers
+# go on while one writer commits; busy_timeout is how long a writer waits.
+SQLITE_CONNECTION = {
+    'PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 134217728,
+        'cache_size': -20000,
+        'temp_store': 'MEMORY',
+    },
+    # Writes that still find the database locked are run again this many times
+    'LOCKED_RETRIES': 5,
+    'RETRY_BACKOFF_SECONDS': 0.05,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -134,6 +164,62 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Vite default port is 5173, but check your frontend dev server port
 FRONTEND_URL = 'http://localhost:5173'  # Change this to match your frontend URL/port
 
+# In-process cache of resolved QR tokens (per worker process)
+QR_TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL_SECONDS': 60,
+}
+
+# In-process cache of user rows behind token authentication (per worker
+# process, see authentication/token_auth.py)
+USER_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL_SECONDS': 60,
+}
+
+# Revoked refresh tokens, checked through a per-process Bloom filter that
+# follows the table every SYNC_SECONDS; rows of expired tokens are deleted by
+# the purge_revoked_tokens command, run from cron (see authentication/revocation.py)
+TOKEN_REVOCATION = {
+    'FILTER_CAPACITY': 100000,
+    'FILTER_ERROR_RATE': 0.001,
+    'SYNC_SECONDS': 1,
+}
+
+# Optional write buffer for QR quick-entry submissions (per worker process).
+# When enabled, submissions are acknowledged with 202 once journaled and
+# written in batches; journals left by crashed workers are replayed.
+QUICK_ENTRY_BUFFER = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_SECONDS': 1.0,
+    'MAX_PENDING': 200,
+    'JOURNAL_DIR': BASE_DIR / 'quick_entry_journal',
+    'FSYNC': True,
+}
+
+# Backend of the per-user response cache. LocMemCache is per worker process;
+# with several workers prefer a shared backend such as FileBasedCache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Cached JSON of the read-heavy per-user GET endpoints, invalidated by a
+# per-user data version that every write bumps.
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+# Streaks of consecutive days (see devotee/streaks.py). After changing a goal,
+# run rebuild_streaks.
+STREAKS = {
+    'MIN_CHANTING_ROUNDS': 16,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -143,7 +229,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
 
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authentication.token_auth.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.AllowAny",
@@ -157,6 +243,8 @@ from datetime import timedelta
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Each refresh replaces the refresh token (see authentication/revocation.py)
+    "ROTATE_REFRESH_TOKENS": True,
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 